@@ -776,11 +776,14 @@ def get_chat_messages(
     chat_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    newest: bool = Query(False),
     current_user: User = Depends(get_current_user_dependency),
     db: Session = Depends(get_database)
 ):
     """
     Hole alle Nachrichten eines Chats
+
+    Mit newest=true die neuesten ``limit`` Nachrichten, weiterhin chronologisch sortiert.
     """
     logger.debug("Fetching chat messages", chat_id=chat_id, user_id=current_user.id)
     
@@ -797,9 +800,12 @@ def get_chat_messages(
             detail="Chat not found"
         )
     
-    messages = db.query(Message).filter(
-        Message.chat_id == chat_id
-    ).order_by(Message.created_at.asc()).offset(skip).limit(limit).all()
+    query = db.query(Message).filter(Message.chat_id == chat_id)
+    if newest:
+        messages = query.order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
+        messages.reverse()
+    else:
+        messages = query.order_by(Message.created_at.asc()).offset(skip).limit(limit).all()
     
     logger.debug("Messages fetched", count=len(messages))
     return messages
@@ -39,6 +39,7 @@ interface SearchResult {
   id: string
   content: string
   score: number
+  rank_score?: number | null
   metadata: any
   document_title: string
 }
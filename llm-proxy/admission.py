@@ -0,0 +1,244 @@
+"""
+Ingress admission control and load shedding for llm-proxy
+
+Each route group has a concurrency limit, a bounded wait queue with a maximum
+queue wait and an event-loop-lag ceiling. Requests beyond those limits are
+rejected immediately with a small JSON body and Retry-After, before any
+provider work starts, so the service degrades gracefully under overload
+instead of letting every request time out.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from pydantic import BaseModel
+
+from logging_config import get_llm_logger
+
+logger = get_llm_logger()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_LAG_INTERVAL = float(os.getenv("ADMISSION_LAG_INTERVAL", "0.25"))
+
+admission_shed_total = Counter(
+    "llm_proxy_admission_shed_total",
+    "Requests rejected by admission control",
+    ["route", "reason"],
+)
+admission_in_flight = Gauge(
+    "llm_proxy_admission_in_flight",
+    "Requests currently admitted per route group",
+    ["route"],
+)
+admission_queue_wait = Histogram(
+    "llm_proxy_admission_queue_wait_seconds",
+    "Time admitted requests waited for a slot",
+    ["route"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+event_loop_lag = Gauge("llm_proxy_event_loop_lag_seconds", "Smoothed event loop lag")
+
+
+class RoutePolicy(BaseModel):
+    max_in_flight: int
+    max_queue: int
+    max_queue_wait: float  # seconds
+    max_loop_lag: float  # seconds
+    retry_after: int = 1
+    shed_status: int = 503
+
+
+# Route groups are matched by path prefix, longest prefix first
+DEFAULT_POLICIES: Dict[str, RoutePolicy] = {
+    "/chat/completions": RoutePolicy(max_in_flight=256, max_queue=128, max_queue_wait=2.0, max_loop_lag=0.5),
+    "/batches": RoutePolicy(max_in_flight=16, max_queue=16, max_queue_wait=5.0, max_loop_lag=1.0, retry_after=5),
+    "/tokens/count": RoutePolicy(max_in_flight=64, max_queue=64, max_queue_wait=0.5, max_loop_lag=0.25,
+                                 shed_status=429),
+}
+
+# Never shed probes and scrapes
+EXEMPT_PATHS = ("/health", "/metrics", "/")
+
+
+def load_policies() -> Dict[str, RoutePolicy]:
+    """
+    Default policies, overridden per route by ADMISSION_POLICIES (JSON), e.g.
+    ``{"/chat/completions": {"max_in_flight": 64, "max_queue_wait": 1.0}}``
+    """
+    policies = dict(DEFAULT_POLICIES)
+    overrides = os.getenv("ADMISSION_POLICIES")
+    if overrides:
+        for route, values in json.loads(overrides).items():
+            base = policies.get(route)
+            policies[route] = base.model_copy(update=values) if base else RoutePolicy(**values)
+    return policies
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed sleep"""
+
+    def __init__(self, interval: float = ADMISSION_LAG_INTERVAL):
+        self.interval = interval
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            # React to spikes at once, decay slowly
+            self.lag = lag if lag > self.lag else 0.8 * self.lag + 0.2 * lag
+            event_loop_lag.set(self.lag)
+
+
+class _RouteGate:
+    def __init__(self, route: str, policy: RoutePolicy):
+        self.route = route
+        self.policy = policy
+        self.in_flight = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(policy.max_in_flight)
+
+    async def acquire(self, loop_lag: float) -> Optional[str]:
+        """Admit the request or return the reason it is shed"""
+        if loop_lag > self.policy.max_loop_lag:
+            return "loop_lag"
+        if self._slots.locked():
+            if self.waiting >= self.policy.max_queue:
+                return "queue_full"
+            self.waiting += 1
+            started = time.monotonic()
+            acquired = False
+            # Not wait_for: on 3.11 it can drop a slot granted as the timeout fires
+            try:
+                async with asyncio.timeout(self.policy.max_queue_wait):
+                    await self._slots.acquire()
+                    acquired = True
+            except TimeoutError:
+                return "queue_timeout"
+            except BaseException:
+                # Cancelled (client gone) - hand back a slot that was already granted
+                if acquired:
+                    self._slots.release()
+                raise
+            finally:
+                self.waiting -= 1
+            admission_queue_wait.labels(route=self.route).observe(time.monotonic() - started)
+        else:
+            await self._slots.acquire()
+            admission_queue_wait.labels(route=self.route).observe(0.0)
+
+        self.in_flight += 1
+        admission_in_flight.labels(route=self.route).set(self.in_flight)
+        return None
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        admission_in_flight.labels(route=self.route).set(self.in_flight)
+        self._slots.release()
+
+
+class AdmissionController:
+    def __init__(self, policies: Optional[Dict[str, RoutePolicy]] = None):
+        self.policies = policies if policies is not None else load_policies()
+        self._routes = sorted(self.policies, key=len, reverse=True)
+        self._gates: Dict[str, _RouteGate] = {}
+        self.lag_monitor = LoopLagMonitor()
+
+    def gate_for(self, path: str) -> Optional[_RouteGate]:
+        if path in EXEMPT_PATHS:
+            return None
+        for route in self._routes:
+            if path.startswith(route):
+                gate = self._gates.get(route)
+                if gate is None:
+                    gate = self._gates[route] = _RouteGate(route, self.policies[route])
+                return gate
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "event_loop_lag": self.lag_monitor.lag,
+            "routes": {
+                route: {
+                    "in_flight": gate.in_flight,
+                    "waiting": gate.waiting,
+                    "max_in_flight": gate.policy.max_in_flight,
+                    "max_queue": gate.policy.max_queue,
+                }
+                for route, gate in self._gates.items()
+            },
+        }
+
+
+admission_controller = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware, so a streaming response keeps its slot until the
+    last chunk is sent
+    """
+
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        gate = self.controller.gate_for(scope["path"])
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        reason = await gate.acquire(self.controller.lag_monitor.lag)
+        if reason is not None:
+            await self._reject(gate, reason, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
+
+    async def _reject(self, gate: _RouteGate, reason: str, send) -> None:
+        admission_shed_total.labels(route=gate.route, reason=reason).inc()
+        logger.warning("Request shed", route=gate.route, reason=reason,
+                       in_flight=gate.in_flight, waiting=gate.waiting)
+        body = json.dumps({
+            "error": "Service overloaded",
+            "reason": reason,
+            "retry_after": gate.policy.retry_after,
+        }).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": gate.policy.shed_status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(gate.policy.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,510 @@
+"""
+Provider batch-API job subsystem for llm-proxy
+
+Bulk offline workloads are grouped per provider/model into provider batch
+jobs (OpenAI Batch API, Anthropic Message Batches), which run at a discount
+and under separate rate limits. A background poller submits pending groups,
+polls running ones and persists normalized results to disk, so jobs survive
+a restart and can be fetched by job id.
+
+Jobs belong to the caller that created them (a hash of its credentials);
+status and results are only served to the same caller.
+
+API keys sent with a job are kept in memory only. A job records which
+providers it was submitted with the caller's own key; if that key is gone
+after a restart, those provider batches fail rather than being billed to
+the service's environment key.
+"""
+import asyncio
+import hmac
+import json
+import os
+import uuid
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from pydantic import BaseModel, Field
+
+from logging_config import get_llm_logger
+
+logger = get_llm_logger()
+
+BATCH_STORAGE_DIR = os.getenv("BATCH_STORAGE_DIR", "/app/data/batches")
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "30"))
+BATCH_COST_FACTOR = float(os.getenv("BATCH_COST_FACTOR", "0.5"))
+BATCH_STANDIN_ENABLED = os.getenv("BATCH_STANDIN_ENABLED", "false").lower() == "true"
+
+OPENAI_BATCH_API_BASE = os.getenv("OPENAI_BATCH_API_BASE", "https://api.openai.com/v1")
+ANTHROPIC_BATCH_API_BASE = os.getenv("ANTHROPIC_BATCH_API_BASE", "https://api.anthropic.com/v1")
+
+BATCH_PROVIDERS = ("openai", "anthropic")
+
+# Records the usage of one generation: user_id, chat_id, provider, model, usage, cost
+UsageFn = Callable[[Optional[int], Optional[int], str, str, Dict[str, Any], float], Awaitable[None]]
+
+
+class BatchStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class ProviderBatch(BaseModel):
+    provider: str
+    model: str
+    custom_ids: List[str]
+    provider_batch_id: Optional[str] = None
+    status: str = "pending"  # pending, submitted, completed, failed
+    error: Optional[str] = None
+
+
+class BatchJob(BaseModel):
+    id: str
+    status: BatchStatus = BatchStatus.QUEUED
+    created_at: datetime
+    updated_at: datetime
+    request_count: int
+    completed_count: int = 0
+    failed_count: int = 0
+    total_cost: float = 0.0
+    batches: List[ProviderBatch]
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    caller_key_providers: List[str] = Field(default_factory=list)
+    owner: str = ""  # credentials hash of the creating caller; not part of API responses
+    error: Optional[str] = None
+
+
+def build_openai_body(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "model": item["model"],
+        "messages": item["messages"],
+        "temperature": item["temperature"],
+        "max_tokens": item["max_tokens"],
+    }
+
+
+def build_anthropic_params(item: Dict[str, Any]) -> Dict[str, Any]:
+    system = [m["content"] for m in item["messages"] if m["role"] == "system"]
+    params = {
+        "model": item["model"],
+        "max_tokens": item["max_tokens"],
+        "temperature": item["temperature"],
+        "messages": [m for m in item["messages"] if m["role"] != "system"],
+    }
+    if system:
+        params["system"] = system[-1]
+    return params
+
+
+class BatchManager:
+    """Owns batch jobs: persistence, provider submission and background polling"""
+
+    def __init__(
+        self,
+        cost_fn: Callable[[str, int, int], float],
+        usage_fn: UsageFn,
+        storage_dir: str = BATCH_STORAGE_DIR,
+        poll_interval: float = BATCH_POLL_INTERVAL,
+    ):
+        self.cost_fn = cost_fn
+        self.usage_fn = usage_fn
+        self.storage_dir = Path(storage_dir)
+        self.poll_interval = poll_interval
+        self.jobs: Dict[str, BatchJob] = {}
+        self._api_keys: Dict[str, Dict[str, str]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.openai_base = OPENAI_BATCH_API_BASE
+        self.anthropic_base = ANTHROPIC_BATCH_API_BASE
+
+    # ---------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("BatchManager is not started")
+        return self._client
+
+    async def start(self) -> None:
+        if BATCH_STANDIN_ENABLED:
+            from batch_standin import standin_app, STANDIN_BASE_URL
+
+            self._client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=standin_app),  # type: ignore[arg-type]  # httpx's narrower ASGI type
+                timeout=60.0
+            )
+            self.openai_base = f"{STANDIN_BASE_URL}/v1"
+            self.anthropic_base = f"{STANDIN_BASE_URL}/v1"
+            logger.warning("Batch API stand-in enabled - no provider calls will be made")
+        else:
+            self._client = httpx.AsyncClient(timeout=120.0)
+
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self._load_jobs()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._client is not None:
+            await self.client.aclose()
+
+    def _load_jobs(self) -> None:
+        """Reload persisted jobs; unfinished ones are resumed by the poller"""
+        for job_file in self.storage_dir.glob("*/job.json"):
+            try:
+                job = BatchJob.model_validate_json(job_file.read_text())
+                self.jobs[job.id] = job
+            except Exception as e:
+                logger.error("Failed to load batch job", path=str(job_file), error=str(e))
+        active = [j for j in self.jobs.values() if j.status in (BatchStatus.QUEUED, BatchStatus.RUNNING)]
+        logger.info("Batch jobs loaded", total=len(self.jobs), resumed=len(active))
+
+    # ---------------------------------------------------
+    # Persistence
+    # ---------------------------------------------------
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self.storage_dir / job_id
+
+    def _save_job(self, job: BatchJob) -> None:
+        job.updated_at = datetime.utcnow()
+        path = self._job_dir(job.id) / "job.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(job.model_dump_json(indent=2))
+        tmp_path.replace(path)
+
+    def _load_requests(self, job_id: str) -> Dict[str, Dict[str, Any]]:
+        items = {}
+        with open(self._job_dir(job_id) / "requests.jsonl", "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                items[item["custom_id"]] = item
+        return items
+
+    def _write_results(self, job_id: str, batch: ProviderBatch, results: List[Dict[str, Any]]) -> None:
+        """
+        Replace the results file of a provider batch in one step. A poll
+        repeated after a crash (results written, job state not yet saved)
+        rewrites the same file instead of adding the results twice.
+        """
+        path = self._job_dir(job_id) / f"results-{batch.provider_batch_id}.jsonl"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+        tmp_path.replace(path)
+
+    def read_results(self, job_id: str) -> List[Dict[str, Any]]:
+        # One result per custom_id, also for jobs written by older versions (results.jsonl)
+        results: Dict[str, Dict[str, Any]] = {}
+        for path in sorted(self._job_dir(job_id).glob("results*.jsonl")):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        results[result["custom_id"]] = result
+        return sorted(results.values(), key=lambda r: r.get("index", 0))
+
+    # ---------------------------------------------------
+    # Public API
+    # ---------------------------------------------------
+
+    def create_job(
+        self,
+        items: List[Dict[str, Any]],
+        api_keys: Dict[str, str],
+        owner: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> BatchJob:
+        """
+        Create a job from normalized request items. Each item carries
+        ``custom_id``, ``index``, ``provider``, ``model``, ``messages``,
+        ``temperature`` and ``max_tokens``. ``api_keys`` holds the keys the
+        caller supplied per provider; other providers use the environment key.
+        ``owner`` identifies the caller allowed to read the job.
+        """
+        groups: Dict[tuple, List[str]] = {}
+        for item in items:
+            groups.setdefault((item["provider"], item["model"]), []).append(item["custom_id"])
+
+        now = datetime.utcnow()
+        job = BatchJob(
+            id=f"batch-{uuid.uuid4().hex}",
+            created_at=now,
+            updated_at=now,
+            request_count=len(items),
+            batches=[
+                ProviderBatch(provider=provider, model=model, custom_ids=custom_ids)
+                for (provider, model), custom_ids in groups.items()
+            ],
+            metadata=metadata or {},
+            caller_key_providers=sorted(api_keys),
+            owner=owner,
+        )
+
+        job_dir = self._job_dir(job.id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        with open(job_dir / "requests.jsonl", "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+        self._save_job(job)
+
+        self.jobs[job.id] = job
+        self._api_keys[job.id] = api_keys
+        self._wakeup.set()
+
+        logger.info("Batch job created", job_id=job.id, requests=len(items), provider_batches=len(job.batches))
+        return job
+
+    def get_job(self, job_id: str, owner: str) -> Optional[BatchJob]:
+        """The job, if it exists and belongs to ``owner``"""
+        job = self.jobs.get(job_id)
+        if job is None or not hmac.compare_digest(job.owner, owner):
+            return None
+        return job
+
+    # ---------------------------------------------------
+    # Background processing
+    # ---------------------------------------------------
+
+    async def _run(self) -> None:
+        while True:
+            for job in list(self.jobs.values()):
+                if job.status in (BatchStatus.QUEUED, BatchStatus.RUNNING):
+                    try:
+                        await self._advance(job)
+                    except Exception as e:
+                        logger.error("Batch job poll failed", job_id=job.id, error=str(e))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _api_key(self, job: BatchJob, provider: str) -> str:
+        if provider in job.caller_key_providers:
+            key = self._api_keys.get(job.id, {}).get(provider)
+            if not key:
+                # Lost with a restart - never switch the job to the service's account
+                raise ValueError(f"API key supplied for {provider} is no longer available, resubmit the job")
+            return key
+        key = os.getenv(f"{provider.upper()}_API_KEY")
+        if not key:
+            raise ValueError(f"No API key available for {provider}")
+        return key
+
+    async def _advance(self, job: BatchJob) -> None:
+        requests = None
+        for batch in job.batches:
+            if batch.status in ("completed", "failed"):
+                continue
+            try:
+                if batch.status == "pending":
+                    if requests is None:
+                        requests = self._load_requests(job.id)
+                    await self._submit(job, batch, [requests[c] for c in batch.custom_ids])
+                elif batch.status == "submitted":
+                    await self._poll(job, batch)
+            except httpx.TransportError as e:
+                # Network trouble - keep the batch state and retry on the next round
+                logger.warning("Provider batch unreachable", job_id=job.id, provider=batch.provider, error=str(e))
+            except Exception as e:
+                batch.status = "failed"
+                batch.error = str(e)
+                job.failed_count += len(batch.custom_ids)
+                logger.error("Provider batch failed", job_id=job.id, provider=batch.provider, error=str(e))
+
+        statuses = {batch.status for batch in job.batches}
+        if statuses <= {"completed", "failed"}:
+            job.status = BatchStatus.COMPLETED if "completed" in statuses else BatchStatus.FAILED
+            logger.info("Batch job finished", job_id=job.id, status=job.status.value,
+                        completed=job.completed_count, failed=job.failed_count, cost=job.total_cost)
+        else:
+            job.status = BatchStatus.RUNNING
+        self._save_job(job)
+
+    async def _submit(self, job: BatchJob, batch: ProviderBatch, items: List[Dict[str, Any]]) -> None:
+        api_key = self._api_key(job, batch.provider)
+
+        if batch.provider == "openai":
+            lines = [
+                json.dumps({
+                    "custom_id": item["custom_id"],
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": build_openai_body(item),
+                })
+                for item in items
+            ]
+            headers = {"Authorization": f"Bearer {api_key}"}
+            upload = await self.client.post(
+                f"{self.openai_base}/files",
+                headers=headers,
+                data={"purpose": "batch"},
+                files={"file": (f"{job.id}.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")},
+            )
+            upload.raise_for_status()
+            response = await self.client.post(
+                f"{self.openai_base}/batches",
+                headers=headers,
+                json={
+                    "input_file_id": upload.json()["id"],
+                    "endpoint": "/v1/chat/completions",
+                    "completion_window": "24h",
+                    "metadata": {"job_id": job.id},
+                },
+            )
+        elif batch.provider == "anthropic":
+            response = await self.client.post(
+                f"{self.anthropic_base}/messages/batches",
+                headers=self._anthropic_headers(api_key),
+                json={
+                    "requests": [
+                        {"custom_id": item["custom_id"], "params": build_anthropic_params(item)}
+                        for item in items
+                    ]
+                },
+            )
+        else:
+            raise ValueError(f"Batch API not supported for provider {batch.provider}")
+
+        response.raise_for_status()
+        batch.provider_batch_id = response.json()["id"]
+        batch.status = "submitted"
+        logger.info("Provider batch submitted", job_id=job.id, provider=batch.provider,
+                    provider_batch_id=batch.provider_batch_id, requests=len(items))
+
+    @staticmethod
+    def _anthropic_headers(api_key: str) -> Dict[str, str]:
+        return {
+            "x-api-key": api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json",
+        }
+
+    async def _poll(self, job: BatchJob, batch: ProviderBatch) -> None:
+        api_key = self._api_key(job, batch.provider)
+
+        if batch.provider == "openai":
+            headers = {"Authorization": f"Bearer {api_key}"}
+            response = await self.client.get(f"{self.openai_base}/batches/{batch.provider_batch_id}", headers=headers)
+            response.raise_for_status()
+            data = response.json()
+            if data["status"] in ("failed", "expired", "cancelled"):
+                raise RuntimeError(f"OpenAI batch {data['status']}")
+            if data["status"] != "completed":
+                return
+            lines: List[str] = []
+            for file_key in ("output_file_id", "error_file_id"):
+                if data.get(file_key):
+                    content = await self.client.get(
+                        f"{self.openai_base}/files/{data[file_key]}/content", headers=headers
+                    )
+                    content.raise_for_status()
+                    lines.extend(line for line in content.text.splitlines() if line.strip())
+            results = [self._normalize_openai(json.loads(line), batch) for line in lines]
+
+        else:
+            headers = self._anthropic_headers(api_key)
+            response = await self.client.get(
+                f"{self.anthropic_base}/messages/batches/{batch.provider_batch_id}", headers=headers
+            )
+            response.raise_for_status()
+            data = response.json()
+            if data["processing_status"] != "ended":
+                return
+            content = await self.client.get(data["results_url"], headers=headers)
+            content.raise_for_status()
+            results = [
+                self._normalize_anthropic(json.loads(line), batch)
+                for line in content.text.splitlines()
+                if line.strip()
+            ]
+
+        index_by_id = {custom_id: int(custom_id.rsplit("-", 1)[-1]) for custom_id in batch.custom_ids}
+        for result in results:
+            result["index"] = index_by_id.get(result["custom_id"], 0)
+        self._write_results(job.id, batch, results)
+        await self._log_usage(job, batch, results)
+
+        succeeded = [r for r in results if r["status"] == "succeeded"]
+        job.completed_count += len(succeeded)
+        job.failed_count += len(batch.custom_ids) - len(succeeded)
+        job.total_cost += sum(r["response"]["cost"] for r in succeeded)
+        batch.status = "completed"
+
+    async def _log_usage(self, job: BatchJob, batch: ProviderBatch, results: List[Dict[str, Any]]) -> None:
+        """Record the usage of every succeeded request, like synchronous completions"""
+        items = self._load_requests(job.id)
+        for result in results:
+            if result["status"] != "succeeded":
+                continue
+            item = items.get(result["custom_id"], {})
+            response = result["response"]
+            await self.usage_fn(item.get("user_id"), item.get("chat_id"), batch.provider, batch.model,
+                                response["usage"], response["cost"])
+
+    def _priced(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        return self.cost_fn(model, input_tokens, output_tokens) * BATCH_COST_FACTOR
+
+    def _normalize_openai(self, line: Dict[str, Any], batch: ProviderBatch) -> Dict[str, Any]:
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or body.get("error") or "unknown error"
+            return {"custom_id": line["custom_id"], "status": "failed", "error": error}
+        usage = body.get("usage", {})
+        return {
+            "custom_id": line["custom_id"],
+            "status": "succeeded",
+            "response": {
+                "id": body.get("id"),
+                "model": batch.model,
+                "provider": batch.provider,
+                "choices": body.get("choices", []),
+                "usage": usage,
+                "cost": self._priced(batch.model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)),
+            },
+        }
+
+    def _normalize_anthropic(self, line: Dict[str, Any], batch: ProviderBatch) -> Dict[str, Any]:
+        result = line.get("result") or {}
+        if result.get("type") != "succeeded":
+            return {"custom_id": line["custom_id"], "status": "failed", "error": result.get("error") or result.get("type")}
+        message = result["message"]
+        usage = message.get("usage", {})
+        input_tokens = usage.get("input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        text = "".join(part.get("text", "") for part in message.get("content", []))
+        return {
+            "custom_id": line["custom_id"],
+            "status": "succeeded",
+            "response": {
+                "id": message.get("id"),
+                "model": batch.model,
+                "provider": batch.provider,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": message.get("stop_reason", "stop"),
+                }],
+                "usage": {
+                    "prompt_tokens": input_tokens,
+                    "completion_tokens": output_tokens,
+                    "total_tokens": input_tokens + output_tokens,
+                },
+                "cost": self._priced(batch.model, input_tokens, output_tokens),
+            },
+        }
@@ -0,0 +1,161 @@
+"""
+Local stand-in for the OpenAI and Anthropic batch endpoints
+
+Enabled with BATCH_STANDIN_ENABLED=true. The batch manager then talks to this
+app in-process (httpx ASGI transport), so the /batches subsystem can be
+exercised offline without API keys or provider costs. Batches finish after
+BATCH_STANDIN_DELAY seconds and echo the last user message.
+"""
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+
+STANDIN_BASE_URL = "http://batch-standin"
+BATCH_STANDIN_DELAY = float(os.getenv("BATCH_STANDIN_DELAY", "2"))
+
+standin_app = FastAPI(title="Batch API Stand-in")
+
+_files: Dict[str, str] = {}
+_batches: Dict[str, Dict[str, Any]] = {}
+
+
+def _echo(messages: List[Dict[str, str]]) -> str:
+    user_messages = [m["content"] for m in messages if m["role"] == "user"]
+    return f"[standin] {user_messages[-1] if user_messages else ''}"
+
+
+def _usage(messages: List[Dict[str, str]], text: str) -> Dict[str, int]:
+    prompt_tokens = sum(len(m["content"].split()) for m in messages)
+    completion_tokens = len(text.split())
+    return {"prompt": prompt_tokens, "completion": completion_tokens}
+
+
+# ===================================================
+# OPENAI BATCH API
+# ===================================================
+
+@standin_app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    file_id = f"file-{uuid.uuid4().hex}"
+    _files[file_id] = (await file.read()).decode("utf-8")
+    return {"id": file_id, "object": "file", "purpose": purpose}
+
+
+@standin_app.get("/v1/files/{file_id}/content", response_class=PlainTextResponse)
+async def file_content(file_id: str):
+    if file_id not in _files:
+        raise HTTPException(status_code=404, detail="File not found")
+    return _files[file_id]
+
+
+@standin_app.post("/v1/batches")
+async def create_openai_batch(payload: Dict[str, Any]):
+    if payload["input_file_id"] not in _files:
+        raise HTTPException(status_code=400, detail="Unknown input_file_id")
+
+    output_lines = []
+    for line in _files[payload["input_file_id"]].splitlines():
+        request = json.loads(line)
+        messages = request["body"]["messages"]
+        text = _echo(messages)
+        usage = _usage(messages, text)
+        output_lines.append(json.dumps({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request["body"]["model"],
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": usage["prompt"],
+                        "completion_tokens": usage["completion"],
+                        "total_tokens": usage["prompt"] + usage["completion"],
+                    },
+                },
+            },
+            "error": None,
+        }))
+
+    output_file_id = f"file-{uuid.uuid4().hex}"
+    _files[output_file_id] = "\n".join(output_lines)
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    _batches[batch_id] = {"ready_at": time.time() + BATCH_STANDIN_DELAY, "output_file_id": output_file_id}
+    return {"id": batch_id, "object": "batch", "status": "validating"}
+
+
+@standin_app.get("/v1/batches/{batch_id}")
+async def get_openai_batch(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if time.time() < batch["ready_at"]:
+        return {"id": batch_id, "object": "batch", "status": "in_progress"}
+    return {"id": batch_id, "object": "batch", "status": "completed", "output_file_id": batch["output_file_id"]}
+
+
+# ===================================================
+# ANTHROPIC MESSAGE BATCHES API
+# ===================================================
+
+@standin_app.post("/v1/messages/batches")
+async def create_anthropic_batch(payload: Dict[str, Any]):
+    results = []
+    for request in payload["requests"]:
+        messages = request["params"]["messages"]
+        text = _echo(messages)
+        usage = _usage(messages, text)
+        results.append(json.dumps({
+            "custom_id": request["custom_id"],
+            "result": {
+                "type": "succeeded",
+                "message": {
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": request["params"]["model"],
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": "end_turn",
+                    "usage": {"input_tokens": usage["prompt"], "output_tokens": usage["completion"]},
+                },
+            },
+        }))
+
+    batch_id = f"msgbatch_{uuid.uuid4().hex}"
+    _batches[batch_id] = {"ready_at": time.time() + BATCH_STANDIN_DELAY, "results": "\n".join(results)}
+    return {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"}
+
+
+@standin_app.get("/v1/messages/batches/{batch_id}")
+async def get_anthropic_batch(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if time.time() < batch["ready_at"]:
+        return {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"}
+    return {
+        "id": batch_id,
+        "type": "message_batch",
+        "processing_status": "ended",
+        "results_url": f"{STANDIN_BASE_URL}/v1/messages/batches/{batch_id}/results",
+    }
+
+
+@standin_app.get("/v1/messages/batches/{batch_id}/results", response_class=PlainTextResponse)
+async def get_anthropic_batch_results(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None or "results" not in batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch["results"]
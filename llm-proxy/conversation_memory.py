@@ -0,0 +1,181 @@
+"""
+Rolling conversation summarization for llm-proxy (history_mode=summary)
+
+Once the un-summarized part of a chat passes MEMORY_SUMMARY_THRESHOLD tokens,
+older turns are compacted into a running summary by a cheap model. The
+summary is cached per caller and chat_id (like the history) and later turns send summary plus the recent
+turns only, so the prompt size per turn stays bounded. Compaction runs after
+a turn has been answered, off the request's critical path.
+
+The summarized part of a chat is anchored to a fingerprint of its last
+messages rather than a list position, since the cached history can be
+trimmed or re-warmed with a different window.
+"""
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from conversation_store import ConversationKey
+from logging_config import get_llm_logger
+from token_counter import token_counter
+
+logger = get_llm_logger()
+
+MEMORY_SUMMARY_THRESHOLD = int(os.getenv("MEMORY_SUMMARY_THRESHOLD", "6000"))
+MEMORY_RECENT_TOKENS = int(os.getenv("MEMORY_RECENT_TOKENS", "2000"))
+MEMORY_SUMMARY_MODEL = os.getenv("MEMORY_SUMMARY_MODEL", "gpt-3.5-turbo")
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "512"))
+MEMORY_CACHE_SIZE = int(os.getenv("MEMORY_CACHE_SIZE", "2000"))
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the running memory of a conversation. Merge the previous "
+    "summary and the new messages into one concise summary. Keep facts, "
+    "decisions, names, numbers, code identifiers and open questions; drop "
+    "small talk. Answer with the summary only."
+)
+
+SummarizeFn = Callable[[int, List[Dict[str, str]]], Awaitable[str]]
+
+ANCHOR_MESSAGES = 3  # messages fingerprinted to find the end of the summarized part
+
+
+def fingerprint(messages: List[Dict[str, str]]) -> str:
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_summary_messages(previous_summary: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in messages)
+    prompt = f"Previous summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+        {"role": "user", "content": prompt},
+    ]
+
+
+class _ChatMemory:
+    def __init__(self):
+        self.summary = ""
+        self.covered = 0  # dialogue (non-system) messages folded into the summary, as last seen
+        self.anchor = ""  # fingerprint of the last anchor_size summarized messages
+        self.anchor_size = 0
+        self.lock = asyncio.Lock()
+
+    def covered_in(self, dialogue: List[Dict[str, str]]) -> int:
+        """Number of leading ``dialogue`` messages the summary covers, located by the anchor"""
+        if not self.summary:
+            return 0
+        size = self.anchor_size
+        end = self.covered
+        if size <= end <= len(dialogue) and fingerprint(dialogue[end - size:end]) == self.anchor:
+            return end
+        # The history window moved (trimmed or re-warmed) - find the anchor, newest first
+        for end in range(len(dialogue), size - 1, -1):
+            if fingerprint(dialogue[end - size:end]) == self.anchor:
+                self.covered = end
+                return end
+        # Summarized turns are gone from the history - start over rather than skip or repeat turns
+        self.summary, self.covered, self.anchor, self.anchor_size = "", 0, "", 0
+        return 0
+
+    def advance(self, summary: str, dialogue: List[Dict[str, str]], cut: int) -> None:
+        self.summary = summary
+        self.covered = cut
+        self.anchor_size = min(ANCHOR_MESSAGES, cut)
+        self.anchor = fingerprint(dialogue[cut - self.anchor_size:cut])
+
+
+class ConversationMemory:
+    def __init__(self, summarize_fn: SummarizeFn, max_chats: int = MEMORY_CACHE_SIZE):
+        self.summarize_fn = summarize_fn
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[ConversationKey, _ChatMemory]" = OrderedDict()
+        self.compactions = 0
+
+    def _get(self, key: ConversationKey) -> _ChatMemory:
+        memory = self._chats.get(key)
+        if memory is None:
+            memory = self._chats[key] = _ChatMemory()
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        self._chats.move_to_end(key)
+        return memory
+
+    def build_prompt(
+        self, key: ConversationKey, history: List[Dict[str, str]], turn: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """System messages + running summary + un-summarized history + new turn"""
+        memory = self._get(key)
+        system = [m for m in history if m["role"] == "system"]
+        dialogue = [m for m in history if m["role"] != "system"]
+        covered = memory.covered_in(dialogue)
+
+        prompt = list(system)
+        if memory.summary:
+            prompt.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{memory.summary}",
+            })
+        return prompt + dialogue[covered:] + turn
+
+    async def maybe_compact(self, key: ConversationKey, history: Optional[List[Dict[str, str]]], model: str) -> None:
+        """Fold older turns into the summary once the live part exceeds the threshold"""
+        if not history:
+            return
+        chat_id = key[1]
+        memory = self._get(key)
+        if memory.lock.locked():
+            return  # compaction for this chat already running
+
+        async with memory.lock:
+            dialogue = [m for m in history if m["role"] != "system"]
+            covered = memory.covered_in(dialogue)
+            live = dialogue[covered:]
+            live_tokens = token_counter.count(memory.summary, model) + token_counter.count_messages(
+                (m["content"] for m in live), model
+            )
+            if live_tokens <= MEMORY_SUMMARY_THRESHOLD:
+                return
+
+            # Keep the most recent turns verbatim
+            cut = len(dialogue)
+            recent_tokens = 0
+            while cut > covered:
+                tokens = token_counter.count(dialogue[cut - 1]["content"], model)
+                if recent_tokens + tokens > MEMORY_RECENT_TOKENS:
+                    break
+                recent_tokens += tokens
+                cut -= 1
+            to_summarize = dialogue[covered:cut]
+            if not to_summarize:
+                return
+
+            try:
+                summary = await self.summarize_fn(
+                    chat_id, build_summary_messages(memory.summary, to_summarize)
+                )
+            except Exception as e:
+                # Retried after the next turn; the token window still bounds the prompt
+                logger.warning("Conversation compaction failed", chat_id=chat_id, error=str(e))
+                return
+
+            memory.advance(summary.strip(), dialogue, cut)
+            self.compactions += 1
+            logger.info("Conversation compacted",
+                        chat_id=chat_id,
+                        summarized_messages=len(to_summarize),
+                        covered=cut,
+                        live_tokens_before=live_tokens,
+                        summary_tokens=token_counter.count(memory.summary, model))
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._chats),
+            "compactions": self.compactions,
+            "threshold": MEMORY_SUMMARY_THRESHOLD,
+            "summary_model": MEMORY_SUMMARY_MODEL,
+        }
@@ -0,0 +1,184 @@
+"""
+Server-side conversation history for llm-proxy
+
+Clients in server-history mode send only ``chat_id`` plus the new turn. The
+history is kept in a per-chat cache that is warmed from backend-core's
+``messages`` table on first use and extended with every completed turn.
+Like a warm-up, a cached history keeps at most the newest
+CONVERSATION_WARM_LIMIT messages.
+
+Entries are keyed by the caller's credentials as well as the chat: a history
+is only ever warmed with the caller's own Authorization header, which
+backend-core checks for chat ownership, so a caller can neither read nor
+extend a history cached for somebody else.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from logging_config import get_llm_logger
+from token_counter import token_counter
+
+logger = get_llm_logger()
+
+BACKEND_CORE_URL = os.getenv("BACKEND_CORE_URL", "http://backend-core:8080")
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "2000"))
+CONVERSATION_CACHE_TTL = int(os.getenv("CONVERSATION_CACHE_TTL", "1800"))
+CONVERSATION_WARM_LIMIT = int(os.getenv("CONVERSATION_WARM_LIMIT", "1000"))
+
+# (hash of the caller's Authorization header, chat_id)
+ConversationKey = Tuple[str, int]
+
+
+def conversation_key(chat_id: int, authorization: Optional[str]) -> ConversationKey:
+    owner = hashlib.sha256(authorization.encode("utf-8")).hexdigest() if authorization else ""
+    return owner, chat_id
+
+
+class _Conversation:
+    def __init__(self, messages: List[Dict[str, str]]):
+        self.messages = messages
+        self.touched_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+
+class ConversationCache:
+    """LRU cache of chat histories keyed by caller and chat_id"""
+
+    def __init__(
+        self,
+        backend_url: str = BACKEND_CORE_URL,
+        max_chats: int = CONVERSATION_CACHE_SIZE,
+        ttl: int = CONVERSATION_CACHE_TTL,
+    ):
+        self.backend_url = backend_url.rstrip("/")
+        self.max_chats = max_chats
+        self.ttl = ttl
+        self._chats: "OrderedDict[ConversationKey, _Conversation]" = OrderedDict()
+        self._warm_locks: Dict[ConversationKey, asyncio.Lock] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10.0)
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _lookup(self, key: ConversationKey) -> Optional[_Conversation]:
+        conversation = self._chats.get(key)
+        if conversation is None:
+            return None
+        if time.monotonic() - conversation.touched_at > self.ttl:
+            del self._chats[key]
+            return None
+        self._chats.move_to_end(key)
+        return conversation
+
+    def _store(self, key: ConversationKey, conversation: _Conversation) -> None:
+        self._chats[key] = conversation
+        self._chats.move_to_end(key)
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+
+    async def _fetch_from_backend(self, chat_id: int, authorization: str) -> List[Dict[str, str]]:
+        # The newest messages, oldest first - long chats drop their beginning, not the recent turns
+        response = await self._get_client().get(
+            f"{self.backend_url}/api/v1/chats/{chat_id}/messages",
+            params={"limit": CONVERSATION_WARM_LIMIT, "newest": "true"},
+            headers={"Authorization": authorization},
+        )
+        response.raise_for_status()
+        return [
+            {"role": message["role"], "content": message["content"]}
+            for message in response.json()
+        ]
+
+    async def get_history(self, key: ConversationKey, authorization: Optional[str]) -> List[Dict[str, str]]:
+        """
+        Return the cached history of a chat, warming it from backend-core with
+        the caller's credentials if needed. Callers backend-core doesn't
+        accept as the chat's owner get an empty history, which isn't cached.
+        """
+        chat_id = key[1]
+        if not authorization:
+            logger.warning("Conversation history requires an Authorization header", chat_id=chat_id)
+            return []
+
+        conversation = self._lookup(key)
+        if conversation is not None:
+            return list(conversation.messages)
+
+        lock = self._warm_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            conversation = self._lookup(key)
+            if conversation is None:
+                try:
+                    messages = await self._fetch_from_backend(chat_id, authorization)
+                except httpx.HTTPError as e:
+                    # Don't cache the gap - the next turn retries the warm-up
+                    logger.warning("Conversation warm-up failed", chat_id=chat_id, error=str(e))
+                    self._warm_locks.pop(key, None)
+                    return []
+                conversation = _Conversation(messages)
+                self._store(key, conversation)
+                logger.info("Conversation cache warmed", chat_id=chat_id, messages=len(messages))
+        self._warm_locks.pop(key, None)
+        return list(conversation.messages)
+
+    def peek(self, key: ConversationKey) -> Optional[List[Dict[str, str]]]:
+        """Cached history without warming, or None"""
+        conversation = self._lookup(key)
+        return list(conversation.messages) if conversation is not None else None
+
+    async def append(self, key: ConversationKey, messages: List[Dict[str, str]]) -> None:
+        """Append messages of a completed turn to a cached chat"""
+        conversation = self._lookup(key)
+        if conversation is None:
+            # Not cached (evicted or never warmed) - the next turn warms from backend-core
+            return
+        async with conversation.lock:
+            conversation.messages.extend(messages)
+            # Older turns are in backend-core (and, in summary mode, in the summary)
+            del conversation.messages[:-CONVERSATION_WARM_LIMIT]
+            conversation.touched_at = time.monotonic()
+
+    def invalidate(self, key: ConversationKey) -> None:
+        self._chats.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"chats": len(self._chats), "max_chats": self.max_chats, "ttl": self.ttl}
+
+
+def window_messages(messages: List[Dict[str, str]], model: str, token_budget: int) -> List[Dict[str, str]]:
+    """
+    Select the most recent messages that fit into ``token_budget``.
+
+    System messages are always kept. The newest message is always kept even if
+    it alone exceeds the budget, so the current turn is never dropped.
+    """
+    system_messages = [m for m in messages if m["role"] == "system"]
+    dialogue = [m for m in messages if m["role"] != "system"]
+
+    used = token_counter.count_messages((m["content"] for m in system_messages), model)
+    selected: List[Dict[str, str]] = []
+    for message in reversed(dialogue):
+        tokens = token_counter.count(message["content"], model)
+        if selected and used + tokens > token_budget:
+            break
+        selected.append(message)
+        used += tokens
+
+    selected.reverse()
+    return system_messages + selected
+
+
+conversation_cache = ConversationCache()
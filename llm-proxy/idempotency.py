@@ -0,0 +1,245 @@
+"""
+Idempotency-Key support for llm-proxy
+
+The first request with a given key owns the generation. Its result (or, for
+streams, the recorded chunks) is kept for IDEMPOTENCY_TTL seconds. Duplicates
+with the same key get the stored response, or attach to the running
+generation and follow it live, instead of calling the provider again.
+Keys are scoped to the caller's credentials, so one client can't block,
+or read the responses stored under, another client's key.
+
+Streams are produced by a background task that feeds a recording, so a
+client that disconnects and retries re-attaches to the same generation.
+Completed results are stored in memory and, when IDEMPOTENCY_REDIS_URL is
+set and the ``redis`` package is available, in Redis as well so duplicates
+hitting another instance are served too.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+from logging_config import get_llm_logger
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+aioredis: Optional[ModuleType]
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional dependency
+    aioredis = None
+
+logger = get_llm_logger()
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_REDIS_URL = os.getenv("IDEMPOTENCY_REDIS_URL", "")
+IDEMPOTENCY_REMOTE_WAIT = float(os.getenv("IDEMPOTENCY_REMOTE_WAIT", "30"))
+
+_REDIS_PREFIX = "llm-proxy:idempotency:"
+
+
+class IdempotencyConflict(Exception):
+    """Key reused with a different request body"""
+
+
+class IdempotencyInProgress(Exception):
+    """Another instance is still running the request for this key"""
+
+
+class GenerationFailed(Exception):
+    """The owning request failed; duplicates must retry"""
+
+
+def request_fingerprint(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def credentials_scope(credentials: Iterable[str]) -> str:
+    """Hash identifying a caller by the credentials it sent"""
+    return hashlib.sha256("\n".join(credentials).encode("utf-8")).hexdigest()[:32]
+
+
+def scoped_idempotency_key(key: str, credentials: Iterable[str]) -> str:
+    """Idempotency key namespaced by a hash of the caller's credentials"""
+    return f"{credentials_scope(credentials)}:{key}"
+
+
+class Recording:
+    """Result of one generation - a response dict or a list of stream chunks"""
+
+    def __init__(self, fingerprint: str, stream: bool):
+        self.fingerprint = fingerprint
+        self.stream = stream
+        self.chunks: List[str] = []
+        self.response: Optional[Dict[str, Any]] = None
+        self.done = False
+        self.failed = False
+        self._changed = asyncio.Condition()
+
+    @classmethod
+    def completed(cls, data: Dict[str, Any]) -> "Recording":
+        recording = cls(data["fingerprint"], data["stream"])
+        recording.chunks = data.get("chunks", [])
+        recording.response = data.get("response")
+        recording.done = True
+        return recording
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "stream": self.stream,
+            "chunks": self.chunks,
+            "response": self.response,
+        }
+
+    async def add_chunk(self, chunk: str) -> None:
+        async with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def finish(self, response: Optional[Dict[str, Any]] = None, failed: bool = False) -> None:
+        async with self._changed:
+            self.response = response
+            self.failed = failed
+            self.done = True
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Replay recorded chunks from the start, then follow live until done"""
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.chunks) or self.done)
+                pending = self.chunks[position:]
+                finished = self.done
+                failed = self.failed
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if finished and position >= len(self.chunks):
+                if failed:
+                    yield f"data: {json.dumps({'error': 'Generation failed, retry the request'})}\n\n"
+                return
+
+    async def wait_response(self) -> Dict[str, Any]:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.done)
+        if self.failed or self.response is None:
+            raise GenerationFailed()
+        return self.response
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Recording]]" = OrderedDict()
+        self._redis: Optional["Redis"] = None
+
+    async def start(self) -> None:
+        if not IDEMPOTENCY_REDIS_URL:
+            return
+        if aioredis is None:
+            logger.warning("IDEMPOTENCY_REDIS_URL set but redis package missing - using memory only")
+            return
+        self._redis = aioredis.from_url(IDEMPOTENCY_REDIS_URL)
+        logger.info("Idempotency store using Redis", url=IDEMPOTENCY_REDIS_URL)
+
+    async def stop(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+
+    def _local(self, key: str) -> Optional[Recording]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, recording = entry
+        if recording.done and time.monotonic() > expires_at:
+            del self._entries[key]
+            return None
+        return recording
+
+    def _remember(self, key: str, recording: Recording) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, recording)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _remote(self, key: str, fingerprint: str) -> Optional[Recording]:
+        """Completed recording from Redis, or None once this instance holds the in-flight marker"""
+        if self._redis is None:
+            return None
+
+        deadline = time.monotonic() + IDEMPOTENCY_REMOTE_WAIT
+        while True:
+            stored = await self._redis.get(_REDIS_PREFIX + key)
+            if stored:
+                data = json.loads(stored)
+                if data["fingerprint"] != fingerprint:
+                    raise IdempotencyConflict()
+                if not data.get("in_flight"):
+                    return Recording.completed(data)
+            else:
+                marker = json.dumps({"in_flight": True, "fingerprint": fingerprint})
+                # Short-lived marker so a crashed owner doesn't block the key for the full TTL
+                if await self._redis.set(_REDIS_PREFIX + key, marker, nx=True, ex=int(IDEMPOTENCY_REMOTE_WAIT * 4)):
+                    return None
+            if time.monotonic() > deadline:
+                raise IdempotencyInProgress()
+            await asyncio.sleep(0.25)
+
+    async def claim(self, key: str, fingerprint: str, stream: bool) -> Tuple[Recording, bool]:
+        """
+        Return the recording for ``key`` and whether the caller owns the
+        generation (True) or should replay/attach (False)
+        """
+        recording = self._local(key)
+        if recording is None:
+            remote = await self._remote(key, fingerprint)
+            # Re-check: another local request may have claimed the key while we awaited Redis
+            recording = self._local(key)
+            if recording is None:
+                recording = remote or Recording(fingerprint, stream)
+                self._remember(key, recording)
+                if remote is None:
+                    return recording, True
+
+        if recording.fingerprint != fingerprint:
+            raise IdempotencyConflict()
+        return recording, False
+
+    async def complete(self, key: str, recording: Recording, response: Optional[Dict[str, Any]] = None) -> None:
+        await recording.finish(response)
+        self._remember(key, recording)
+        if self._redis is not None:
+            await self._redis.set(_REDIS_PREFIX + key, json.dumps(recording.to_dict()), ex=self.ttl)
+
+    async def abandon(self, key: str, recording: Recording) -> None:
+        """Owner failed: wake followers with an error and free the key for a retry"""
+        await recording.finish(failed=True)
+        self._entries.pop(key, None)
+        if self._redis is not None:
+            await self._redis.delete(_REDIS_PREFIX + key)
+
+    async def record_stream(self, key: str, recording: Recording, chunks: AsyncIterable[Union[str, bytes]]) -> None:
+        """Drive a stream to completion independent of any client connection"""
+        try:
+            async for chunk in chunks:
+                await recording.add_chunk(chunk if isinstance(chunk, str) else chunk.decode("utf-8"))
+        except Exception as e:
+            logger.error("Idempotent stream failed", key=key, error=str(e))
+            await self.abandon(key, recording)
+            return
+        await self.complete(key, recording)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "ttl": self.ttl, "redis": self._redis is not None}
+
+
+idempotency_store = IdempotencyStore()
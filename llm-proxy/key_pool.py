@@ -0,0 +1,258 @@
+"""
+API-key pools per provider with per-key token buckets
+
+Provider rate limits apply per key/organisation. A pool spreads requests over
+several keys: every key has a local request bucket (RPM) and token bucket
+(TPM) that refill continuously and are corrected from the provider's
+rate-limit response headers. Requests go to the key with the most headroom;
+keys that hit 429 or are rejected as invalid are quarantined for a while.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from logging_config import get_llm_logger
+
+logger = get_llm_logger()
+
+KEY_POOL_DEFAULT_RPM = int(os.getenv("KEY_POOL_DEFAULT_RPM", "500"))
+KEY_POOL_DEFAULT_TPM = int(os.getenv("KEY_POOL_DEFAULT_TPM", "150000"))
+KEY_QUARANTINE_SECONDS = float(os.getenv("KEY_QUARANTINE_SECONDS", "30"))
+KEY_QUARANTINE_INVALID_SECONDS = float(os.getenv("KEY_QUARANTINE_INVALID_SECONDS", "3600"))
+# Completion tokens charged up front when a request keeps the default max_tokens
+KEY_POOL_COMPLETION_TOKENS = int(os.getenv("KEY_POOL_COMPLETION_TOKENS", "500"))
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+
+class KeyPoolExhausted(Exception):
+    """No key of the pool has headroom right now"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"All API keys for {provider} are rate limited")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilling bucket; capacity is the per-minute limit"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def set_remaining(self, remaining: float) -> None:
+        """The provider's view of the remaining budget wins over the local estimate"""
+        self._refill()
+        self.tokens = min(self.capacity, float(remaining))
+
+    def seconds_until(self, amount: float) -> float:
+        missing = amount - self.available()
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+
+class ApiKeyState:
+    def __init__(self, provider: str, key: str, rpm: int, tpm: int):
+        self.provider = provider
+        self.key = key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.quarantined_until = 0.0
+        self.quarantine_reason: Optional[str] = None
+        self.total_requests = 0
+
+    @property
+    def masked(self) -> str:
+        return f"...{self.key[-4:]}" if len(self.key) > 4 else "****"
+
+    def is_quarantined(self) -> bool:
+        return time.monotonic() < self.quarantined_until
+
+    def headroom(self, estimated_tokens: int) -> float:
+        """Fraction of budget left after this request (negative means over budget)"""
+        request_room = (self.requests.available() - 1) / self.requests.capacity
+        token_room = (self.tokens.available() - estimated_tokens) / self.tokens.capacity
+        return min(request_room, token_room)
+
+    def quarantine(self, seconds: float, reason: str) -> None:
+        self.quarantined_until = max(self.quarantined_until, time.monotonic() + seconds)
+        self.quarantine_reason = reason
+        logger.warning("API key quarantined", provider=self.provider, key=self.masked,
+                       seconds=seconds, reason=reason)
+
+    def stats(self) -> dict:
+        return {
+            "key": self.masked,
+            "requests_available": round(self.requests.available(), 1),
+            "tokens_available": round(self.tokens.available(), 1),
+            "quarantined": self.is_quarantined(),
+            "quarantine_reason": self.quarantine_reason if self.is_quarantined() else None,
+            "total_requests": self.total_requests,
+        }
+
+
+class KeyPool:
+    def __init__(self, provider: str, keys: Iterable[str], rpm: int, tpm: int):
+        self.provider = provider
+        self.keys: List[ApiKeyState] = [ApiKeyState(provider, key, rpm, tpm) for key in keys]
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int = 0) -> ApiKeyState:
+        """Pick the key with the most headroom and charge the request against it"""
+        with self._lock:
+            candidates = [state for state in self.keys if not state.is_quarantined()]
+            if candidates:
+                best = max(candidates, key=lambda s: s.headroom(estimated_tokens))
+                if best.headroom(estimated_tokens) >= 0 or best.tokens.capacity < estimated_tokens:
+                    best.requests.consume(1)
+                    best.tokens.consume(estimated_tokens)
+                    best.total_requests += 1
+                    return best
+
+            raise KeyPoolExhausted(self.provider, self._retry_after(estimated_tokens))
+
+    def _retry_after(self, estimated_tokens: int) -> float:
+        now = time.monotonic()
+        waits = []
+        for state in self.keys:
+            wait = max(
+                state.quarantined_until - now,
+                state.requests.seconds_until(1),
+                state.tokens.seconds_until(estimated_tokens),
+            )
+            waits.append(wait)
+        return max(1.0, min(waits)) if waits else KEY_QUARANTINE_SECONDS
+
+    def stats(self) -> dict:
+        return {"provider": self.provider, "keys": [state.stats() for state in self.keys]}
+
+
+def _parse_reset(value: str) -> Optional[float]:
+    """Seconds until reset from '6m0s' / '20ms' style durations or RFC 3339 timestamps"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        factors = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(number) * factors[unit] for number, unit in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+    except ValueError:
+        return None
+
+
+def _header_float(headers: httpx.Headers, *names: str) -> Optional[float]:
+    for name in names:
+        if name in headers:
+            try:
+                return float(headers[name])
+            except ValueError:
+                continue
+    return None
+
+
+class KeyPoolRegistry:
+    """All key pools of the service, plus response-header feedback"""
+
+    def __init__(self):
+        self.pools: Dict[str, KeyPool] = {}
+        self._by_key: Dict[str, ApiKeyState] = {}
+
+    def configure_from_env(self, providers: Iterable[str]) -> None:
+        """
+        Build pools from ``<PROVIDER>_API_KEYS`` (comma separated) plus the
+        single ``<PROVIDER>_API_KEY``. Limits come from ``<PROVIDER>_KEY_RPM``
+        and ``<PROVIDER>_KEY_TPM``.
+        """
+        for provider in providers:
+            prefix = provider.upper()
+            keys = [k.strip() for k in os.getenv(f"{prefix}_API_KEYS", "").split(",") if k.strip()]
+            single = os.getenv(f"{prefix}_API_KEY")
+            if single and single not in keys:
+                keys.append(single)
+            if not keys:
+                continue
+            rpm = int(os.getenv(f"{prefix}_KEY_RPM", str(KEY_POOL_DEFAULT_RPM)))
+            tpm = int(os.getenv(f"{prefix}_KEY_TPM", str(KEY_POOL_DEFAULT_TPM)))
+            pool = KeyPool(provider, keys, rpm, tpm)
+            self.pools[provider] = pool
+            for state in pool.keys:
+                self._by_key[state.key] = state
+            logger.info("API key pool configured", provider=provider, keys=len(keys), rpm=rpm, tpm=tpm)
+
+    def get(self, provider: str) -> Optional[KeyPool]:
+        return self.pools.get(provider)
+
+    @staticmethod
+    def _request_key(request: httpx.Request) -> Optional[str]:
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            return authorization[7:]
+        return request.headers.get("x-api-key") or request.url.params.get("key")
+
+    async def observe_response(self, response: httpx.Response) -> None:
+        """httpx response hook: feed rate-limit headers and errors back into the key state"""
+        key = self._request_key(response.request)
+        state = self._by_key.get(key) if key else None
+        if state is None:
+            return
+
+        headers = response.headers
+        remaining_requests = _header_float(
+            headers, "x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"
+        )
+        remaining_tokens = _header_float(
+            headers, "x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining"
+        )
+        if remaining_requests is not None:
+            state.requests.set_remaining(remaining_requests)
+        if remaining_tokens is not None:
+            state.tokens.set_remaining(remaining_tokens)
+
+        if response.status_code == 429:
+            retry_after = _parse_reset(headers.get("retry-after", "")) if "retry-after" in headers else None
+            if retry_after is None:
+                reset = headers.get("x-ratelimit-reset-requests") or headers.get("anthropic-ratelimit-requests-reset")
+                retry_after = _parse_reset(reset) if reset else None
+            state.quarantine(retry_after or KEY_QUARANTINE_SECONDS, "rate_limited")
+        elif response.status_code in (401, 403):
+            state.quarantine(KEY_QUARANTINE_INVALID_SECONDS, "rejected")
+        elif remaining_requests == 0 or remaining_tokens == 0:
+            reset = (
+                headers.get("x-ratelimit-reset-tokens")
+                or headers.get("x-ratelimit-reset-requests")
+                or headers.get("anthropic-ratelimit-tokens-reset")
+                or headers.get("anthropic-ratelimit-requests-reset")
+            )
+            seconds = _parse_reset(reset) if reset else None
+            state.quarantine(seconds or KEY_QUARANTINE_SECONDS, "exhausted")
+
+    def stats(self) -> dict:
+        return {provider: pool.stats() for provider, pool in self.pools.items()}
+
+
+key_pools = KeyPoolRegistry()
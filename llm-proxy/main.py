@@ -1,20 +1,38 @@
 from fastapi import FastAPI, HTTPException, Depends, status, Request, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List, Optional, Any, AsyncGenerator
+from typing import Dict, List, Optional, Any, AsyncGenerator, Coroutine, Set, Tuple
 from pydantic import BaseModel, Field
 from datetime import datetime
 import asyncio
 import json
+import math
 import httpx
 import os
 import time
 import tiktoken
 from enum import Enum
 import structlog
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from logging_config import setup_logging, get_llm_logger
+from admission import AdmissionMiddleware, admission_controller
+from shared.http_timing import ServerTimingMiddleware, timing_event_hooks
+from token_counter import token_counter, get_encoding, estimate_tokens
+from conversation_store import conversation_cache, conversation_key, window_messages
+from conversation_memory import ConversationMemory, MEMORY_SUMMARY_MODEL, MEMORY_SUMMARY_MAX_TOKENS
+from batch_jobs import BatchManager, BatchJob, BATCH_PROVIDERS
+from key_pool import key_pools, KeyPoolExhausted, KEY_POOL_COMPLETION_TOKENS
+from idempotency import (
+    idempotency_store, request_fingerprint, scoped_idempotency_key, credentials_scope,
+    Recording, IdempotencyConflict, IdempotencyInProgress, GenerationFailed
+)
+from runpod_serverless import (
+    RunPodServerlessClient, RunPodJobError, runpod_keepalive,
+    extract_output_usage, extract_output_text,
+    RUNPOD_MODE, RUNPOD_ENDPOINT_URL, RUNPOD_ENDPOINT_ID
+)
 
 # Logging konfigurieren
 setup_logging("llm-proxy")
@@ -26,6 +44,11 @@ app = FastAPI(
     description="LLM Provider Abstraction Layer - Multi-Model Support"
 )
 
+# Admission control: shed excess load before any provider work starts.
+# Added before CORS - the last middleware added is the outermost - so shed
+# 429/503 responses still carry CORS headers and browsers see a retryable error.
+app.add_middleware(AdmissionMiddleware)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,6 +58,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Upstream phase timings per request (optional Server-Timing header)
+app.add_middleware(ServerTimingMiddleware)
+
 # Security
 security = HTTPBearer()
 
@@ -55,13 +81,18 @@ class MessageRole(str, Enum):
     ASSISTANT = "assistant"
     SYSTEM = "system"
 
+class HistoryMode(str, Enum):
+    CLIENT = "client"  # client sends the full history every turn
+    SERVER = "server"  # client sends chat_id + new turn, proxy assembles history
+    SUMMARY = "summary"  # like server, older turns compacted into a running summary
+
 class ChatMessage(BaseModel):
     role: MessageRole
     content: str
     metadata: Dict[str, Any] = Field(default_factory=dict)
 
 class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
+    messages: List[ChatMessage] = Field(default_factory=list)
     model: str
     provider: LLMProvider
     temperature: float = Field(default=0.7, ge=0.0, le=2.0)
@@ -69,6 +100,8 @@ class ChatRequest(BaseModel):
     stream: bool = False
     user_id: Optional[int] = None
     chat_id: Optional[int] = None
+    history_mode: HistoryMode = HistoryMode.CLIENT
+    context_token_budget: Optional[int] = Field(default=None, ge=1)
 
 class ChatResponse(BaseModel):
     id: str
@@ -81,6 +114,21 @@ class ChatResponse(BaseModel):
     cost: float
     request_id: str
 
+class CompareTarget(BaseModel):
+    provider: LLMProvider
+    model: str
+
+class CompareRequest(BaseModel):
+    messages: List[ChatMessage] = Field(..., min_length=1)
+    targets: List[CompareTarget] = Field(..., min_length=1, max_length=8)
+    temperature: float = Field(default=0.7, ge=0.0, le=2.0)
+    max_tokens: int = Field(default=4000, ge=1, le=32000)
+    user_id: Optional[int] = None
+
+class BatchCreateRequest(BaseModel):
+    requests: List[ChatRequest] = Field(..., min_length=1, max_length=50000)
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+
 class TokenUsage(BaseModel):
     prompt_tokens: int
     completion_tokens: int
@@ -198,6 +246,42 @@ MODEL_CONFIGS = {
     )
 }
 
+def calculate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    config = MODEL_CONFIGS.get(model)
+    if not config:
+        return 0.0
+    
+    input_cost = input_tokens * config.input_cost_per_token
+    output_cost = output_tokens * config.output_cost_per_token
+    return input_cost + output_cost
+
+# ===================================================
+# SHARED HTTP CLIENT
+# ===================================================
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Process-wide pooled HTTP client shared by all provider instances, so
+    connections (and TLS sessions) to the provider APIs are reused
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=120.0,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE
+            ),
+            # Phase timings, and provider rate-limit headers fed back into the key pools
+            event_hooks=timing_event_hooks(response=[key_pools.observe_response])
+        )
+    return _http_client
+
 # ===================================================
 # PROVIDER CLASSES
 # ===================================================
@@ -205,30 +289,28 @@ MODEL_CONFIGS = {
 class BaseProvider:
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.client = httpx.AsyncClient(timeout=120.0)
+        self.client = get_http_client()
+    
+    @property
+    def supports_streaming(self) -> bool:
+        return type(self).generate_streaming_completion is not BaseProvider.generate_streaming_completion
     
     async def generate_completion(self, request: ChatRequest) -> ChatResponse:
         raise NotImplementedError
     
-    async def generate_streaming_completion(self, request: ChatRequest) -> AsyncGenerator[str, None]:
+    def generate_streaming_completion(self, request: ChatRequest) -> AsyncGenerator[str, None]:
+        # Overridden by async generators in providers that stream
         raise NotImplementedError
     
     def calculate_cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
-        config = MODEL_CONFIGS.get(model)
-        if not config:
-            return 0.0
-        
-        input_cost = input_tokens * config.input_cost_per_token
-        output_cost = output_tokens * config.output_cost_per_token
-        return input_cost + output_cost
+        return calculate_cost(model, input_tokens, output_tokens)
     
     def count_tokens(self, text: str, model: str) -> int:
-        try:
-            encoding = tiktoken.encoding_for_model(model.split("/")[-1])
-            return len(encoding.encode(text))
-        except:
-            # Fallback: rough estimate
-            return len(text.split()) * 1.3
+        return token_counter.count(text, model)
+    
+    def count_message_tokens(self, messages: List[ChatMessage], model: str) -> int:
+        # Per-message memo: only messages not seen before are encoded
+        return token_counter.count_messages((msg.content for msg in messages), model)
 
 class OpenAIProvider(BaseProvider):
     def __init__(self, api_key: str):
@@ -307,7 +389,9 @@ class OpenAIProvider(BaseProvider):
             "messages": [{"role": msg.role.value, "content": msg.content} for msg in request.messages],
             "temperature": request.temperature,
             "max_tokens": request.max_tokens,
-            "stream": True
+            "stream": True,
+            # Final chunk reports the usage (with empty choices)
+            "stream_options": {"include_usage": True}
         }
         
         try:
@@ -384,15 +468,14 @@ class AnthropicProvider(BaseProvider):
             
             data = response.json()
             
-            # Calculate tokens and cost
-            input_tokens = self.count_tokens(
-                " ".join([msg.content for msg in request.messages]),
-                request.model
-            )
-            output_tokens = self.count_tokens(
-                data["content"][0]["text"],
-                request.model
-            )
+            # Provider-reported usage is authoritative; count locally only if missing
+            usage = data.get("usage") or {}
+            input_tokens = usage.get("input_tokens")
+            output_tokens = usage.get("output_tokens")
+            if input_tokens is None:
+                input_tokens = self.count_message_tokens(request.messages, request.model)
+            if output_tokens is None:
+                output_tokens = self.count_tokens(data["content"][0]["text"], request.model)
             
             cost = self.calculate_cost(request.model, input_tokens, output_tokens)
             
@@ -475,12 +558,14 @@ class GoogleProvider(BaseProvider):
             candidate = data["candidates"][0]
             content = candidate["content"]["parts"][0]["text"]
             
-            # Calculate tokens and cost
-            input_tokens = self.count_tokens(
-                " ".join([msg.content for msg in request.messages]),
-                request.model
-            )
-            output_tokens = self.count_tokens(content, request.model)
+            # Provider-reported usage is authoritative; count locally only if missing
+            usage_metadata = data.get("usageMetadata") or {}
+            input_tokens = usage_metadata.get("promptTokenCount")
+            output_tokens = usage_metadata.get("candidatesTokenCount")
+            if input_tokens is None:
+                input_tokens = self.count_message_tokens(request.messages, request.model)
+            if output_tokens is None:
+                output_tokens = self.count_tokens(content, request.model)
             
             cost = self.calculate_cost(request.model, input_tokens, output_tokens)
             
@@ -653,8 +738,95 @@ class RunPodProvider(BaseProvider):
     def __init__(self, api_key: str, endpoint_url: str):
         super().__init__(api_key)
         self.base_url = endpoint_url
+        self.serverless = RUNPOD_MODE == "serverless"
+    
+    @property
+    def supports_streaming(self) -> bool:
+        # Only the serverless job API has a streaming path here
+        return self.serverless
+    
+    def _job_input(self, request: ChatRequest) -> Dict[str, Any]:
+        return {
+            "messages": [{"role": msg.role.value, "content": msg.content} for msg in request.messages],
+            "sampling_params": {
+                "temperature": request.temperature,
+                "max_tokens": request.max_tokens
+            }
+        }
+    
+    async def generate_serverless_completion(self, request: ChatRequest) -> ChatResponse:
+        logger.info("Generating RunPod serverless completion", model=request.model)
+        
+        start_time = time.time()
+        
+        try:
+            client = RunPodServerlessClient(self.api_key, self.base_url, RUNPOD_ENDPOINT_ID)
+            job = await client.run(self._job_input(request))
+        except (httpx.HTTPError, RunPodJobError) as e:
+            logger.error("RunPod serverless error", error=str(e))
+            raise HTTPException(status_code=502, detail=f"RunPod serverless error: {str(e)}")
+        
+        content = extract_output_text(job.get("output"))
+        usage = extract_output_usage(job.get("output"))
+        if not usage["prompt_tokens"]:
+            usage["prompt_tokens"] = self.count_message_tokens(request.messages, request.model)
+        if not usage["completion_tokens"]:
+            usage["completion_tokens"] = self.count_tokens(content, request.model)
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        
+        cost = self.calculate_cost(request.model, usage["prompt_tokens"], usage["completion_tokens"])
+        processing_time = time.time() - start_time
+        
+        logger.info("RunPod serverless completion generated",
+                   model=request.model,
+                   tokens=usage["total_tokens"],
+                   cost=cost,
+                   queue_delay=job.get("delayTime"),
+                   execution_time=job.get("executionTime"),
+                   processing_time=processing_time)
+        
+        return ChatResponse(
+            id=job["id"],
+            created=int(time.time()),
+            model=request.model,
+            provider=LLMProvider.RUNPOD.value,
+            choices=[{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": content
+                },
+                "finish_reason": "stop"
+            }],
+            usage=usage,
+            cost=cost,
+            request_id=job["id"]
+        )
+    
+    async def generate_streaming_completion(self, request: ChatRequest) -> AsyncGenerator[str, None]:
+        if not self.serverless:
+            raise HTTPException(status_code=400, detail="Streaming requires RUNPOD_MODE=serverless")
+        
+        logger.info("Generating RunPod serverless streaming completion", model=request.model)
+        
+        try:
+            client = RunPodServerlessClient(self.api_key, self.base_url, RUNPOD_ENDPOINT_ID)
+            async for text in client.stream(self._job_input(request)):
+                # Re-emit as OpenAI-style chunks so clients see one streaming format
+                chunk = {
+                    "object": "chat.completion.chunk",
+                    "model": request.model,
+                    "choices": [{"index": 0, "delta": {"content": text}}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+        except (httpx.HTTPError, RunPodJobError) as e:
+            logger.error("RunPod serverless streaming error", error=str(e))
+            raise HTTPException(status_code=502, detail=f"RunPod serverless streaming error: {str(e)}")
     
     async def generate_completion(self, request: ChatRequest) -> ChatResponse:
+        if self.serverless:
+            return await self.generate_serverless_completion(request)
+        
         logger.info("Generating RunPod completion", model=request.model)
         
         headers = {
@@ -732,7 +904,7 @@ def get_provider(provider: LLMProvider, api_key: str, endpoint_url: str = None)
     elif provider == LLMProvider.OPENROUTER:
         return OpenRouterProvider(api_key)
     elif provider == LLMProvider.RUNPOD:
-        return RunPodProvider(api_key, endpoint_url or "https://api.runpod.ai")
+        return RunPodProvider(api_key, endpoint_url or RUNPOD_ENDPOINT_URL)
     else:
         raise HTTPException(status_code=400, detail=f"Unsupported provider: {provider}")
 
@@ -740,13 +912,30 @@ def get_provider(provider: LLMProvider, api_key: str, endpoint_url: str = None)
 # DEPENDENCY INJECTION
 # ===================================================
 
-async def get_api_key(request: Request, provider: LLMProvider) -> str:
+async def get_api_key(
+    request: Request,
+    provider: LLMProvider,
+    estimated_tokens: int = 0,
+    use_pool: bool = True
+) -> str:
     """
-    Extract API key from request headers
+    Extract API key from request headers, or pick the key with the most
+    headroom from the provider's key pool
     """
     header_name = f"X-{provider.value.upper()}-API-KEY"
     api_key = request.headers.get(header_name)
     
+    pool = key_pools.get(provider.value) if use_pool else None
+    if not api_key and pool:
+        try:
+            return pool.acquire(estimated_tokens).key
+        except KeyPoolExhausted as e:
+            raise HTTPException(
+                status_code=429,
+                detail=str(e),
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+    
     if not api_key:
         # Fallback to environment variable
         env_var = f"{provider.value.upper()}_API_KEY"
@@ -760,17 +949,207 @@ async def get_api_key(request: Request, provider: LLMProvider) -> str:
     
     return api_key
 
+def caller_credentials(request: Request) -> List[str]:
+    """The Authorization and provider API-key headers a request was sent with"""
+    names = ["Authorization"] + [f"X-{provider.value.upper()}-API-KEY" for provider in LLMProvider]
+    return [f"{name}: {request.headers[name]}" for name in names if request.headers.get(name)]
+
+def estimated_request_tokens(request: ChatRequest) -> int:
+    """
+    Tokens charged against the key pool before a request is sent: the prompt
+    as sent (including server-side history) plus the completion size the
+    client asked for, or a typical completion if it kept the default max_tokens
+    """
+    prompt_tokens = token_counter.count_messages(
+        (msg.content for msg in request.messages), request.model
+    )
+    if "max_tokens" in request.model_fields_set:
+        return prompt_tokens + request.max_tokens
+    return prompt_tokens + min(request.max_tokens, KEY_POOL_COMPLETION_TOKENS)
+
+# Fire-and-forget work started by request handlers, referenced until it
+# finishes so it can't be garbage collected mid-run
+_background_tasks: Set[asyncio.Task] = set()
+
+def _background_task_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task failed", task=task.get_name(), error=str(task.exception()))
+
+def spawn_background_task(coro: Coroutine[Any, Any, Any], name: str) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+# ===================================================
+# CONVERSATION ASSEMBLY
+# ===================================================
+
+async def assemble_conversation(request: ChatRequest, authorization: Optional[str]) -> ChatRequest:
+    """
+    Build the full prompt for a server-history request from the cached chat
+    history plus the new turn, windowed to the model's token budget
+    """
+    if request.chat_id is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"chat_id is required for history_mode={request.history_mode.value}"
+        )
+    
+    key = conversation_key(request.chat_id, authorization)
+    history = await conversation_cache.get_history(key, authorization)
+    turn = [{"role": msg.role.value, "content": msg.content} for msg in request.messages]
+    
+    if request.history_mode == HistoryMode.SUMMARY:
+        candidates = conversation_memory.build_prompt(key, history, turn)
+    else:
+        candidates = history + turn
+    
+    config = MODEL_CONFIGS[request.model]
+    budget = request.context_token_budget or max(config.context_window - request.max_tokens, 1)
+    windowed = window_messages(candidates, request.model, budget)
+    
+    logger.info("Conversation assembled",
+               chat_id=request.chat_id,
+               history_messages=len(history),
+               new_messages=len(turn),
+               window_messages=len(windowed),
+               token_budget=budget)
+    
+    return request.model_copy(update={
+        "messages": [ChatMessage(role=MessageRole(m["role"]), content=m["content"]) for m in windowed]
+    })
+
+async def summarize_conversation(chat_id: int, messages: List[Dict[str, str]]) -> str:
+    """
+    Summarizer for conversation memory, run with the configured cheap model
+    """
+    config = MODEL_CONFIGS.get(MEMORY_SUMMARY_MODEL)
+    if not config:
+        raise ValueError(f"Summary model {MEMORY_SUMMARY_MODEL} not configured")
+    
+    pool = key_pools.get(config.provider.value)
+    api_key: Optional[str]
+    if pool:
+        api_key = pool.acquire(MEMORY_SUMMARY_MAX_TOKENS).key
+    else:
+        api_key = os.getenv(f"{config.provider.value.upper()}_API_KEY")
+    if not api_key:
+        raise ValueError(f"No API key for summary provider {config.provider.value}")
+    
+    provider = get_provider(config.provider, api_key)
+    response = await provider.generate_completion(ChatRequest(
+        messages=[ChatMessage(role=MessageRole(m["role"]), content=m["content"]) for m in messages],
+        model=MEMORY_SUMMARY_MODEL,
+        provider=config.provider,
+        temperature=0.2,
+        max_tokens=MEMORY_SUMMARY_MAX_TOKENS,
+        chat_id=chat_id
+    ))
+    await log_usage(None, chat_id, config.provider.value, MEMORY_SUMMARY_MODEL, response.usage, response.cost)
+    return response.choices[0]["message"]["content"]
+
+conversation_memory = ConversationMemory(summarize_fn=summarize_conversation)
+
+async def finish_server_turn(
+    request: ChatRequest,
+    authorization: Optional[str],
+    new_turn: List[Dict[str, str]],
+    reply: str
+):
+    """
+    Record a completed turn in the caller's conversation cache and, in summary
+    mode, compact older turns for the next request
+    """
+    if request.chat_id is None:
+        return  # assemble_conversation rejects server-history requests without one
+    key = conversation_key(request.chat_id, authorization)
+    await conversation_cache.append(
+        key,
+        new_turn + [{"role": "assistant", "content": reply}]
+    )
+    if request.history_mode == HistoryMode.SUMMARY:
+        await conversation_memory.maybe_compact(
+            key,
+            conversation_cache.peek(key),
+            request.model
+        )
+
+def stream_delta_text(chunk: str) -> str:
+    """Extract the assistant text from an OpenAI-style SSE chunk"""
+    if not chunk.startswith("data: "):
+        return ""
+    try:
+        data = json.loads(chunk[6:])
+        return data["choices"][0]["delta"].get("content") or ""
+    except (json.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError):
+        return ""
+
+def stream_usage(chunk: str) -> Optional[Dict[str, Any]]:
+    """Provider-reported usage carried by an OpenAI-style SSE chunk, if any"""
+    if not chunk.startswith("data: "):
+        return None
+    try:
+        usage = json.loads(chunk[6:]).get("usage")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    return usage if isinstance(usage, dict) else None
+
+# ===================================================
+# BACKGROUND TASKS
+# ===================================================
+
+async def log_usage(
+    user_id: Optional[int],
+    chat_id: Optional[int],
+    provider: str,
+    model: str,
+    usage: Dict[str, Any],
+    cost: float
+):
+    """
+    Log usage statistics (to be sent to backend-core)
+    """
+    logger.info("Usage logged",
+               user_id=user_id,
+               chat_id=chat_id,
+               provider=provider,
+               model=model,
+               usage=usage,
+               cost=cost)
+    
+    # TODO: Send to backend-core service for database logging
+    # This would be implemented as an HTTP request to backend-core
+    pass
+
 # ===================================================
 # MAIN ENDPOINTS
 # ===================================================
 
+batch_manager = BatchManager(cost_fn=calculate_cost, usage_fn=log_usage)
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("LLM Proxy Service starting up")
+    admission_controller.lag_monitor.start()
+    key_pools.configure_from_env([provider.value for provider in LLMProvider])
+    await batch_manager.start()
+    await idempotency_store.start()
+    runpod_keepalive.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("LLM Proxy Service shutting down")
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await conversation_cache.close()
+    await batch_manager.stop()
+    await idempotency_store.stop()
+    await runpod_keepalive.stop()
+    await admission_controller.lag_monitor.stop()
+    if _http_client is not None:
+        await _http_client.aclose()
 
 @app.get("/")
 def read_root():
@@ -786,9 +1165,22 @@ def health_check():
         "status": "healthy",
         "service": "llm-proxy",
         "version": "0.7.0",
-        "supported_providers": list(LLMProvider)
+        "supported_providers": list(LLMProvider),
+        "token_memo": token_counter.stats(),
+        "conversation_cache": conversation_cache.stats(),
+        "conversation_memory": conversation_memory.stats(),
+        "key_pools": key_pools.stats(),
+        "admission": admission_controller.stats(),
+        "idempotency": idempotency_store.stats()
     }
 
+@app.get("/metrics", response_class=Response)
+def metrics():
+    """
+    Service metrics in Prometheus text format
+    """
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/models")
 def list_models():
     """
@@ -810,6 +1202,43 @@ def list_models():
         ]
     }
 
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+async def claim_idempotency_key(key: str, request: ChatRequest):
+    """Claim an idempotency key for a request, or get the recording of its first use"""
+    fingerprint = request_fingerprint(request.model_dump_json())
+    try:
+        return await idempotency_store.claim(key, fingerprint, request.stream)
+    except IdempotencyConflict:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request"
+        )
+    except IdempotencyInProgress:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "5"}
+        )
+
+async def replay_idempotent(recording: Recording):
+    """Answer a duplicate request from the recording of the first one"""
+    replay_headers = {"Idempotent-Replayed": "true"}
+    if recording.stream:
+        return StreamingResponse(
+            recording.follow(),
+            media_type="text/event-stream",
+            headers={**SSE_HEADERS, **replay_headers}
+        )
+    try:
+        return JSONResponse(await recording.wait_response(), headers=replay_headers)
+    except GenerationFailed:
+        raise HTTPException(status_code=502, detail="Original request failed, retry the request")
+
 @app.post("/chat/completions")
 async def chat_completions(
     request: ChatRequest,
@@ -817,19 +1246,76 @@ async def chat_completions(
     background_tasks: BackgroundTasks
 ):
     """
-    Generate chat completions using the specified provider
+    Generate chat completions using the specified provider.
+    
+    With an Idempotency-Key header, retries of the same request get the stored
+    response or attach to the running stream instead of generating again.
+    Keys are scoped to the caller's credentials.
     """
+    idempotency_key = http_request.headers.get("Idempotency-Key")
+    if not idempotency_key:
+        return await generate_chat_completion(request, http_request, background_tasks)
+    
+    key = scoped_idempotency_key(idempotency_key, caller_credentials(http_request))
+    recording, is_owner = await claim_idempotency_key(key, request)
+    if not is_owner:
+        logger.info("Idempotent replay", idempotency_key=idempotency_key, stream=recording.stream)
+        return await replay_idempotent(recording)
+    
+    try:
+        response = await generate_chat_completion(request, http_request, background_tasks)
+    except Exception:
+        await idempotency_store.abandon(key, recording)
+        raise
+    
+    if isinstance(response, StreamingResponse):
+        # Generate in the background so a disconnecting client can re-attach on retry
+        spawn_background_task(
+            idempotency_store.record_stream(key, recording, response.body_iterator),
+            name="record_stream"
+        )
+        return StreamingResponse(
+            recording.follow(),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
+    
+    await idempotency_store.complete(key, recording, response.model_dump())
+    return response
+
+async def stream_chat_completion(
+    provider: BaseProvider,
+    request: ChatRequest,
+    authorization: Optional[str],
+    new_turn: Optional[List[Dict[str, str]]]
+) -> AsyncGenerator[str, None]:
+    """
+    SSE chunks of a streamed completion. With server-side history
+    (``new_turn`` set) the turn is recorded once the stream is done.
+    """
+    reply_parts = []
+    async for chunk in provider.generate_streaming_completion(request):
+        if new_turn is not None:
+            reply_parts.append(stream_delta_text(chunk))
+        yield chunk
+    yield "data: [DONE]\n\n"
+    
+    if new_turn is not None:
+        spawn_background_task(
+            finish_server_turn(request, authorization, new_turn, "".join(reply_parts)),
+            name="finish_server_turn"
+        )
+
+async def generate_chat_completion(
+    request: ChatRequest,
+    http_request: Request,
+    background_tasks: BackgroundTasks
+):
     logger.info("Chat completion requested", 
                model=request.model, 
                provider=request.provider.value,
                stream=request.stream)
     
-    # Get API key
-    api_key = await get_api_key(http_request, request.provider)
-    
-    # Get provider instance
-    provider = get_provider(request.provider, api_key)
-    
     # Validate model
     if request.model not in MODEL_CONFIGS:
         raise HTTPException(
@@ -837,44 +1323,292 @@ async def chat_completions(
             detail=f"Model {request.model} not supported"
         )
     
+    # Server-side history: the client only sent the new turn
+    server_history = request.history_mode != HistoryMode.CLIENT
+    new_turn = [{"role": msg.role.value, "content": msg.content} for msg in request.messages]
+    authorization = http_request.headers.get("Authorization")
+    if server_history:
+        request = await assemble_conversation(request, authorization)
+    elif not request.messages:
+        raise HTTPException(status_code=400, detail="messages must not be empty")
+    
+    # Get API key (charged against the key pool with the prompt as it will be sent)
+    api_key = await get_api_key(http_request, request.provider, estimated_request_tokens(request))
+    
+    # Get provider instance
+    provider = get_provider(request.provider, api_key)
+    
+    # Checked before the response starts: an error raised inside the stream would follow a 200
+    if request.stream and not provider.supports_streaming:
+        detail = f"Streaming is not supported for {request.model}"
+        if request.provider == LLMProvider.RUNPOD:
+            detail += " (requires RUNPOD_MODE=serverless)"
+        raise HTTPException(status_code=400, detail=detail)
+    
     try:
         if request.stream:
             # Return streaming response
-            async def generate():
-                async for chunk in provider.generate_streaming_completion(request):
-                    yield chunk
-                yield "data: [DONE]\n\n"
-            
             return StreamingResponse(
-                generate(),
+                stream_chat_completion(provider, request, authorization, new_turn if server_history else None),
                 media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no"
-                }
+                headers=SSE_HEADERS
             )
-        else:
-            # Return regular response
-            response = await provider.generate_completion(request)
-            
-            # Log usage in background
-            background_tasks.add_task(
-                log_usage,
-                request.user_id,
-                request.chat_id,
-                request.provider.value,
-                request.model,
-                response.usage,
-                response.cost
-            )
-            
-            return response
+        
+        # Return regular response
+        response = await provider.generate_completion(request)
+        
+        if server_history:
+            reply = response.choices[0].get("message", {}).get("content", "") if response.choices else ""
+            background_tasks.add_task(finish_server_turn, request, authorization, new_turn, reply)
+        
+        # Log usage in background
+        background_tasks.add_task(
+            log_usage,
+            request.user_id,
+            request.chat_id,
+            request.provider.value,
+            request.model,
+            response.usage,
+            response.cost
+        )
+        
+        return response
             
     except Exception as e:
         logger.error("Chat completion error", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+# ===================================================
+# MULTI-MODEL COMPARE
+# ===================================================
+
+def sse_event(payload: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+async def stream_compare_deltas(
+    provider: BaseProvider,
+    chat_request: ChatRequest,
+    tag: Dict[str, Any],
+    queue: asyncio.Queue
+) -> Tuple[str, Dict[str, Any], Optional[float]]:
+    """
+    Forward the streamed deltas of one compare target to the queue. Returns
+    the text, the provider-reported usage ({} if none) and the first-token time.
+    """
+    parts = []
+    usage: Dict[str, Any] = {}
+    first_token_at = None
+    async for chunk in provider.generate_streaming_completion(chat_request):
+        text = stream_delta_text(chunk)
+        if not text:
+            usage = stream_usage(chunk) or usage
+            continue
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        parts.append(text)
+        await queue.put(sse_event({**tag, "type": "delta", "content": text}))
+    return "".join(parts), usage, first_token_at
+
+async def run_compare_target(
+    index: int,
+    target: CompareTarget,
+    request: CompareRequest,
+    api_key: str,
+    queue: asyncio.Queue
+):
+    """
+    Run one generation of a compare request and push tagged events to the
+    shared queue. Errors are reported as events so other models keep running.
+    Usage is logged per target like a /chat/completions call.
+    """
+    tag = {"target": index, "provider": target.provider.value, "model": target.model}
+    chat_request = ChatRequest(
+        messages=request.messages,
+        model=target.model,
+        provider=target.provider,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        stream=True,
+        user_id=request.user_id
+    )
+    provider = get_provider(target.provider, api_key)
+    start_time = time.perf_counter()
+    
+    try:
+        if provider.supports_streaming:
+            content, usage, first_token_at = await stream_compare_deltas(provider, chat_request, tag, queue)
+            if not usage.get("completion_tokens"):
+                # Provider reported no usage - count locally
+                prompt_tokens = provider.count_message_tokens(request.messages, target.model)
+                completion_tokens = provider.count_tokens(content, target.model)
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+            cost = provider.calculate_cost(target.model, usage.get("prompt_tokens", 0), usage["completion_tokens"])
+        else:
+            response = await provider.generate_completion(chat_request.model_copy(update={"stream": False}))
+            first_token_at = time.perf_counter()
+            content = response.choices[0].get("message", {}).get("content", "") if response.choices else ""
+            await queue.put(sse_event({**tag, "type": "delta", "content": content}))
+            usage = response.usage
+            cost = response.cost
+        
+        end_time = time.perf_counter()
+        ttft = (first_token_at or end_time) - start_time
+        generation_time = end_time - (first_token_at or start_time)
+        output_tokens = usage.get("completion_tokens", 0)
+        
+        metrics = {
+            "ttft": ttft,
+            "total_time": end_time - start_time,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": output_tokens,
+            "tokens_per_second": output_tokens / generation_time if generation_time > 0 else None,
+            "cost": cost
+        }
+        logger.info("Compare target finished", **tag, **metrics)
+        await queue.put(sse_event({**tag, "type": "done", "metrics": metrics}))
+        await log_usage(request.user_id, None, target.provider.value, target.model, usage, cost)
+        
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error("Compare target failed", **tag, error=detail)
+        await queue.put(sse_event({**tag, "type": "error", "error": detail}))
+
+@app.post("/chat/completions/compare")
+async def compare_completions(
+    request: CompareRequest,
+    http_request: Request
+):
+    """
+    Run one prompt against several provider/model pairs concurrently and
+    stream interleaved, target-tagged SSE events on a single response
+    """
+    for target in request.targets:
+        if target.model not in MODEL_CONFIGS:
+            raise HTTPException(status_code=400, detail=f"Model {target.model} not supported")
+    
+    # Resolve all keys up front so a missing key fails the request before any generation starts
+    api_keys = [await get_api_key(http_request, target.provider) for target in request.targets]
+    
+    logger.info("Compare requested",
+               targets=[f"{t.provider.value}/{t.model}" for t in request.targets])
+    
+    async def generate():
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks = [
+            asyncio.create_task(run_compare_target(i, target, request, api_keys[i], queue))
+            for i, target in enumerate(request.targets)
+        ]
+        
+        async def close_when_done():
+            await asyncio.gather(*tasks)
+            await queue.put(None)
+        
+        closer = asyncio.create_task(close_when_done())
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+            yield "data: [DONE]\n\n"
+        finally:
+            # Client disconnected: stop remaining generations
+            for task in tasks:
+                task.cancel()
+            closer.cancel()
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+# ===================================================
+# BATCH JOBS
+# ===================================================
+
+@app.post("/batches", response_model=BatchJob, response_model_exclude={"owner"},
+          status_code=status.HTTP_202_ACCEPTED)
+async def create_batch(
+    request: BatchCreateRequest,
+    http_request: Request
+):
+    """
+    Submit many chat requests as an offline batch job. Requests are grouped
+    into provider batch jobs and processed in the background at batch pricing.
+    Status and results are served to callers sending the same credentials.
+    """
+    api_keys: Dict[str, str] = {}
+    items = []
+    
+    for index, chat_request in enumerate(request.requests):
+        if chat_request.provider.value not in BATCH_PROVIDERS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Batch mode not supported for provider {chat_request.provider.value}"
+            )
+        if chat_request.model not in MODEL_CONFIGS:
+            raise HTTPException(status_code=400, detail=f"Model {chat_request.model} not supported")
+        if not chat_request.messages:
+            raise HTTPException(status_code=400, detail=f"Request {index} has no messages")
+        
+        if chat_request.provider.value not in api_keys:
+            # Batch APIs have their own limits - don't draw from the realtime key pool
+            api_keys[chat_request.provider.value] = await get_api_key(
+                http_request, chat_request.provider, use_pool=False
+            )
+        
+        items.append({
+            "custom_id": f"req-{index}",
+            "index": index,
+            "provider": chat_request.provider.value,
+            "model": chat_request.model,
+            "messages": [{"role": m.role.value, "content": m.content} for m in chat_request.messages],
+            "temperature": chat_request.temperature,
+            "max_tokens": chat_request.max_tokens,
+            "user_id": chat_request.user_id,
+            "chat_id": chat_request.chat_id
+        })
+    
+    # Only keys sent by the caller are bound to the job; environment keys are looked up when used
+    caller_keys = {
+        provider: key for provider, key in api_keys.items()
+        if http_request.headers.get(f"X-{provider.upper()}-API-KEY")
+    }
+    owner = credentials_scope(caller_credentials(http_request))
+    return batch_manager.create_job(items, caller_keys, owner, request.metadata)
+
+@app.get("/batches/{job_id}", response_model=BatchJob, response_model_exclude={"owner"})
+async def get_batch(job_id: str, http_request: Request):
+    """
+    Get status and progress of a batch job
+    """
+    job = batch_manager.get_job(job_id, credentials_scope(caller_credentials(http_request)))
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Batch job {job_id} not found")
+    return job
+
+@app.get("/batches/{job_id}/results")
+async def get_batch_results(job_id: str, http_request: Request):
+    """
+    Get the results of a batch job, ordered like the submitted requests
+    """
+    job = batch_manager.get_job(job_id, credentials_scope(caller_credentials(http_request)))
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Batch job {job_id} not found")
+    
+    results = batch_manager.read_results(job_id)
+    return {
+        "id": job.id,
+        "status": job.status.value,
+        "results": results,
+        "total": len(results)
+    }
+
 @app.post("/tokens/count")
 async def count_tokens(
     text: str,
@@ -883,8 +1617,8 @@ async def count_tokens(
     """
     Count tokens in text for a specific model
     """
-    try:
-        encoding = tiktoken.encoding_for_model(model.split("/")[-1])
+    encoding = get_encoding(model)
+    if encoding is not None:
         tokens = len(encoding.encode(text))
         
         return {
@@ -893,9 +1627,9 @@ async def count_tokens(
             "tokens": tokens,
             "characters": len(text)
         }
-    except Exception as e:
+    else:
         # Fallback counting
-        tokens = int(len(text.split()) * 1.3)
+        tokens = estimate_tokens(text)
         return {
             "text": text,
             "model": model,
@@ -932,33 +1666,6 @@ async def estimate_cost(
         "currency": "USD"
     }
 
-# ===================================================
-# BACKGROUND TASKS
-# ===================================================
-
-async def log_usage(
-    user_id: Optional[int],
-    chat_id: Optional[int],
-    provider: str,
-    model: str,
-    usage: Dict[str, Any],
-    cost: float
-):
-    """
-    Log usage statistics (to be sent to backend-core)
-    """
-    logger.info("Usage logged",
-               user_id=user_id,
-               chat_id=chat_id,
-               provider=provider,
-               model=model,
-               usage=usage,
-               cost=cost)
-    
-    # TODO: Send to backend-core service for database logging
-    # This would be implemented as an HTTP request to backend-core
-    pass
-
 # ===================================================
 # ERROR HANDLING
 # ===================================================
@@ -0,0 +1,288 @@
+"""
+RunPod serverless job API (/run + /status, /stream) and warm-worker keepalive
+
+Serverless endpoints scale to zero, so the first request after idle pays a
+cold start of tens of seconds. Submitting a job and polling it avoids holding
+one long HTTP request open, and the keepalive submits a tiny warm-up job
+whenever an endpoint has no ready workers. Queue delay and cold starts are
+recorded in the metrics.
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+import httpx
+from prometheus_client import Counter, Histogram
+
+from logging_config import get_llm_logger
+from shared.http_timing import timing_event_hooks
+
+logger = get_llm_logger()
+
+RUNPOD_MODE = os.getenv("RUNPOD_MODE", "openai").lower()  # openai, serverless
+RUNPOD_ENDPOINT_URL = os.getenv("RUNPOD_ENDPOINT_URL", "https://api.runpod.ai")
+RUNPOD_ENDPOINT_ID = os.getenv("RUNPOD_ENDPOINT_ID", "")
+RUNPOD_POLL_INTERVAL = float(os.getenv("RUNPOD_POLL_INTERVAL", "0.5"))
+RUNPOD_JOB_TIMEOUT = float(os.getenv("RUNPOD_JOB_TIMEOUT", "600"))
+RUNPOD_COLD_START_THRESHOLD = float(os.getenv("RUNPOD_COLD_START_THRESHOLD", "5"))
+RUNPOD_KEEPALIVE_INTERVAL = float(os.getenv("RUNPOD_KEEPALIVE_INTERVAL", "0"))  # 0 = disabled
+RUNPOD_KEEPALIVE_ENDPOINTS = [
+    e.strip() for e in os.getenv("RUNPOD_KEEPALIVE_ENDPOINTS", RUNPOD_ENDPOINT_ID).split(",") if e.strip()
+]
+RUNPOD_STANDIN_ENABLED = os.getenv("RUNPOD_STANDIN_ENABLED", "false").lower() == "true"
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED", "TIMED_OUT")
+# Cold starts run well past prometheus_client's default 10s top bucket
+QUEUE_DELAY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+runpod_queue_delay = Histogram(
+    "llm_proxy_runpod_queue_delay_seconds",
+    "Time RunPod jobs spent queued before a worker picked them up",
+    ["endpoint"],
+    buckets=QUEUE_DELAY_BUCKETS,
+)
+runpod_cold_start = Histogram(
+    "llm_proxy_runpod_cold_start_seconds",
+    "Queue delay of RunPod jobs classified as cold starts",
+    ["endpoint"],
+    buckets=QUEUE_DELAY_BUCKETS,
+)
+runpod_cold_starts_total = Counter(
+    "llm_proxy_runpod_cold_starts_total",
+    "RunPod jobs whose queue delay exceeded RUNPOD_COLD_START_THRESHOLD",
+    ["endpoint"],
+)
+runpod_keepalive_total = Counter(
+    "llm_proxy_runpod_keepalive_total",
+    "Keepalive checks per endpoint and outcome",
+    ["endpoint", "outcome"],
+)
+
+
+class RunPodJobError(Exception):
+    pass
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_runpod_client() -> httpx.AsyncClient:
+    """Client for the job API; routed in-process to the stand-in when enabled"""
+    global _client
+    if _client is None or _client.is_closed:
+        if RUNPOD_STANDIN_ENABLED:
+            from runpod_standin import standin_app
+
+            _client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=standin_app),  # type: ignore[arg-type]  # httpx's narrower ASGI type
+                timeout=30.0
+            )
+        else:
+            _client = httpx.AsyncClient(timeout=30.0, event_hooks=timing_event_hooks())
+    return _client
+
+
+def runpod_base_url(endpoint_url: str) -> str:
+    if RUNPOD_STANDIN_ENABLED:
+        from runpod_standin import STANDIN_BASE_URL
+
+        return STANDIN_BASE_URL
+    return endpoint_url.rstrip("/")
+
+
+def _choice_text(choice: Dict[str, Any]) -> str:
+    if "tokens" in choice:
+        return "".join(choice["tokens"])
+    if "text" in choice:
+        return choice["text"]
+    if "message" in choice:
+        return choice["message"].get("content", "")
+    if "delta" in choice:
+        return choice["delta"].get("content", "") or ""
+    return ""
+
+
+def extract_output_text(output: Any) -> str:
+    """
+    Pull generated text out of a worker output. Handles worker-vllm style
+    lists of ``{"choices": [{"tokens": [...]}]}`` as well as OpenAI-shaped
+    and plain-string outputs.
+    """
+    if output is None:
+        return ""
+    if isinstance(output, str):
+        return output
+    if isinstance(output, list):
+        return "".join(extract_output_text(item) for item in output)
+    if isinstance(output, dict):
+        if "choices" in output:
+            return "".join(_choice_text(choice) for choice in output["choices"])
+        for key in ("text", "output", "generated_text"):
+            if key in output:
+                return extract_output_text(output[key])
+    return ""
+
+
+def extract_output_usage(output: Any) -> Dict[str, int]:
+    items = output if isinstance(output, list) else [output]
+    input_tokens = output_tokens = 0
+    for item in items:
+        usage = item.get("usage", {}) if isinstance(item, dict) else {}
+        input_tokens += usage.get("input", usage.get("prompt_tokens", 0)) or 0
+        output_tokens += usage.get("output", usage.get("completion_tokens", 0)) or 0
+    return {"prompt_tokens": input_tokens, "completion_tokens": output_tokens}
+
+
+class RunPodServerlessClient:
+    def __init__(self, api_key: str, endpoint_url: str, endpoint_id: str):
+        if not endpoint_id:
+            raise RunPodJobError("RUNPOD_ENDPOINT_ID is required for RUNPOD_MODE=serverless")
+        self.api_key = api_key
+        self.endpoint_id = endpoint_id
+        self.base_url = f"{runpod_base_url(endpoint_url)}/v2/{endpoint_id}"
+        self.client = get_runpod_client()
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    async def submit(self, job_input: Dict[str, Any]) -> str:
+        response = await self.client.post(f"{self.base_url}/run", headers=self.headers, json={"input": job_input})
+        response.raise_for_status()
+        return response.json()["id"]
+
+    async def status(self, job_id: str) -> Dict[str, Any]:
+        response = await self.client.get(f"{self.base_url}/status/{job_id}", headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+    async def cancel(self, job_id: str) -> None:
+        try:
+            await self.client.post(f"{self.base_url}/cancel/{job_id}", headers=self.headers)
+        except httpx.HTTPError as e:
+            logger.warning("RunPod job cancel failed", job_id=job_id, error=str(e))
+
+    async def health(self) -> Dict[str, Any]:
+        response = await self.client.get(f"{self.base_url}/health", headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+    def record_delay(self, job: Dict[str, Any]) -> None:
+        """Record queue delay (reported in ms) and classify cold starts"""
+        delay_ms = job.get("delayTime")
+        if delay_ms is None:
+            return
+        delay = delay_ms / 1000.0
+        runpod_queue_delay.labels(endpoint=self.endpoint_id).observe(delay)
+        if delay >= RUNPOD_COLD_START_THRESHOLD:
+            runpod_cold_start.labels(endpoint=self.endpoint_id).observe(delay)
+            runpod_cold_starts_total.labels(endpoint=self.endpoint_id).inc()
+            logger.info("RunPod cold start", endpoint=self.endpoint_id, delay=delay)
+
+    async def run(self, job_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Submit a job and poll /status until it reaches a terminal state"""
+        job_id = await self.submit(job_input)
+        deadline = time.monotonic() + RUNPOD_JOB_TIMEOUT
+        try:
+            while True:
+                job = await self.status(job_id)
+                if job["status"] in TERMINAL_STATUSES:
+                    break
+                if time.monotonic() > deadline:
+                    raise RunPodJobError(f"RunPod job {job_id} timed out after {RUNPOD_JOB_TIMEOUT}s")
+                await asyncio.sleep(RUNPOD_POLL_INTERVAL)
+        except (asyncio.CancelledError, RunPodJobError):
+            await self.cancel(job_id)
+            raise
+
+        self.record_delay(job)
+        if job["status"] != "COMPLETED":
+            raise RunPodJobError(f"RunPod job {job_id} {job['status']}: {job.get('error', '')}")
+        return job
+
+    @staticmethod
+    def _stream_finished(job_id: str, data: Dict[str, Any], deadline: float) -> bool:
+        """Whether a /stream poll reports the job done; raises if it failed or timed out"""
+        if data.get("status") in TERMINAL_STATUSES:
+            if data["status"] != "COMPLETED":
+                raise RunPodJobError(f"RunPod job {job_id} {data['status']}")
+            return True
+        if time.monotonic() > deadline:
+            raise RunPodJobError(f"RunPod job {job_id} timed out after {RUNPOD_JOB_TIMEOUT}s")
+        return False
+
+    async def stream(self, job_input: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """Submit a streaming job and yield text increments from /stream"""
+        job_id = await self.submit({**job_input, "stream": True})
+        deadline = time.monotonic() + RUNPOD_JOB_TIMEOUT
+        try:
+            while True:
+                response = await self.client.get(f"{self.base_url}/stream/{job_id}", headers=self.headers)
+                response.raise_for_status()
+                data = response.json()
+                for item in data.get("stream", []):
+                    text = extract_output_text(item.get("output"))
+                    if text:
+                        yield text
+                if self._stream_finished(job_id, data, deadline):
+                    break
+                await asyncio.sleep(RUNPOD_POLL_INTERVAL)
+        except (asyncio.CancelledError, RunPodJobError):
+            await self.cancel(job_id)
+            raise
+
+        # /stream does not carry delayTime - the final status does
+        try:
+            self.record_delay(await self.status(job_id))
+        except httpx.HTTPError:
+            pass
+
+
+class RunPodKeepalive:
+    """Background task that keeps at least one worker of each endpoint warm"""
+
+    def __init__(self, endpoint_ids: List[str] = RUNPOD_KEEPALIVE_ENDPOINTS,
+                 interval: float = RUNPOD_KEEPALIVE_INTERVAL):
+        self.endpoint_ids = endpoint_ids
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        api_key = os.getenv("RUNPOD_API_KEY")
+        if self.interval <= 0 or not self.endpoint_ids or not api_key:
+            return
+        self._task = asyncio.create_task(self._run(api_key))
+        logger.info("RunPod keepalive started", endpoints=self.endpoint_ids, interval=self.interval)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self, api_key: str) -> None:
+        while True:
+            for endpoint_id in self.endpoint_ids:
+                await self.ping(api_key, endpoint_id)
+            await asyncio.sleep(self.interval)
+
+    async def ping(self, api_key: str, endpoint_id: str) -> None:
+        client = RunPodServerlessClient(api_key, RUNPOD_ENDPOINT_URL, endpoint_id)
+        try:
+            workers = (await client.health()).get("workers", {})
+            if workers.get("idle", 0) + workers.get("running", 0) > 0:
+                runpod_keepalive_total.labels(endpoint=endpoint_id, outcome="warm").inc()
+                return
+            # No ready worker: a minimal job makes RunPod spin one up
+            await client.submit({"prompt": "ping", "sampling_params": {"max_tokens": 1}})
+            runpod_keepalive_total.labels(endpoint=endpoint_id, outcome="warmed").inc()
+            logger.info("RunPod keepalive warm-up job submitted", endpoint=endpoint_id)
+        except httpx.HTTPError as e:
+            runpod_keepalive_total.labels(endpoint=endpoint_id, outcome="error").inc()
+            logger.warning("RunPod keepalive failed", endpoint=endpoint_id, error=str(e))
+
+
+runpod_keepalive = RunPodKeepalive()
@@ -0,0 +1,116 @@
+"""
+Local stand-in for the RunPod serverless job API
+
+Enabled with RUNPOD_STANDIN_ENABLED=true. Simulates a scale-to-zero
+endpoint: when no job arrived for RUNPOD_STANDIN_IDLE_TIMEOUT seconds the
+worker is cold, and the next job waits RUNPOD_STANDIN_COLD_START seconds in
+the queue before it runs. Jobs echo the last user message word by word.
+"""
+import os
+import time
+import uuid
+from typing import Any, Dict
+
+from fastapi import FastAPI, HTTPException
+
+STANDIN_BASE_URL = "http://runpod-standin"
+RUNPOD_STANDIN_COLD_START = float(os.getenv("RUNPOD_STANDIN_COLD_START", "8"))
+RUNPOD_STANDIN_IDLE_TIMEOUT = float(os.getenv("RUNPOD_STANDIN_IDLE_TIMEOUT", "60"))
+RUNPOD_STANDIN_EXECUTION_TIME = float(os.getenv("RUNPOD_STANDIN_EXECUTION_TIME", "0.5"))
+
+standin_app = FastAPI(title="RunPod Serverless Stand-in")
+
+_jobs: Dict[str, Dict[str, Any]] = {}
+_warm_until: Dict[str, float] = {}
+
+
+def _output_tokens(job_input: Dict[str, Any]) -> list:
+    messages = job_input.get("messages") or []
+    user_messages = [m["content"] for m in messages if m.get("role") == "user"]
+    text = user_messages[-1] if user_messages else job_input.get("prompt", "")
+    return [f"{word} " for word in f"[standin] {text}".split()]
+
+
+def _job_view(job_id: str) -> Dict[str, Any]:
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    now = time.time()
+    if job["cancelled"]:
+        return {"id": job_id, "status": "CANCELLED"}
+    if now < job["starts_at"]:
+        return {"id": job_id, "status": "IN_QUEUE"}
+    if now < job["ends_at"]:
+        return {"id": job_id, "status": "IN_PROGRESS"}
+    tokens = job["tokens"]
+    return {
+        "id": job_id,
+        "status": "COMPLETED",
+        "delayTime": int((job["starts_at"] - job["submitted_at"]) * 1000),
+        "executionTime": int((job["ends_at"] - job["starts_at"]) * 1000),
+        "output": [{
+            "choices": [{"tokens": tokens}],
+            "usage": {"input": len(job["input"].get("messages") or []), "output": len(tokens)},
+        }],
+    }
+
+
+@standin_app.post("/v2/{endpoint_id}/run")
+async def run(endpoint_id: str, payload: Dict[str, Any]):
+    now = time.time()
+    cold = now > _warm_until.get(endpoint_id, 0.0)
+    starts_at = now + (RUNPOD_STANDIN_COLD_START if cold else 0.05)
+    ends_at = starts_at + RUNPOD_STANDIN_EXECUTION_TIME
+    _warm_until[endpoint_id] = ends_at + RUNPOD_STANDIN_IDLE_TIMEOUT
+
+    job_id = f"standin-{uuid.uuid4().hex}"
+    _jobs[job_id] = {
+        "input": payload.get("input", {}),
+        "tokens": _output_tokens(payload.get("input", {})),
+        "submitted_at": now,
+        "starts_at": starts_at,
+        "ends_at": ends_at,
+        "streamed": 0,
+        "cancelled": False,
+    }
+    return {"id": job_id, "status": "IN_QUEUE"}
+
+
+@standin_app.get("/v2/{endpoint_id}/status/{job_id}")
+async def job_status(endpoint_id: str, job_id: str):
+    return _job_view(job_id)
+
+
+@standin_app.get("/v2/{endpoint_id}/stream/{job_id}")
+async def job_stream(endpoint_id: str, job_id: str):
+    view = _job_view(job_id)
+    job = _jobs[job_id]
+    if view["status"] in ("IN_QUEUE", "CANCELLED"):
+        return {"status": view["status"], "stream": []}
+
+    # Release tokens proportionally to elapsed execution time
+    duration = max(job["ends_at"] - job["starts_at"], 1e-6)
+    progress = min(1.0, (time.time() - job["starts_at"]) / duration)
+    available = int(len(job["tokens"]) * progress)
+    chunk = job["tokens"][job["streamed"]:available]
+    job["streamed"] = max(job["streamed"], available)
+    return {
+        "status": view["status"],
+        "stream": [{"output": {"choices": [{"tokens": chunk}]}}] if chunk else [],
+    }
+
+
+@standin_app.post("/v2/{endpoint_id}/cancel/{job_id}")
+async def cancel(endpoint_id: str, job_id: str):
+    if job_id in _jobs:
+        _jobs[job_id]["cancelled"] = True
+    return {"id": job_id, "status": "CANCELLED"}
+
+
+@standin_app.get("/v2/{endpoint_id}/health")
+async def health(endpoint_id: str):
+    warm = time.time() < _warm_until.get(endpoint_id, 0.0)
+    return {
+        "jobs": {"inQueue": 0, "inProgress": 0},
+        "workers": {"idle": 1 if warm else 0, "running": 0, "initializing": 0},
+    }
@@ -0,0 +1,9 @@
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Service modules are imported as top-level modules, like uvicorn runs them;
+# the repository root provides the ``shared`` package
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(1, os.path.dirname(SERVICE_DIR))
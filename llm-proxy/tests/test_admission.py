@@ -0,0 +1,33 @@
+import asyncio
+
+from admission import RoutePolicy, _RouteGate
+
+
+def make_gate() -> _RouteGate:
+    return _RouteGate("/test", RoutePolicy(max_in_flight=1, max_queue=4, max_queue_wait=0.05, max_loop_lag=1.0))
+
+
+def test_queue_timeout_and_cancelled_waiters_keep_every_slot():
+    async def scenario():
+        gate = make_gate()
+        assert await gate.acquire(0.0) is None
+
+        assert await gate.acquire(0.0) == "queue_timeout"
+
+        waiter = asyncio.create_task(gate.acquire(0.0))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+
+        gate.release()
+        # The slot is free again: admitted without queueing
+        assert not gate._slots.locked()
+        assert await gate.acquire(0.0) is None
+        assert gate.in_flight == 1
+        assert gate.waiting == 0
+        gate.release()
+
+    asyncio.run(scenario())
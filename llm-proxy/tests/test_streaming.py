@@ -0,0 +1,23 @@
+from fastapi.testclient import TestClient
+
+import main
+
+client = TestClient(main.app)
+
+
+def test_runpod_stream_outside_serverless_mode_is_rejected_before_streaming(monkeypatch):
+    monkeypatch.setattr(main, "RUNPOD_MODE", "openai")
+
+    response = client.post(
+        "/chat/completions",
+        json={
+            "messages": [{"role": "user", "content": "Hello"}],
+            "model": "runpod/llama-2-70b",
+            "provider": "runpod",
+            "stream": True,
+        },
+        headers={"X-RUNPOD-API-KEY": "test-key"},
+    )
+
+    assert response.status_code == 400
+    assert "RUNPOD_MODE=serverless" in response.json()["detail"]
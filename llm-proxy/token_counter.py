@@ -0,0 +1,97 @@
+"""
+Token counting for llm-proxy with cached encoders and a per-message memo
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable, Optional
+
+import tiktoken
+
+TOKEN_MEMO_SIZE = int(os.getenv("TOKEN_MEMO_SIZE", "50000"))
+
+
+@lru_cache(maxsize=64)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """
+    Resolve (and cache) the tiktoken encoding for a model.
+
+    Returns None for models tiktoken does not know, so callers can fall back
+    to the rough word-based estimate.
+    """
+    try:
+        return tiktoken.encoding_for_model(model.split("/")[-1])
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough fallback estimate for unknown tokenizers"""
+    return int(len(text.split()) * 1.3)
+
+
+class TokenCounter:
+    """
+    LRU memo of token counts keyed by a hash of model and content.
+
+    Conversations grow by one or two messages per turn, so memoizing per
+    message makes counting a whole history cost O(new messages) instead of
+    re-encoding everything on every request.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_MEMO_SIZE):
+        self.max_entries = max_entries
+        self._memo: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(model: str, text: str) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+        return digest.digest()
+
+    def count(self, text: str, model: str) -> int:
+        """Count tokens of a single text, using the memo where possible"""
+        key = self._key(model, text)
+        with self._lock:
+            cached = self._memo.get(key)
+            if cached is not None:
+                self._memo.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        encoding = get_encoding(model)
+        if encoding is not None:
+            tokens = len(encoding.encode(text))
+        else:
+            tokens = estimate_tokens(text)
+
+        with self._lock:
+            self._memo[key] = tokens
+            if len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return tokens
+
+    def count_messages(self, contents: Iterable[str], model: str) -> int:
+        """Sum of per-message token counts for a conversation"""
+        return sum(self.count(content, model) for content in contents)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._memo),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+token_counter = TokenCounter()
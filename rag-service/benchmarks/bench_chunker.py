@@ -0,0 +1,102 @@
+"""
+Chunker throughput and chunk-size spread on multi-MB documents
+
+Compares the previous character-based splitter (CHUNK_SIZE=1000,
+CHUNK_OVERLAP=200) with the token-aware streaming chunker. Reports MB/s and
+the token counts per chunk (min/mean/max/stdev) measured with the embedding
+model's tokenizer.
+
+Usage (from rag-service/):
+
+    python benchmarks/bench_chunker.py --size-mb 8
+    python benchmarks/bench_chunker.py --file path/to/document.txt
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from text_chunker import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, get_encoding, iter_token_chunks  # noqa: E402
+
+WORDS = ("retrieval", "vector", "embedding", "the", "of", "and", "Qdrant", "token", "chunk", "1024",
+         "Größe", "naïve", "façade", "数据", "model", "latency", "-", "(see", "above)", "x86_64")
+
+
+def synthetic_document(size_mb: float) -> str:
+    rng = random.Random(0)
+    parts, size = [], 0
+    while size < size_mb * 1024 * 1024:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))) + ". "
+        if rng.random() < 0.15:
+            sentence += "\n\n" if rng.random() < 0.5 else "\n"
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def char_split(text: str, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """The previous split_text"""
+    if len(text) <= chunk_size:
+        return [text]
+    chunks = []
+    start = 0
+    separators = ['\n\n', '\n', '. ', ' ', '']
+    while start < len(text):
+        end = start + chunk_size
+        if end >= len(text):
+            chunks.append(text[start:])
+            break
+        chunk_end = end
+        for separator in separators:
+            if separator == '':
+                chunk_end = end
+                break
+            search_start = end - int(chunk_size * 0.2)
+            sep_pos = text.rfind(separator, search_start, end)
+            if sep_pos != -1:
+                chunk_end = sep_pos + len(separator)
+                break
+        chunks.append(text[start:chunk_end].strip())
+        start = max(start + 1, chunk_end - chunk_overlap)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def segments(text: str, size: int = 64 * 1024):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def report(name: str, chunks, elapsed: float, megabytes: float, model: str) -> None:
+    encoding = get_encoding(model)
+    sizes = [len(encoding.encode_ordinary(chunk)) for chunk in chunks]
+    print(f"{name:<10} {megabytes / elapsed:>7.2f} MB/s   {len(chunks):>7} chunks   tokens/chunk "
+          f"min {min(sizes)}  mean {statistics.mean(sizes):.1f}  max {max(sizes)}  stdev {statistics.pstdev(sizes):.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file")
+    parser.add_argument("--size-mb", type=float, default=8.0)
+    parser.add_argument("--model", default="text-embedding-3-small")
+    args = parser.parse_args()
+
+    text = Path(args.file).read_text(encoding="utf-8") if args.file else synthetic_document(args.size_mb)
+    megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+    get_encoding(args.model)  # load the tokenizer outside the timings
+    print(f"{megabytes:.1f} MB, chunk_tokens={CHUNK_TOKENS}, overlap_tokens={CHUNK_OVERLAP_TOKENS}")
+
+    started = time.perf_counter()
+    chunks = char_split(text)
+    report("chars", chunks, time.perf_counter() - started, megabytes, args.model)
+
+    started = time.perf_counter()
+    chunks = list(iter_token_chunks(segments(text), args.model))
+    report("tokens", chunks, time.perf_counter() - started, megabytes, args.model)
+
+
+if __name__ == "__main__":
+    main()
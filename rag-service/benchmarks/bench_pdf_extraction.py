@@ -0,0 +1,64 @@
+"""
+PDF text extraction throughput in pages/sec
+
+Compares the previous extraction (one thread, ``text += page``) with the
+process-pool extraction of pdf_extraction for several worker counts.
+
+Usage (from rag-service/):
+
+    python benchmarks/bench_pdf_extraction.py path/to/large.pdf --workers 0,2,4,8 --pages-per-task 16
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import PyPDF2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pdf_extraction import count_pages, iter_pdf_text  # noqa: E402
+
+
+def extract_sequential(path: str) -> str:
+    text = ""
+    with open(path, "rb") as file:
+        for page in PyPDF2.PdfReader(file).pages:
+            text += page.extract_text() + "\n"
+    return text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf")
+    parser.add_argument("--workers", default="0,2,4,8", help="comma-separated worker counts (0 = no pool)")
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    pages = count_pages(args.pdf)
+    print(f"{args.pdf}: {pages} pages")
+
+    started = time.perf_counter()
+    expected = extract_sequential(args.pdf)
+    elapsed = time.perf_counter() - started
+    print(f"{'sequential':<14} {pages / elapsed:>9.1f} pages/s   {elapsed:>7.2f} s")
+
+    for workers in (int(w) for w in args.workers.split(",")):
+        pool = None
+        if workers > 0:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            # Don't count process start-up
+            list(pool.map(abs, range(workers)))
+        started = time.perf_counter()
+        text = "".join(iter_pdf_text(args.pdf, workers=workers, pages_per_task=args.pages_per_task, pool=pool))
+        elapsed = time.perf_counter() - started
+        if pool is not None:
+            pool.shutdown()
+        match = "ok" if text == expected else "MISMATCH"
+        print(f"{f'pool x{workers}':<14} {pages / elapsed:>9.1f} pages/s   {elapsed:>7.2f} s   {match}")
+
+
+if __name__ == "__main__":
+    main()
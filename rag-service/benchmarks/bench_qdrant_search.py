@@ -0,0 +1,105 @@
+"""
+Concurrent Qdrant search throughput: blocking client vs AsyncQdrantClient
+
+Simulates the rag-service pattern of N concurrent requests issuing searches
+from ``async def`` handlers. The "sync" mode calls QdrantClient directly from
+coroutines (blocks the event loop, as rag-service did before), the "async"
+modes use AsyncQdrantClient over HTTP and gRPC.
+
+Usage (against a running Qdrant, e.g. docker compose up vectordb):
+
+    python benchmarks/bench_qdrant_search.py --host localhost --points 20000 --concurrency 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+
+def seed_collection(client: QdrantClient, name: str, points: int, dim: int) -> None:
+    client.recreate_collection(name, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
+    rng = np.random.default_rng(0)
+    for start in range(0, points, 1000):
+        vectors = rng.random((min(1000, points - start), dim), dtype=np.float32)
+        client.upsert(
+            name,
+            points=[PointStruct(id=start + i, vector=vector.tolist(), payload={"i": start + i})
+                    for i, vector in enumerate(vectors)],
+            wait=True,
+        )
+
+
+async def run_sync_client(client: QdrantClient, name: str, queries, concurrency: int):
+    latencies = []
+
+    async def worker(worker_queries):
+        for query in worker_queries:
+            started = time.perf_counter()
+            client.search(name, query_vector=query, limit=10)  # blocks the loop
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker(queries[i::concurrency]) for i in range(concurrency)))
+    return latencies
+
+
+async def run_async_client(client: AsyncQdrantClient, name: str, queries, concurrency: int):
+    latencies = []
+
+    async def worker(worker_queries):
+        for query in worker_queries:
+            started = time.perf_counter()
+            await client.search(name, query_vector=query, limit=10)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(worker(queries[i::concurrency]) for i in range(concurrency)))
+    return latencies
+
+
+def report(mode: str, latencies, elapsed: float) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{mode:<12} {len(latencies) / elapsed:>10.1f} q/s   "
+          f"p50 {statistics.median(latencies) * 1000:>7.1f} ms   p95 {p95 * 1000:>7.1f} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--grpc-port", type=int, default=6334)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    sync_client = QdrantClient(host=args.host, port=args.port)
+    print(f"Seeding {args.points} points ({args.dim} dims) into {name}...")
+    seed_collection(sync_client, name, args.points, args.dim)
+    queries = np.random.default_rng(1).random((args.queries, args.dim), dtype=np.float32).tolist()
+
+    try:
+        started = time.perf_counter()
+        latencies = await run_sync_client(sync_client, name, queries, args.concurrency)
+        report("sync", latencies, time.perf_counter() - started)
+
+        for mode, prefer_grpc in (("async-http", False), ("async-grpc", True)):
+            client = AsyncQdrantClient(host=args.host, port=args.port, grpc_port=args.grpc_port,
+                                       prefer_grpc=prefer_grpc)
+            started = time.perf_counter()
+            latencies = await run_async_client(client, name, queries, args.concurrency)
+            report(mode, latencies, time.perf_counter() - started)
+            await client.close()
+    finally:
+        sync_client.delete_collection(name)
+        sync_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
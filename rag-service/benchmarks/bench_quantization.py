@@ -0,0 +1,138 @@
+"""
+Recall and latency of quantized and shortened vectors in Qdrant
+
+Seeds one collection per storage layout - float32, float16, int8 scalar and
+binary quantization, and shortened (Matryoshka) embeddings - and searches each
+with and without oversampling + rescoring on the original vectors. Recall@k
+is measured against exact float32 cosine search over the full-dimension
+vectors (numpy), so shortened layouts show their quality loss too.
+
+Synthetic vectors are not Matryoshka-trained, so their shortened recall is a
+lower bound; pass real embeddings (.npy, one row per chunk) for meaningful
+numbers.
+
+Usage (against a running Qdrant, e.g. docker compose up vectordb):
+
+    python benchmarks/bench_quantization.py --host localhost --points 20000
+    python benchmarks/bench_quantization.py --vectors embeddings.npy --dims 512 256 --oversampling 3
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+QUANTIZATION = {
+    "none": None,
+    "scalar": models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+        type=models.ScalarType.INT8, quantile=0.99, always_ram=True)),
+    "binary": models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True)),
+}
+
+# Bytes per dimension kept in RAM for the search: originals or their quantized copy
+RAM_BYTES_PER_DIM = {"float32": 4, "float16": 2, "scalar": 1, "binary": 1 / 8}
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+        return normalize(vectors[:args.points + args.queries])
+    # Clustered, zero-mean vectors - closer to real embeddings than uniform noise
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((64, args.dim), dtype=np.float32)
+    labels = rng.integers(0, len(centers), args.points + args.queries)
+    noise = rng.standard_normal((len(labels), args.dim), dtype=np.float32)
+    return normalize(centers[labels] + 1.5 * noise)
+
+
+def seed_collection(client: QdrantClient, name: str, vectors: np.ndarray, datatype: str, quantization: str) -> None:
+    client.create_collection(
+        name,
+        vectors_config=models.VectorParams(size=vectors.shape[1], distance=models.Distance.COSINE,
+                                           datatype=models.Datatype(datatype), on_disk=quantization != "none"),
+        quantization_config=QUANTIZATION[quantization],
+    )
+    for start in range(0, len(vectors), 1000):
+        batch = vectors[start:start + 1000]
+        client.upsert(name, points=models.Batch(ids=list(range(start, start + len(batch))), vectors=batch.tolist()),
+                      wait=True)
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        time.sleep(0.5)
+
+
+def run_queries(client: QdrantClient, name: str, queries: np.ndarray, k: int, params):
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        points = client.search(name, query_vector=query.tolist(), limit=k, search_params=params)
+        latencies.append(time.perf_counter() - started)
+        results.append([point.id for point in points])
+    return results, latencies
+
+
+def report(label: str, results, truth: np.ndarray, latencies, bytes_per_vector: float) -> None:
+    k = truth.shape[1]
+    recall = statistics.mean(len(set(found) & set(expected)) / k for found, expected in zip(results, truth.tolist()))
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<34} recall@{k} {recall:6.3f}   p50 {statistics.median(latencies) * 1000:6.2f} ms   "
+          f"p95 {p95 * 1000:6.2f} ms   {bytes_per_vector:7.0f} B/vector in RAM")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--vectors", help=".npy file of embeddings (default: synthetic)")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536, help="dimension of synthetic vectors")
+    parser.add_argument("--dims", type=int, nargs="*", default=[768, 512], help="shortened dimensions to test")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    points, queries = vectors[:-args.queries], vectors[-args.queries:]
+    truth = np.argsort(-(queries @ points.T), axis=1)[:, :args.k]  # exact float32 search, full dimension
+    full_dim = points.shape[1]
+
+    layouts = [("float32", "none", full_dim), ("float16", "none", full_dim),
+               ("float32", "scalar", full_dim), ("float32", "binary", full_dim)]
+    layouts += [("float32", "none", dim) for dim in args.dims if dim < full_dim]
+    layouts += [("float32", "scalar", dim) for dim in args.dims if dim < full_dim]
+
+    client = QdrantClient(host=args.host, port=args.port)
+    print(f"{len(points)} points, {len(queries)} queries, {full_dim} dims")
+    for datatype, quantization, dim in layouts:
+        name = f"bench_{uuid.uuid4().hex[:8]}"
+        seed_collection(client, name, normalize(points[:, :dim]), datatype, quantization)
+        shortened = normalize(queries[:, :dim])
+        ram = dim * RAM_BYTES_PER_DIM[datatype if quantization == "none" else quantization]
+        label = f"{datatype} {quantization} {dim}d"
+        try:
+            if quantization == "none":
+                results, latencies = run_queries(client, name, shortened, args.k, None)
+                report(label, results, truth, latencies, ram)
+                continue
+            for rescore in (False, True):
+                params = models.SearchParams(quantization=models.QuantizationSearchParams(
+                    rescore=rescore, oversampling=args.oversampling if rescore else None))
+                results, latencies = run_queries(client, name, shortened, args.k, params)
+                suffix = f" rescore x{args.oversampling:g}" if rescore else ""
+                report(label + suffix, results, truth, latencies, ram)
+        finally:
+            client.delete_collection(name)
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
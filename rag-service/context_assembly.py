@@ -0,0 +1,165 @@
+"""
+RAG context assembly for rag-service
+
+Top results by score are often overlapping neighbour chunks of the same
+document. Before the context is built, candidates are
+
+- reordered by Maximal Marginal Relevance (numpy, one matrix-vector product
+  per pick), trading relevance against similarity to what was already picked
+- merged when adjacent chunks of the same document are both picked, with the
+  chunk overlap written once
+- packed into the token budget as a 0/1 knapsack (numpy DP) over each
+  passage's MMR gain, so a passage that doesn't fit is skipped, not the rest
+
+so the same context budget carries more distinct text.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))  # 1 = relevance only, 0 = diversity only
+
+# Longest chunk overlap looked for when merging neighbours, in characters
+MAX_OVERLAP_CHARS = 4096
+
+# Knapsack table width; larger budgets are packed in steps of budget / KNAPSACK_CELLS tokens
+KNAPSACK_CELLS = 4096
+
+# Value of a passage with no MMR gain left - still packed if there is room
+MIN_PASSAGE_VALUE = 1e-3
+
+
+class ContextPassage(BaseModel):
+    document_id: str
+    title: str
+    chunk_ids: List[str]
+    chunk_indices: List[int]
+    content: str
+    score: float
+    value: float = 0.0  # sum of the MMR gains of its chunks
+    token_count: int = 0
+
+
+def mmr_order(relevance: Sequence[float], vectors: Optional[np.ndarray], lambda_: float = RAG_MMR_LAMBDA,
+              k: Optional[int] = None) -> Tuple[List[int], List[float]]:
+    """
+    Indices of up to ``k`` candidates in MMR order, with the MMR gain of each
+    pick. ``relevance`` is min-max normalized; redundancy is the cosine
+    similarity to the closest pick. Without vectors the relevance order is kept.
+    """
+    raw = np.asarray(relevance, dtype=np.float32)
+    n = len(raw)
+    k = n if k is None else min(k, n)
+    if n == 0:
+        return [], []
+    spread = raw.max() - raw.min()
+    rel = (raw - raw.min()) / spread if spread > 0 else np.ones(n, dtype=np.float32)
+    order: List[int] = []
+    if vectors is None:
+        order = [int(i) for i in np.argsort(-rel, kind="stable")[:k]]
+        return order, [float(rel[i]) for i in order]
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1.0)
+
+    redundancy = np.zeros(n, dtype=np.float32)  # max similarity to any pick so far
+    available = np.ones(n, dtype=bool)
+    gains: List[float] = []
+    for _ in range(k):
+        scores = np.where(available, lambda_ * rel - (1 - lambda_) * redundancy, -np.inf)
+        pick = int(np.argmax(scores))
+        order.append(pick)
+        gains.append(float(scores[pick]))
+        available[pick] = False
+        np.maximum(redundancy, vectors @ vectors[pick], out=redundancy)
+    return order, gains
+
+
+def merge_overlap(first: str, second: str) -> str:
+    """Join consecutive chunks, writing the text they share only once"""
+    probe = second[:32]
+    if probe:
+        # Leftmost match = longest suffix of ``first`` that starts ``second``
+        position = first.find(probe, max(0, len(first) - min(len(second), MAX_OVERLAP_CHARS)))
+        while position != -1:
+            if second.startswith(first[position:]):
+                return first[:position] + second
+            position = first.find(probe, position + 1)
+    return first + "\n" + second
+
+
+def merge_adjacent(results: Sequence[Any], gains: Optional[Sequence[float]] = None) -> List[ContextPassage]:
+    """
+    Merge picked results (``.id``, ``.content``, ``.score``, ``.metadata``)
+    that are consecutive chunks of one document. Passages keep the order of
+    their best ranked chunk; their value is the sum of their chunks' gains.
+    """
+    by_document: Dict[str, List[Any]] = {}
+    for result in results:
+        by_document.setdefault(result.metadata.get("document_id", result.id), []).append(result)
+
+    passages: List[ContextPassage] = []
+    first_rank: List[int] = []
+    rank = {id(result): i for i, result in enumerate(results)}
+    gain = {id(result): max(gains[i] if gains is not None else 1.0, MIN_PASSAGE_VALUE) for i, result in enumerate(results)}
+    for document_id, chunks in by_document.items():
+        chunks.sort(key=lambda result: result.metadata.get("chunk_index", 0))
+        current: Optional[ContextPassage] = None
+        for result in chunks:
+            index = result.metadata.get("chunk_index", 0)
+            if current is not None and index == current.chunk_indices[-1] + 1:
+                current.content = merge_overlap(current.content, result.content)
+                current.chunk_ids.append(str(result.id))
+                current.chunk_indices.append(index)
+                current.score = max(current.score, result.score)
+                current.value += gain[id(result)]
+                first_rank[-1] = min(first_rank[-1], rank[id(result)])
+                continue
+            current = ContextPassage(
+                document_id=document_id,
+                title=result.metadata.get("title", "Unknown"),
+                chunk_ids=[str(result.id)],
+                chunk_indices=[index],
+                content=result.content,
+                score=result.score,
+                value=gain[id(result)],
+            )
+            passages.append(current)
+            first_rank.append(rank[id(result)])
+
+    return [passage for _, passage in sorted(zip(first_rank, passages), key=lambda item: item[0])]
+
+
+def knapsack(weights: Sequence[int], values: Sequence[float], capacity: int) -> List[int]:
+    """
+    Indices (ascending) of the items with the largest total value whose
+    weights sum to at most ``capacity`` - 0/1 knapsack by dynamic programming.
+    Large capacities are coarsened to KNAPSACK_CELLS steps, rounding weights up.
+    """
+    n = len(weights)
+    if n == 0 or capacity <= 0:
+        return []
+    step = -(-capacity // KNAPSACK_CELLS)
+    cells = capacity // step
+    cost = [-(-int(weight) // step) for weight in weights]
+
+    best = np.zeros(cells + 1)  # best[c] = largest value within c cells
+    take = np.zeros((n, cells + 1), dtype=bool)
+    for i in range(n):
+        if cost[i] > cells:
+            continue
+        candidate = np.full(cells + 1, -np.inf)
+        candidate[cost[i]:] = best[:cells + 1 - cost[i]] + values[i]
+        take[i] = candidate > best
+        np.maximum(best, candidate, out=best)
+
+    chosen: List[int] = []
+    c = cells
+    for i in range(n - 1, -1, -1):
+        if take[i, c]:
+            chosen.append(i)
+            c -= cost[i]
+    return chosen[::-1]
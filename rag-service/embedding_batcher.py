@@ -0,0 +1,170 @@
+"""
+Cross-request embedding micro-batcher for rag-service
+
+Small requests (search queries, short documents) that need embeddings at the
+same time are collected for up to EMBEDDING_MICROBATCH_WAIT_MS, or until
+EMBEDDING_MICROBATCH_MAX_ITEMS texts or max_tokens tokens are waiting, and
+sent as one API call; every caller gets its own embeddings back. Under load
+this trades a few milliseconds of latency for far fewer HTTP round trips and
+less rate-limit pressure. EMBEDDING_MICROBATCH_WAIT_MS=0 sends every request
+directly.
+
+Requests with more than EMBEDDING_MICROBATCH_MERGE_MAX_ITEMS texts (ingestion
+batches) are already large and are sent alone, so a query never waits for a
+full ingestion call. If a merged call fails, its requests are retried one by
+one, so one caller's bad input only fails that caller.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from prometheus_client import Counter, Histogram
+
+from logging_config import get_rag_logger
+
+logger = get_rag_logger()
+
+EMBEDDING_MICROBATCH_WAIT_MS = float(os.getenv("EMBEDDING_MICROBATCH_WAIT_MS", "5"))
+EMBEDDING_MICROBATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_MICROBATCH_MAX_ITEMS", "256"))
+EMBEDDING_MICROBATCH_MERGE_MAX_ITEMS = int(os.getenv("EMBEDDING_MICROBATCH_MERGE_MAX_ITEMS", "16"))
+
+embedding_api_calls = Counter(
+    "rag_embedding_api_calls_total",
+    "Embedding API calls sent by the micro-batcher",
+)
+embedding_batch_callers = Histogram(
+    "rag_embedding_batch_callers",
+    "Callers served per embedding API call",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+# Sends texts to the provider; returns a pydantic model with .embeddings, .usage and .cost
+SendFn = Callable[[List[str]], Awaitable[Any]]
+Batch = List[Tuple[List[str], asyncio.Future]]
+
+
+class EmbeddingBatcher:
+    def __init__(self, send_fn: SendFn, tokens_fn: Callable[[str], int], max_tokens: int,
+                 max_wait_ms: float = EMBEDDING_MICROBATCH_WAIT_MS,
+                 max_items: int = EMBEDDING_MICROBATCH_MAX_ITEMS,
+                 merge_max_items: int = EMBEDDING_MICROBATCH_MERGE_MAX_ITEMS):
+        self.send_fn = send_fn
+        self.tokens_fn = tokens_fn
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait_ms / 1000
+        self.max_items = max_items
+        self.merge_max_items = merge_max_items
+        self._pending: Batch = []
+        self._pending_items = 0
+        self._pending_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.api_calls = 0
+
+    async def embed(self, texts: List[str]) -> Any:
+        """Embeddings for ``texts``, sent together with other waiting requests"""
+        self.requests += 1
+        if self.max_wait <= 0 or len(texts) > self.merge_max_items:
+            return await self._send_alone(texts)
+        tokens = sum(self.tokens_fn(text) for text in texts)
+        if tokens > self.max_tokens:
+            return await self._send_alone(texts)
+
+        # Requests that would overflow the batch start a new one
+        if self._pending and (self._pending_items + len(texts) > self.max_items
+                              or self._pending_tokens + tokens > self.max_tokens):
+            self._flush()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((texts, future))
+        self._pending_items += len(texts)
+        self._pending_tokens += tokens
+        if self._pending_items >= self.max_items or self._pending_tokens >= self.max_tokens:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_items, self._pending_tokens = self._pending, [], 0, 0
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_alone(self, texts: List[str]) -> Any:
+        self.api_calls += 1
+        embedding_api_calls.inc()
+        embedding_batch_callers.observe(1)
+        return await self.send_fn(texts)
+
+    async def _send(self, batch: Batch) -> None:
+        texts = list(dict.fromkeys(text for request_texts, _ in batch for text in request_texts))
+        self.api_calls += 1
+        embedding_api_calls.inc()
+        embedding_batch_callers.observe(len(batch))
+        try:
+            response = await self.send_fn(texts)
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            logger.warning("Merged embedding call failed - retrying requests separately",
+                           requests=len(batch), error=str(e))
+            await asyncio.gather(*(self._send_retry(request_texts, future) for request_texts, future in batch))
+            return
+        self._distribute(batch, texts, response)
+
+    async def _send_retry(self, texts: List[str], future: asyncio.Future) -> None:
+        """Resend one request of a failed merged call on its own"""
+        if future.done():
+            return  # caller went away
+        try:
+            response = await self._send_alone(texts)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(response)
+
+    @staticmethod
+    def _distribute(batch: Batch, texts: List[str], response: Any) -> None:
+        """Hand every caller its own embeddings and share of usage and cost"""
+        embeddings = dict(zip(texts, response.embeddings))
+        total_tokens = response.usage.get("total_tokens", 0)
+        total_chars = sum(len(text) for text in texts) or 1
+        billed: Set[str] = set()
+        for request_texts, future in batch:
+            # Cost is split by text length; a text sent for several callers is billed to the first
+            own = set(request_texts) - billed
+            billed |= own
+            share = sum(len(text) for text in own) / total_chars
+            if future.done():
+                continue  # caller went away
+            future.set_result(response.model_copy(update={
+                "embeddings": [embeddings[text] for text in request_texts],
+                "usage": {"total_tokens": round(total_tokens * share), "batched_requests": len(batch)},
+                "cost": response.cost * share,
+            }))
+
+    async def close(self) -> None:
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_wait_ms": self.max_wait * 1000,
+            "max_items": self.max_items,
+            "max_tokens": self.max_tokens,
+            "merge_max_items": self.merge_max_items,
+            "requests": self.requests,
+            "api_calls": self.api_calls,
+            "requests_per_call": round(self.requests / self.api_calls, 2) if self.api_calls else 0.0,
+        }
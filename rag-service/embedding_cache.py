@@ -0,0 +1,293 @@
+"""
+Content-addressed embedding cache for rag-service
+
+Embeddings are keyed by a hash of model and normalized text, so re-uploads,
+near-identical document versions and repeated queries don't re-embed (and
+re-bill) the same text. Two tiers:
+
+- memory:     LRU of float32 arrays, bounded by EMBEDDING_CACHE_MEMORY_MB
+- persistent: SQLite file (EMBEDDING_CACHE_PATH, bounded by
+              EMBEDDING_CACHE_DISK_MB, least recently used rows evicted) or,
+              when EMBEDDING_CACHE_REDIS_URL is set, Redis with a TTL (size is
+              bounded by the server's maxmemory policy)
+
+Vectors are stored as raw float32 bytes (4 bytes per dimension).
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from types import ModuleType
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from prometheus_client import Counter
+
+from logging_config import get_rag_logger
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+aioredis: Optional[ModuleType]
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional dependency
+    aioredis = None
+
+logger = get_rag_logger()
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MEMORY_MB = float(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "64"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/app/data/embedding_cache.sqlite3")
+EMBEDDING_CACHE_DISK_MB = float(os.getenv("EMBEDDING_CACHE_DISK_MB", "1024"))
+EMBEDDING_CACHE_REDIS_URL = os.getenv("EMBEDDING_CACHE_REDIS_URL", "")
+EMBEDDING_CACHE_REDIS_TTL = int(os.getenv("EMBEDDING_CACHE_REDIS_TTL", str(30 * 86400)))
+
+_REDIS_PREFIX = "rag-service:embedding:"
+_WHITESPACE = re.compile(r"\s+")
+
+embedding_cache_lookups = Counter(
+    "rag_embedding_cache_lookups_total",
+    "Embedding cache lookups by result (memory, persistent, miss)",
+    ["result"],
+)
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.blake2b(f"{model}\0{normalize_text(text)}".encode("utf-8"), digest_size=20).hexdigest()
+
+
+class _SQLiteTier:
+    """Blocking SQLite store; called from worker threads"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(time.time(), key) for key, _ in rows],
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        now = time.time()
+        with self._lock:
+            for key, blob in items.items():
+                previous = self._conn.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), now),
+                )
+                self.total_bytes += len(blob) - (previous[0] if previous else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Drop least recently used rows down to 90% of the size limit"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self.total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                victims.append((key,))
+                self.total_bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+            evicted += len(victims)
+        logger.info("Embedding cache evicted", rows=evicted, bytes=self.total_bytes)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    def __init__(self, memory_bytes: int = int(EMBEDDING_CACHE_MEMORY_MB * 1024 * 1024)):
+        self.memory_bytes = memory_bytes
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_used = 0
+        self._sqlite: Optional[_SQLiteTier] = None
+        self._redis: Optional["Redis"] = None
+        self.hits_memory = 0
+        self.hits_persistent = 0
+        self.misses = 0
+
+    async def start(self) -> None:
+        if not EMBEDDING_CACHE_ENABLED:
+            return
+        if EMBEDDING_CACHE_REDIS_URL:
+            if aioredis is None:
+                logger.warning("EMBEDDING_CACHE_REDIS_URL set but redis package missing - using SQLite")
+            else:
+                self._redis = aioredis.from_url(EMBEDDING_CACHE_REDIS_URL)
+                logger.info("Embedding cache using Redis", url=EMBEDDING_CACHE_REDIS_URL)
+                return
+        try:
+            self._sqlite = await asyncio.to_thread(
+                _SQLiteTier, EMBEDDING_CACHE_PATH, int(EMBEDDING_CACHE_DISK_MB * 1024 * 1024)
+            )
+            logger.info("Embedding cache using SQLite", path=EMBEDDING_CACHE_PATH, bytes=self._sqlite.total_bytes)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("Embedding cache file unavailable - memory only", path=EMBEDDING_CACHE_PATH, error=str(e))
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+        if self._sqlite is not None:
+            await asyncio.to_thread(self._sqlite.close)
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_used += vector.nbytes
+        while self._memory_used > self.memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= evicted.nbytes
+
+    async def _persistent_get(self, keys: List[str]) -> Dict[str, bytes]:
+        if self._redis is not None:
+            values = await self._redis.mget([_REDIS_PREFIX + key for key in keys])
+            return {key: value for key, value in zip(keys, values) if isinstance(value, bytes)}
+        if self._sqlite is not None:
+            return await asyncio.to_thread(self._sqlite.get_many, keys)
+        return {}
+
+    async def _persistent_put(self, items: Dict[str, bytes]) -> None:
+        if self._redis is not None:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for key, blob in items.items():
+                    pipe.set(_REDIS_PREFIX + key, blob, ex=EMBEDDING_CACHE_REDIS_TTL)
+                await pipe.execute()
+        elif self._sqlite is not None:
+            await asyncio.to_thread(self._sqlite.put_many, items)
+
+    async def _lookup(self, keys: List[str]) -> Tuple[Dict[str, np.ndarray], Set[str]]:
+        """Vectors found in memory, then in the persistent tier, and the keys not in memory"""
+        vectors: Dict[str, np.ndarray] = {}
+        for key in keys:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                vectors[key] = vector
+
+        missing = set(key for key in keys if key not in vectors)
+        if not missing:
+            return vectors, missing
+        try:
+            stored = await self._persistent_get(list(missing))
+        except Exception as e:
+            logger.warning("Embedding cache read failed", error=str(e))
+            stored = {}
+        for key, blob in stored.items():
+            vector = np.frombuffer(blob, dtype=np.float32)
+            vectors[key] = vector
+            self._remember(key, vector)
+        return vectors, missing
+
+    async def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Cached embeddings in input order, None for misses"""
+        if not EMBEDDING_CACHE_ENABLED:
+            return [None] * len(texts)
+
+        keys = [cache_key(model, text) for text in texts]
+        vectors, missing = await self._lookup(keys)
+
+        results: List[Optional[List[float]]] = []
+        for key in keys:
+            if key in vectors:
+                if key in missing:
+                    self.hits_persistent += 1
+                    embedding_cache_lookups.labels(result="persistent").inc()
+                else:
+                    self.hits_memory += 1
+                    embedding_cache_lookups.labels(result="memory").inc()
+                results.append(vectors[key].tolist())
+            else:
+                self.misses += 1
+                embedding_cache_lookups.labels(result="miss").inc()
+                results.append(None)
+        return results
+
+    async def put_many(self, model: str, texts: Sequence[str], embeddings: Sequence[List[float]]) -> None:
+        if not EMBEDDING_CACHE_ENABLED:
+            return
+        items: Dict[str, bytes] = {}
+        for text, embedding in zip(texts, embeddings):
+            key = cache_key(model, text)
+            vector = np.asarray(embedding, dtype=np.float32)
+            self._remember(key, vector)
+            items[key] = vector.tobytes()
+        try:
+            await self._persistent_put(items)
+        except Exception as e:
+            logger.warning("Embedding cache write failed", error=str(e))
+
+    async def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_persistent + self.misses
+        stats = {
+            "enabled": EMBEDDING_CACHE_ENABLED,
+            "hits_memory": self.hits_memory,
+            "hits_persistent": self.hits_persistent,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_memory + self.hits_persistent) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_used,
+            "persistent": "redis" if self._redis is not None else "sqlite" if self._sqlite is not None else None,
+        }
+        if self._sqlite is not None:
+            stats["persistent_entries"] = await asyncio.to_thread(self._sqlite.count)
+            stats["persistent_bytes"] = self._sqlite.total_bytes
+        return stats
+
+
+embedding_cache = EmbeddingCache()
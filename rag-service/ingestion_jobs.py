@@ -0,0 +1,222 @@
+"""
+Background ingestion jobs for rag-service
+
+Uploads are persisted to INGESTION_STORAGE_DIR and processed by a bounded
+pool of INGESTION_WORKERS workers (extract, chunk, embed, store), so the
+upload request returns a job id immediately. Job state is written to disk
+after every stage and progress step; unfinished jobs are re-queued on
+startup. Resumed jobs skip the chunks before their checkpoint (every chunk
+before it is stored); chunk ids are deterministic and embeddings come from the
+embedding cache, so chunks stored past the checkpoint are overwritten rather
+than duplicated or billed twice.
+"""
+import asyncio
+import os
+import shutil
+import uuid
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, computed_field
+
+from logging_config import get_rag_logger
+
+logger = get_rag_logger()
+
+INGESTION_STORAGE_DIR = os.getenv("INGESTION_STORAGE_DIR", "/app/data/ingestion")
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+
+
+class JobStage(str, Enum):
+    QUEUED = "queued"
+    EXTRACTING = "extracting"
+    CHUNKING = "chunking"
+    EMBEDDING = "embedding"
+    STORING = "storing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+TERMINAL_STAGES = (JobStage.COMPLETED, JobStage.FAILED)
+
+
+class IngestionJob(BaseModel):
+    id: str
+    document_id: str
+    stage: JobStage = JobStage.QUEUED
+    created_at: datetime
+    updated_at: datetime
+    filename: str
+    source_path: str
+    metadata: Dict[str, Any] = Field(default_factory=dict)
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    checkpoint: int = 0  # chunks [0, checkpoint) are stored - the resume point
+    embedding_cost: float = 0.0
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @computed_field  # type: ignore[prop-decorator]  # pydantic documents this pairing
+    @property
+    def progress(self) -> float:
+        return round(self.chunks_embedded / self.chunks_total, 4) if self.chunks_total else 0.0
+
+
+ProcessFn = Callable[[IngestionJob, "IngestionManager"], Awaitable[None]]
+
+
+class IngestionManager:
+    """Owns ingestion jobs: persistence, the worker pool and resume on startup"""
+
+    def __init__(self, process_fn: ProcessFn, storage_dir: str = INGESTION_STORAGE_DIR,
+                 workers: int = INGESTION_WORKERS):
+        self.process_fn = process_fn
+        self.storage_dir = Path(storage_dir)
+        self.workers = workers
+        self.jobs: Dict[str, IngestionJob] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    # ---------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------
+
+    async def start(self) -> None:
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self._load_jobs()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _load_jobs(self) -> None:
+        """Reload persisted jobs and re-queue unfinished ones"""
+        for job_file in self.storage_dir.glob("*/job.json"):
+            try:
+                job = IngestionJob.model_validate_json(job_file.read_text())
+                self.jobs[job.id] = job
+            except Exception as e:
+                logger.error("Failed to load ingestion job", path=str(job_file), error=str(e))
+        resumed = sorted(
+            (job for job in self.jobs.values() if job.stage not in TERMINAL_STAGES),
+            key=lambda job: job.created_at,
+        )
+        for job in resumed:
+            self._queue.put_nowait(job.id)
+        logger.info("Ingestion jobs loaded", total=len(self.jobs), resumed=len(resumed))
+
+    # ---------------------------------------------------
+    # Persistence
+    # ---------------------------------------------------
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self.storage_dir / job_id
+
+    def _save_job(self, job: IngestionJob) -> None:
+        job.updated_at = datetime.utcnow()
+        path = self._job_dir(job.id) / "job.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(job.model_dump_json(indent=2))
+        tmp_path.replace(path)
+
+    def update(self, job: IngestionJob, **changes: Any) -> None:
+        """Apply changes to a job and persist it"""
+        for field, value in changes.items():
+            setattr(job, field, value)
+        self._save_job(job)
+
+    # ---------------------------------------------------
+    # Public API
+    # ---------------------------------------------------
+
+    def new_job_path(self, filename: str) -> Tuple[str, Path]:
+        """Reserve a job id and the path the upload should be written to"""
+        job_id = f"ingest-{uuid.uuid4().hex}"
+        job_dir = self._job_dir(job_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        return job_id, job_dir / f"source{Path(filename).suffix}"
+
+    def create_job(self, job_id: str, document_id: str, filename: str, source_path: Path,
+                   metadata: Dict[str, Any]) -> IngestionJob:
+        now = datetime.utcnow()
+        job = IngestionJob(
+            id=job_id,
+            document_id=document_id,
+            created_at=now,
+            updated_at=now,
+            filename=filename,
+            source_path=str(source_path),
+            metadata=metadata,
+        )
+        self._save_job(job)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job.id)
+        logger.info("Ingestion job created", job_id=job.id, document_id=document_id, queued=self._queue.qsize())
+        return job
+
+    def discard(self, job_id: str) -> None:
+        """Remove a reserved job directory that never became a job"""
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    # ---------------------------------------------------
+    # Background processing
+    # ---------------------------------------------------
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None or job.stage in TERMINAL_STAGES:
+                continue
+            await self._process(job, worker_id)
+
+    async def _process(self, job: IngestionJob, worker_id: int) -> None:
+        # checkpoint is where a retry resumes; the cost billed so far is kept
+        self.update(job, attempts=job.attempts + 1, error=None)
+        logger.info("Ingestion job started", job_id=job.id, worker=worker_id, attempt=job.attempts)
+        try:
+            await self.process_fn(job, self)
+        except asyncio.CancelledError:
+            # Shutdown - the job stays unfinished on disk and resumes on the next start
+            raise
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            if job.attempts < INGESTION_MAX_ATTEMPTS:
+                logger.warning("Ingestion job failed - retrying", job_id=job.id, attempt=job.attempts, error=detail)
+                self.update(job, stage=JobStage.QUEUED, error=detail)
+                self._queue.put_nowait(job.id)
+            else:
+                logger.error("Ingestion job failed", job_id=job.id, attempts=job.attempts, error=detail)
+                self.update(job, stage=JobStage.FAILED, error=detail)
+                self._remove_source(job)
+            return
+
+        self.update(job, stage=JobStage.COMPLETED)
+        self._remove_source(job)
+        logger.info("Ingestion job completed",
+                    job_id=job.id,
+                    chunks=job.chunks_total,
+                    cost=job.embedding_cost,
+                    seconds=(job.updated_at - job.created_at).total_seconds())
+
+    def _remove_source(self, job: IngestionJob) -> None:
+        try:
+            os.unlink(job.source_path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        stages: Dict[str, int] = {}
+        for job in self.jobs.values():
+            stages[job.stage.value] = stages.get(job.stage.value, 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize(), "stages": stages}
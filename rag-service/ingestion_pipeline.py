@@ -0,0 +1,240 @@
+"""
+Staged ingestion pipeline for rag-service
+
+Chunking, embedding and storing run concurrently, connected by bounded
+asyncio queues:
+
+- chunk:  pulls chunks from the (blocking) chunk iterator in a worker thread
+          and groups them into token-bounded embedding batches
+- embed:  ``embed_concurrency`` tasks embed batches as soon as they are queued
+- upsert: writes points to Qdrant in batches of QDRANT_UPSERT_BATCH_SIZE as
+          embeddings arrive
+
+Each queue holds at most PIPELINE_QUEUE_BATCHES batches, so memory stays flat
+for any document size and a slow stage holds back the ones before it; the
+total time approaches that of the slowest stage instead of the sum.
+"""
+import asyncio
+import itertools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from logging_config import get_rag_logger
+
+logger = get_rag_logger()
+
+QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "128"))
+PIPELINE_QUEUE_BATCHES = int(os.getenv("PIPELINE_QUEUE_BATCHES", "8"))
+
+# Chunks pulled from the chunk iterator per hop to the worker thread
+PULL_CHUNKS = 32
+
+# Stage names passed to ``on_stage_done``
+STAGE_CHUNK = "chunk"
+STAGE_EMBED = "embed"
+
+_DONE = None  # end of stream marker
+
+EmbedFn = Callable[[List[str]], Awaitable[Any]]  # returns an object with .embeddings and .cost
+UpsertFn = Callable[[str, List[Any], List[List[float]]], Awaitable[None]]
+
+
+Callback = Optional[Callable[..., None]]
+
+
+class _PipelineRun:
+    """State of one pipeline run: queues, stage tasks, statistics and checkpoint"""
+
+    def __init__(self, pipeline: "IngestionPipeline", chunks: Iterator[Any], collection_name: str,
+                 start_index: int, on_chunks: Callback, on_embedded: Callback, on_stored: Callback,
+                 on_stage_done: Callback):
+        self.pipeline = pipeline
+        self.numbered = enumerate(chunks)
+        self.collection_name = collection_name
+        self.start_index = start_index
+        self.on_chunks = on_chunks
+        self.on_embedded = on_embedded
+        self.on_stored = on_stored
+        self.on_stage_done = on_stage_done
+        self.embed_queue: "asyncio.Queue[Optional[List[Tuple[int, Any]]]]" = asyncio.Queue(maxsize=pipeline.queue_batches)
+        self.upsert_queue: "asyncio.Queue[Optional[List[Tuple[int, Any, List[float]]]]]" = asyncio.Queue(maxsize=pipeline.queue_batches)
+        self.stats: Dict[str, Any] = {
+            "chunks": 0, "embedded": 0, "stored": 0, "cost": 0.0,
+            "embed_batches": 0, "upsert_batches": 0,
+            "chunk_seconds": 0.0, "embed_seconds": 0.0, "upsert_seconds": 0.0,
+        }
+        self.idle_embedders = pipeline.embed_concurrency
+        # Batch being grouped by the chunk stage
+        self.batch: List[Tuple[int, Any]] = []
+        self.batch_tokens = 0
+        # Every chunk before ``checkpoint`` is stored; ``stored_indices`` holds those stored past it
+        self.checkpoint = start_index
+        self.stored_indices: Set[int] = set()
+
+    async def run(self) -> Dict[str, Any]:
+        tasks = [asyncio.create_task(self.chunk_stage())]
+        tasks += [asyncio.create_task(self.embed_stage()) for _ in range(self.pipeline.embed_concurrency)]
+        tasks.append(asyncio.create_task(self.upsert_stage()))
+        try:
+            # The first failing stage fails the run; the others are cancelled below
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.stats
+
+    # ---------------------------------------------------
+    # Chunk stage
+    # ---------------------------------------------------
+
+    def pull(self) -> List[Tuple[int, Any, int]]:
+        # Runs in a worker thread - extraction and chunking happen here
+        return [
+            (index, chunk, self.pipeline.chunk_tokens_fn(chunk) if index >= self.start_index else 0)
+            for index, chunk in itertools.islice(self.numbered, PULL_CHUNKS)
+        ]
+
+    async def send_batch(self) -> None:
+        await self.embed_queue.put(self.batch)
+        self.batch, self.batch_tokens = [], 0
+
+    async def add_chunks(self, pulled: List[Tuple[int, Any, int]]) -> None:
+        """Group pulled chunks into embedding batches bounded by tokens and items"""
+        for index, chunk, tokens in pulled:
+            if index < self.start_index:
+                continue
+            if self.batch and (self.batch_tokens + tokens > self.pipeline.max_batch_tokens
+                               or len(self.batch) >= self.pipeline.max_batch_items):
+                await self.send_batch()
+            self.batch.append((index, chunk))
+            self.batch_tokens += tokens
+        # Don't let an embedder wait for a full batch
+        if self.batch and self.idle_embedders and self.embed_queue.empty():
+            await self.send_batch()
+
+    async def chunk_stage(self) -> None:
+        while True:
+            started = time.perf_counter()
+            pulled = await asyncio.to_thread(self.pull)
+            self.stats["chunk_seconds"] += time.perf_counter() - started
+            if not pulled:
+                break
+            self.stats["chunks"] += len(pulled)
+            if self.on_chunks is not None:
+                self.on_chunks(len(pulled))
+            await self.add_chunks(pulled)
+        if self.batch:
+            await self.send_batch()
+        for _ in range(self.pipeline.embed_concurrency):
+            await self.embed_queue.put(_DONE)
+        if self.on_stage_done is not None:
+            self.on_stage_done(STAGE_CHUNK)
+
+    # ---------------------------------------------------
+    # Embed stage
+    # ---------------------------------------------------
+
+    async def embed_stage(self) -> None:
+        while True:
+            batch = await self.embed_queue.get()
+            if batch is _DONE:
+                break
+            self.idle_embedders -= 1
+            started = time.perf_counter()
+            result = await self.pipeline.embed_fn([chunk.content for _, chunk in batch])
+            self.stats["embed_seconds"] += time.perf_counter() - started
+            self.stats["embedded"] += len(batch)
+            self.stats["embed_batches"] += 1
+            self.stats["cost"] += result.cost
+            if self.on_embedded is not None:
+                self.on_embedded(len(batch), result.cost)
+            await self.upsert_queue.put([(index, chunk, embedding) for (index, chunk), embedding in zip(batch, result.embeddings)])
+            self.idle_embedders += 1
+        await self.upsert_queue.put(_DONE)
+
+    # ---------------------------------------------------
+    # Upsert stage
+    # ---------------------------------------------------
+
+    async def flush(self, points: Sequence[Tuple[int, Any, List[float]]]) -> None:
+        started = time.perf_counter()
+        await self.pipeline.upsert_fn(self.collection_name, [chunk for _, chunk, _ in points],
+                                      [embedding for _, _, embedding in points])
+        self.stats["upsert_seconds"] += time.perf_counter() - started
+        self.stats["stored"] += len(points)
+        self.stats["upsert_batches"] += 1
+        self.advance_checkpoint(index for index, _, _ in points)
+        if self.on_stored is not None:
+            self.on_stored(len(points), self.checkpoint)
+
+    def advance_checkpoint(self, indices: Iterable[int]) -> None:
+        # Batches finish out of order - the checkpoint only moves past a contiguous prefix
+        self.stored_indices.update(indices)
+        while self.checkpoint in self.stored_indices:
+            self.stored_indices.remove(self.checkpoint)
+            self.checkpoint += 1
+
+    async def upsert_stage(self) -> None:
+        size = self.pipeline.upsert_batch_size
+        pending: List[Tuple[int, Any, List[float]]] = []
+        finished = 0
+        while finished < self.pipeline.embed_concurrency:
+            item = await self.upsert_queue.get()
+            if item is _DONE:
+                finished += 1
+                continue
+            pending.extend(item)
+            while len(pending) >= size:
+                await self.flush(pending[:size])
+                pending = pending[size:]
+        if self.on_stage_done is not None:
+            self.on_stage_done(STAGE_EMBED)
+        if pending:
+            await self.flush(pending)
+
+
+class IngestionPipeline:
+    """
+    Embeds and stores a stream of document chunks (objects with ``.content``);
+    ``chunk_tokens_fn`` gives a chunk's size in embedding model tokens.
+    """
+
+    def __init__(self, embed_fn: EmbedFn, upsert_fn: UpsertFn, chunk_tokens_fn: Callable[[Any], int],
+                 max_batch_tokens: int, max_batch_items: int, embed_concurrency: int,
+                 upsert_batch_size: int = QDRANT_UPSERT_BATCH_SIZE,
+                 queue_batches: int = PIPELINE_QUEUE_BATCHES):
+        self.embed_fn = embed_fn
+        self.upsert_fn = upsert_fn
+        self.chunk_tokens_fn = chunk_tokens_fn
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.upsert_batch_size = max(1, upsert_batch_size)
+        self.queue_batches = queue_batches
+
+    async def run(
+        self,
+        chunks: Iterator[Any],
+        collection_name: str,
+        start_index: int = 0,
+        on_chunks: Optional[Callable[[int], None]] = None,
+        on_embedded: Optional[Callable[[int, float], None]] = None,
+        on_stored: Optional[Callable[[int, int], None]] = None,
+        on_stage_done: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Embed and store all chunks, skipping the first ``start_index``.
+
+        Callbacks report progress: ``on_chunks(count)`` for chunks read,
+        ``on_embedded(count, cost)`` per embedding batch, ``on_stored(count,
+        checkpoint)`` per upsert, where every chunk before ``checkpoint`` is
+        stored (batches finish out of order), and ``on_stage_done(stage)``.
+        """
+        started = time.perf_counter()
+        stats = await _PipelineRun(self, chunks, collection_name, start_index,
+                                   on_chunks, on_embedded, on_stored, on_stage_done).run()
+        stats["seconds"] = time.perf_counter() - started
+        logger.info("Ingestion pipeline finished", collection=collection_name, skipped=min(start_index, stats["chunks"]), **stats)
+        return stats
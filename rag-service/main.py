@@ -1,30 +1,40 @@
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, status
+from fastapi.responses import Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Iterable, Iterator, Set, Tuple, Type, TypeVar
 from datetime import datetime
 import uuid
 import asyncio
+import hashlib
 import structlog
 from pathlib import Path
-import tempfile
 import os
 from io import BytesIO
 import mimetypes
 import httpx
 import json
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 # Vector Database und ML
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import PointStruct
 from qdrant_client.http import models
 import numpy as np
 
-# PDF Processing
-import PyPDF2
-
 # Lokale Imports
 from logging_config import setup_logging, get_rag_logger
+from shared.http_timing import ServerTimingMiddleware, timing_event_hooks
+from embedding_cache import embedding_cache
+from embedding_batcher import EmbeddingBatcher
+from ingestion_jobs import IngestionJob, IngestionManager, JobStage
+from ingestion_pipeline import STAGE_CHUNK, IngestionPipeline
+from pdf_extraction import PDF_WORKERS, iter_pdf_text, shutdown_pool as shutdown_pdf_pool
+from text_chunker import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, count_tokens, encoding_name, iter_token_chunks
+from sparse_vectors import SPARSE_VECTOR_NAME, document_weights, rrf_fuse, term_stats
+from context_assembly import RAG_MMR_LAMBDA, knapsack, merge_adjacent, mmr_order
+from result_cache import result_cache
+from qdrant_collections import ensure_collection, search_params
 
 # Logging konfigurieren
 setup_logging("rag-service")
@@ -36,6 +46,9 @@ app = FastAPI(
     description="Retrieval-Augmented Generation Service für LLM-Frontend (API-basiert)"
 )
 
+# Upstream phase timings per request (optional Server-Timing header)
+app.add_middleware(ServerTimingMiddleware)
+
 # Security
 security = HTTPBearer()
 
@@ -47,6 +60,8 @@ security = HTTPBearer()
 QDRANT_HOST = os.getenv("QDRANT_HOST", "qdrant")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
 
 # Embedding API Configuration
 EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")  # openai, runpod, custom
@@ -69,15 +84,43 @@ EMBEDDING_DIMENSIONS = {
     "all-MiniLM-L6-v2": 384,  # Fallback für lokale Tests
 }
 
-EMBEDDING_DIMENSION = EMBEDDING_DIMENSIONS.get(EMBEDDING_MODEL, 1536)
+# Shortened embeddings: text-embedding-3 models return them natively ("dimensions"),
+# other providers' vectors are truncated and re-normalized (Matryoshka-trained models only).
+# 0 = the model's full dimension; a change needs a new collection.
+EMBEDDING_OUTPUT_DIMENSIONS = int(os.getenv("EMBEDDING_OUTPUT_DIMENSIONS", "0"))
+EMBEDDING_NATIVE_DIMENSIONS = EMBEDDING_MODEL.startswith("text-embedding-3")
+
+EMBEDDING_DIMENSION = EMBEDDING_OUTPUT_DIMENSIONS or EMBEDDING_DIMENSIONS.get(EMBEDDING_MODEL, 1536)
+
+# Vectors of different dimensions must never share cache entries
+EMBEDDING_MODEL_KEY = f"{EMBEDDING_MODEL}@{EMBEDDING_OUTPUT_DIMENSIONS}" if EMBEDDING_OUTPUT_DIMENSIONS else EMBEDDING_MODEL
+
+# Embedding batching during ingestion
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "50000"))
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "256"))  # OpenAI allows 2048
+EMBEDDING_BATCH_CONCURRENCY = int(os.getenv("EMBEDDING_BATCH_CONCURRENCY", "4"))
+
+# Retrieval: dense, sparse (BM25) or hybrid (both fused with RRF)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "4"))  # candidates per ranking = limit * factor
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "20"))  # search results considered for a RAG context
+RAG_TARGET_MODEL = os.getenv("RAG_TARGET_MODEL", "gpt-4o-mini")  # model the context is budgeted for
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1000"))
 
-# Text Splitting Configuration
-CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
-CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+# Tokenizers whose chunk token counts are stored at ingestion (besides the embedding model's)
+CONTEXT_TOKEN_ENCODINGS = [name.strip() for name in os.getenv("CONTEXT_TOKEN_ENCODINGS", "cl100k_base,o200k_base").split(",") if name.strip()]
+
+# Text Splitting Configuration (chunk sizes in tokens, see text_chunker)
+TEXT_SEGMENT_SIZE = 64 * 1024  # characters per segment when streaming text files
+
+# Upload handling
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+UPLOAD_READ_SIZE = 1024 * 1024
 
 # Global Variables
 qdrant_client = None
 http_client = None
+sparse_collections: Set[str] = set()  # collections with the BM25 sparse vector
 
 # ===================================================
 # PYDANTIC MODELS
@@ -94,6 +137,12 @@ class EmbeddingResponse(BaseModel):
     usage: Dict[str, Any]
     cost: float
 
+class EmbeddingBatchResponse(BaseModel):
+    embeddings: List[List[float]]
+    model: str
+    usage: Dict[str, Any]
+    cost: float
+
 class DocumentUploadRequest(BaseModel):
     project_id: int
     title: str
@@ -105,6 +154,7 @@ class DocumentChunk(BaseModel):
     content: str
     metadata: Dict[str, Any]
     embedding: Optional[List[float]] = None
+    term_weights: Optional[Dict[int, float]] = None  # sparse BM25 vector
 
 class DocumentResponse(BaseModel):
     id: str
@@ -117,39 +167,51 @@ class DocumentResponse(BaseModel):
     status: str
     embedding_model: str
     embedding_cost: float
+    job_id: Optional[str] = None
 
-class SearchRequest(BaseModel):
+class QueryRequest(BaseModel):
+    """Fields shared by search and RAG requests"""
     query: str
     project_id: Optional[int] = None
+
+class QueryResponse(BaseModel):
+    """Fields of search and RAG responses the result cache rewrites on a hit"""
+    query: str
+    processing_time: float
+    embedding_cost: float
+    cached: bool = False
+
+CachedResponse = TypeVar("CachedResponse", bound=QueryResponse)
+
+class SearchRequest(QueryRequest):
     limit: int = Field(default=10, ge=1, le=100)
-    score_threshold: float = Field(default=0.7, ge=0.0, le=1.0)
+    score_threshold: float = Field(default=0.7, ge=0.0, le=1.0)  # dense similarity
+    mode: str = Field(default=SEARCH_MODE, pattern="^(dense|sparse|hybrid)$")
 
 class SearchResult(BaseModel):
     id: str
     content: str
-    score: float
+    score: float  # dense similarity (BM25 score in sparse mode)
+    rank_score: Optional[float] = None  # RRF score in hybrid mode; results are ordered by it
     metadata: Dict[str, Any]
     document_title: str
+    vector: Optional[List[float]] = Field(default=None, exclude=True)  # dense vector, for MMR
 
-class SearchResponse(BaseModel):
+class SearchResponse(QueryResponse):
     results: List[SearchResult]
     total: int
-    query: str
-    processing_time: float
-    embedding_cost: float
 
-class RAGRequest(BaseModel):
-    query: str
-    project_id: Optional[int] = None
-    max_context_length: int = Field(default=4000, ge=1000, le=8000)
+class RAGRequest(QueryRequest):
+    max_context_tokens: int = Field(default=RAG_CONTEXT_TOKENS, ge=100, le=128000)
+    target_model: str = RAG_TARGET_MODEL  # tokenizer the budget is counted in
     similarity_threshold: float = Field(default=0.7, ge=0.0, le=1.0)
+    mmr_lambda: float = Field(default=RAG_MMR_LAMBDA, ge=0.0, le=1.0)  # 1 = relevance only
 
-class RAGResponse(BaseModel):
-    query: str
+class RAGResponse(QueryResponse):
     context: str
+    context_tokens: int
+    target_model: str
     context_sources: List[Dict[str, Any]]
-    processing_time: float
-    embedding_cost: float
 
 # ===================================================
 # STARTUP & SHUTDOWN
@@ -164,9 +226,13 @@ async def startup_event():
     
     try:
         # Initialize HTTP Client
-        http_client = httpx.AsyncClient(timeout=30.0)
+        http_client = httpx.AsyncClient(timeout=30.0, event_hooks=timing_event_hooks())
         logger.info("HTTP client initialized")
         
+        await embedding_cache.start()
+        await term_stats.start()
+        await result_cache.start()
+        
         # Initialize Qdrant Client with retry logic
         max_retries = 10
         retry_delay = 5
@@ -174,16 +240,19 @@ async def startup_event():
         for attempt in range(max_retries):
             try:
                 logger.info(f"Connecting to Qdrant (attempt {attempt + 1}/{max_retries})", 
-                           host=QDRANT_HOST, port=QDRANT_PORT)
+                           host=QDRANT_HOST, port=QDRANT_PORT, prefer_grpc=QDRANT_PREFER_GRPC)
                 
-                qdrant_client = QdrantClient(
+                # Async client - one shared instance so connections are reused
+                qdrant_client = AsyncQdrantClient(
                     host=QDRANT_HOST,
                     port=QDRANT_PORT,
+                    grpc_port=QDRANT_GRPC_PORT,
+                    prefer_grpc=QDRANT_PREFER_GRPC,
                     api_key=QDRANT_API_KEY
                 )
                 
                 # Test connection
-                collections = qdrant_client.get_collections()
+                collections = await qdrant_client.get_collections()
                 logger.info("Qdrant connection successful", collections_count=len(collections.collections))
                 break
                 
@@ -201,9 +270,10 @@ async def startup_event():
                    provider=EMBEDDING_PROVIDER,
                    model=EMBEDDING_MODEL,
                    dimension=EMBEDDING_DIMENSION,
+                   shortened=bool(EMBEDDING_OUTPUT_DIMENSIONS),
                    api_base=EMBEDDING_API_BASE)
         
-        logger.info("Text splitter configuration", chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+        logger.info("Text splitter configuration", chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, pdf_workers=PDF_WORKERS)
         
         # Test embedding API only if we have a valid API key
         if EMBEDDING_API_KEY and EMBEDDING_API_KEY != "":
@@ -214,6 +284,9 @@ async def startup_event():
         # Ensure default collection exists
         await ensure_collection_exists("documents")
         
+        # Start ingestion workers (resumes unfinished jobs)
+        await ingestion_manager.start()
+        
         logger.info("RAG Service initialized successfully")
         
     except Exception as e:
@@ -225,12 +298,20 @@ async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down RAG Service...")
     
+    await ingestion_manager.stop()
+    shutdown_pdf_pool()
+    await embedding_batcher.close()
+    
     if qdrant_client:
-        qdrant_client.close()
+        await qdrant_client.close()
     
     if http_client:
         await http_client.aclose()
     
+    await embedding_cache.close()
+    await term_stats.close()
+    await result_cache.close()
+    
     logger.info("RAG Service shutdown complete")
 
 # ===================================================
@@ -258,31 +339,84 @@ async def test_embedding_api():
 
 async def generate_embedding(text: str) -> EmbeddingResponse:
     """Generate embedding using external API"""
+    batch = await generate_embeddings([text])
+    return EmbeddingResponse(
+        embedding=batch.embeddings[0],
+        model=batch.model,
+        usage=batch.usage,
+        cost=batch.cost
+    )
+
+async def generate_embeddings(texts: List[str]) -> EmbeddingBatchResponse:
+    """
+    Generate embeddings for several texts with one API call, shared with other
+    concurrent callers by the micro-batcher. Texts found in the embedding cache
+    are not sent; duplicates within the batch are sent once.
+    """
+    embeddings = await embedding_cache.get_many(EMBEDDING_MODEL_KEY, texts)
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    if not missing:
+        return EmbeddingBatchResponse(
+            embeddings=[embedding for embedding in embeddings if embedding is not None],  # all cached
+            model=EMBEDDING_MODEL,
+            usage={"total_tokens": 0, "cached": len(texts)},
+            cost=0.0
+        )
+    
     try:
-        if EMBEDDING_PROVIDER == "openai":
-            return await generate_openai_embedding(text)
-        elif EMBEDDING_PROVIDER == "runpod":
-            return await generate_runpod_embedding(text)
-        else:
-            raise ValueError(f"Unsupported embedding provider: {EMBEDDING_PROVIDER}")
-            
+        # Sent together with the misses of other concurrent requests
+        response = await embedding_batcher.embed(missing)
     except Exception as e:
-        logger.error("Error generating embedding", error=str(e), provider=EMBEDDING_PROVIDER)
+        logger.error("Error generating embedding", error=str(e), provider=EMBEDDING_PROVIDER, texts=len(missing))
         raise HTTPException(status_code=500, detail=f"Failed to generate embedding: {str(e)}")
+    
+    await embedding_cache.put_many(EMBEDDING_MODEL_KEY, missing, response.embeddings)
+    
+    generated = dict(zip(missing, response.embeddings))
+    return EmbeddingBatchResponse(
+        embeddings=[embedding if embedding is not None else generated[text] for text, embedding in zip(texts, embeddings)],
+        model=EMBEDDING_MODEL,
+        usage={**response.usage, "cached": len(texts) - len(missing)},
+        cost=response.cost
+    )
 
-async def generate_openai_embedding(text: str) -> EmbeddingResponse:
-    """Generate embedding using OpenAI API"""
+async def request_embeddings(texts: List[str]) -> EmbeddingBatchResponse:
+    """Send texts to the configured embedding provider"""
+    if EMBEDDING_PROVIDER == "openai":
+        return await generate_openai_embeddings(texts)
+    elif EMBEDDING_PROVIDER == "runpod":
+        return await generate_runpod_embeddings(texts)
+    raise ValueError(f"Unsupported embedding provider: {EMBEDDING_PROVIDER}")
+
+embedding_batcher = EmbeddingBatcher(
+    send_fn=request_embeddings,
+    tokens_fn=lambda text: count_tokens(text, EMBEDDING_MODEL),
+    max_tokens=EMBEDDING_BATCH_MAX_TOKENS,
+)
+
+def shorten_embeddings(embeddings: List[List[float]]) -> List[List[float]]:
+    """Truncate embeddings to EMBEDDING_OUTPUT_DIMENSIONS and re-normalize them to unit length"""
+    if not EMBEDDING_OUTPUT_DIMENSIONS or not embeddings or len(embeddings[0]) <= EMBEDDING_OUTPUT_DIMENSIONS:
+        return embeddings
+    vectors = np.asarray(embeddings, dtype=np.float32)[:, :EMBEDDING_OUTPUT_DIMENSIONS]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1.0)).tolist()
+
+async def generate_openai_embeddings(texts: List[str]) -> EmbeddingBatchResponse:
+    """Generate embeddings using OpenAI API (input array)"""
     try:
         headers = {
             "Authorization": f"Bearer {EMBEDDING_API_KEY}",
             "Content-Type": "application/json"
         }
         
-        payload = {
-            "input": text,
+        payload: Dict[str, Any] = {
+            "input": texts,
             "model": EMBEDDING_MODEL,
             "encoding_format": "float"
         }
+        if EMBEDDING_OUTPUT_DIMENSIONS and EMBEDDING_NATIVE_DIMENSIONS:
+            payload["dimensions"] = EMBEDDING_OUTPUT_DIMENSIONS
         
         url = f"{EMBEDDING_API_BASE}/embeddings"
         
@@ -291,15 +425,18 @@ async def generate_openai_embedding(text: str) -> EmbeddingResponse:
         
         data = response.json()
         
-        # Extract embedding
-        embedding = data["data"][0]["embedding"]
+        # Extract embeddings - "index" refers to the position in the input array
+        items = sorted(data["data"], key=lambda item: item["index"])
+        embeddings = shorten_embeddings([item["embedding"] for item in items])
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
         
         # Calculate cost (rough estimate)
         tokens = data["usage"]["total_tokens"]
         cost = calculate_embedding_cost(tokens, EMBEDDING_MODEL)
         
-        return EmbeddingResponse(
-            embedding=embedding,
+        return EmbeddingBatchResponse(
+            embeddings=embeddings,
             model=EMBEDDING_MODEL,
             usage=data["usage"],
             cost=cost
@@ -309,8 +446,8 @@ async def generate_openai_embedding(text: str) -> EmbeddingResponse:
         logger.error("OpenAI embedding generation failed", error=str(e))
         raise
 
-async def generate_runpod_embedding(text: str) -> EmbeddingResponse:
-    """Generate embedding using RunPod API"""
+async def generate_runpod_embeddings(texts: List[str]) -> EmbeddingBatchResponse:
+    """Generate embeddings using RunPod API"""
     try:
         if not RUNPOD_EMBEDDING_ENDPOINT or not RUNPOD_API_KEY:
             raise ValueError("RunPod embedding configuration missing")
@@ -320,34 +457,42 @@ async def generate_runpod_embedding(text: str) -> EmbeddingResponse:
             "Content-Type": "application/json"
         }
         
-        payload = {
-            "input": {
-                "text": text,
-                "model": EMBEDDING_MODEL
-            }
-        }
+        # Single texts keep the original payload, batches send a list
+        job_input: Dict[str, Any]
+        if len(texts) == 1:
+            job_input = {"text": texts[0], "model": EMBEDDING_MODEL}
+        else:
+            job_input = {"texts": texts, "model": EMBEDDING_MODEL}
         
         response = await http_client.post(
             RUNPOD_EMBEDDING_ENDPOINT,
-            json=payload,
+            json={"input": job_input},
             headers=headers
         )
         response.raise_for_status()
         
         data = response.json()
-        
-        # Extract embedding (adapt based on RunPod response format)
-        if "output" in data and "embedding" in data["output"]:
-            embedding = data["output"]["embedding"]
+        output = data.get("output") or {}
+        
+        # Extract embeddings (single "embedding", list "embeddings" or OpenAI-style "data")
+        if "embeddings" in output:
+            embeddings = output["embeddings"]
+        elif "data" in output:
+            embeddings = [item["embedding"] for item in sorted(output["data"], key=lambda item: item.get("index", 0))]
+        elif "embedding" in output:
+            embeddings = [output["embedding"]]
         else:
             raise ValueError("Invalid RunPod response format")
+        embeddings = shorten_embeddings(embeddings)
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
         
         # Estimate cost and usage
-        estimated_tokens = len(text.split())
+        estimated_tokens = sum(len(text.split()) for text in texts)
         cost = calculate_embedding_cost(estimated_tokens, EMBEDDING_MODEL, "runpod")
         
-        return EmbeddingResponse(
-            embedding=embedding,
+        return EmbeddingBatchResponse(
+            embeddings=embeddings,
             model=EMBEDDING_MODEL,
             usage={"total_tokens": estimated_tokens},
             cost=cost
@@ -379,155 +524,293 @@ def calculate_embedding_cost(tokens: int, model: str, provider: str = "openai")
 # ===================================================
 
 async def ensure_collection_exists(collection_name: str):
-    """Ensure a Qdrant collection exists"""
+    """Ensure a Qdrant collection exists with the configured layout (indexes, HNSW, on-disk)"""
     try:
-        collections = qdrant_client.get_collections()
-        existing_names = [col.name for col in collections.collections]
-        
-        if collection_name not in existing_names:
-            logger.info("Creating new collection", collection=collection_name)
-            qdrant_client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(
-                    size=EMBEDDING_DIMENSION,
-                    distance=Distance.COSINE
-                )
-            )
-            logger.info("Collection created successfully", collection=collection_name)
+        if await ensure_collection(qdrant_client, collection_name, EMBEDDING_DIMENSION):
+            sparse_collections.add(collection_name)
         else:
-            logger.info("Collection already exists", collection=collection_name)
-            
+            sparse_collections.discard(collection_name)
     except Exception as e:
         logger.error("Error ensuring collection exists", collection=collection_name, error=str(e))
         raise
 
-def extract_text_from_file(file_path: str, mime_type: str) -> str:
-    """Extract text from various file types"""
+def iter_text_segments(file_path: str, mime_type: str) -> Iterator[str]:
+    """Yield the text of a file incrementally - PDF pages or blocks of a text file"""
     try:
-        if mime_type.startswith('text/'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        elif mime_type == 'application/pdf':
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
+        if mime_type == 'application/pdf':
+            # Page ranges are extracted in parallel in the PDF process pool
+            yield from iter_pdf_text(file_path)
         else:
-            # Fallback: try to read as text
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
+            # Text files; other types are read as text as a fallback
+            errors = 'strict' if mime_type.startswith('text/') else 'ignore'
+            with open(file_path, 'r', encoding='utf-8', errors=errors) as f:
+                while True:
+                    block = f.read(TEXT_SEGMENT_SIZE)
+                    if not block:
+                        break
+                    yield block
     except Exception as e:
         logger.error("Error extracting text from file", file_path=file_path, error=str(e))
         raise HTTPException(status_code=400, detail=f"Failed to extract text from file: {str(e)}")
 
-def split_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
-    """Split text into chunks with overlap"""
-    if len(text) <= chunk_size:
-        return [text]
-    
-    chunks = []
-    start = 0
-    
-    # Separators in order of preference
-    separators = ['\n\n', '\n', '. ', ' ', '']
-    
-    while start < len(text):
-        end = start + chunk_size
-        
-        if end >= len(text):
-            chunks.append(text[start:])
-            break
-        
-        # Try to find a good split point
-        chunk_end = end
-        for separator in separators:
-            if separator == '':
-                # Last resort: split at chunk_size
-                chunk_end = end
-                break
-            
-            # Look for separator within the last 20% of chunk
-            search_start = end - int(chunk_size * 0.2)
-            sep_pos = text.rfind(separator, search_start, end)
-            
-            if sep_pos != -1:
-                chunk_end = sep_pos + len(separator)
-                break
-        
-        chunks.append(text[start:chunk_end].strip())
-        start = max(start + 1, chunk_end - chunk_overlap)
-    
-    return [chunk for chunk in chunks if chunk.strip()]
+def extract_text_from_file(file_path: str, mime_type: str) -> str:
+    """Extract text from various file types"""
+    return "".join(iter_text_segments(file_path, mime_type))
 
-def chunk_document(text: str, metadata: Dict[str, Any]) -> List[DocumentChunk]:
-    """Split document into chunks"""
+def chunk_document(segments: Iterable[str], metadata: Dict[str, Any]) -> Iterator[DocumentChunk]:
+    """Split streamed document text into chunks"""
     try:
-        # Split text into chunks
-        text_chunks = split_text(text)
-        
-        # Convert to DocumentChunk objects
-        document_chunks = []
-        for i, chunk_text in enumerate(text_chunks):
-            chunk_id = str(uuid.uuid4())
+        # Token counts are cached in the payload for embedding batches and context budgets
+        encodings = list(dict.fromkeys([encoding_name(EMBEDDING_MODEL), *CONTEXT_TOKEN_ENCODINGS]))
+        for i, chunk_text in enumerate(iter_token_chunks(segments, EMBEDDING_MODEL)):
+            # Deterministic per document and position, so re-running an ingestion overwrites its points
+            chunk_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{metadata['document_id']}:{i}"))
             chunk_metadata = {
                 **metadata,
                 "chunk_index": i,
-                "chunk_id": chunk_id
+                "chunk_id": chunk_id,
+                "token_counts": {encoding: count_tokens(chunk_text, encoding) for encoding in encodings}
             }
             
-            document_chunks.append(DocumentChunk(
+            yield DocumentChunk(
                 id=chunk_id,
                 content=chunk_text,
-                metadata=chunk_metadata
-            ))
-        
-        return document_chunks
+                metadata=chunk_metadata,
+                term_weights=document_weights(chunk_text)
+            )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("Error chunking document", error=str(e))
         raise HTTPException(status_code=500, detail=f"Failed to chunk document: {str(e)}")
 
-async def store_chunks_in_qdrant(chunks: List[DocumentChunk], collection_name: str = "documents") -> float:
-    """Store document chunks in Qdrant and return total embedding cost"""
+def chunk_vectors(chunk: DocumentChunk, embedding: List[float], sparse: bool) -> Dict[str, Any]:
+    """Named vectors of a point: the default dense vector and, if ``sparse``, the BM25 sparse vector"""
+    vectors: Dict[str, Any] = {"": embedding}
+    if sparse and chunk.term_weights:
+        vectors[SPARSE_VECTOR_NAME] = models.SparseVector(
+            indices=list(chunk.term_weights),
+            values=list(chunk.term_weights.values())
+        )
+    return vectors
+
+async def upsert_chunks(collection_name: str, chunks: List[DocumentChunk], embeddings: List[List[float]]) -> None:
+    """Store embedded document chunks (dense and sparse vectors) in Qdrant"""
+    sparse = collection_name in sparse_collections
     try:
-        points = []
-        total_cost = 0.0
-        
-        for chunk in chunks:
-            # Generate embedding for chunk using API
-            embedding_response = await generate_embedding(chunk.content)
-            total_cost += embedding_response.cost
-            
-            # Create point for Qdrant
-            point = PointStruct(
+        points = [
+            PointStruct(
                 id=chunk.id,
-                vector=embedding_response.embedding,
+                vector=chunk_vectors(chunk, embedding, sparse),
                 payload={
                     "content": chunk.content,
                     "metadata": chunk.metadata
                 }
             )
-            points.append(point)
+            for chunk, embedding in zip(chunks, embeddings)
+        ]
         
-        # Store in Qdrant
-        qdrant_client.upsert(
+        await qdrant_client.upsert(
             collection_name=collection_name,
             points=points
         )
-        
-        logger.info("Chunks stored successfully", 
-                   count=len(chunks), 
-                   collection=collection_name,
-                   total_cost=total_cost)
-        
-        return total_cost
+        if sparse:
+            await term_stats.add([chunk.term_weights for chunk in chunks if chunk.term_weights])
+        await result_cache.invalidate({chunk.metadata.get("project_id") for chunk in chunks})
         
     except Exception as e:
-        logger.error("Error storing chunks in Qdrant", error=str(e))
+        logger.error("Error storing chunks in Qdrant", error=str(e), count=len(chunks), collection=collection_name)
         raise HTTPException(status_code=500, detail=f"Failed to store chunks: {str(e)}")
 
+def project_filter(project_id: Optional[int]) -> Optional[models.Filter]:
+    """Search filter restricting results to one project"""
+    if not project_id:
+        return None
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.project_id",
+                match=models.MatchValue(value=project_id)
+            )
+        ]
+    )
+
+def dense_vector(point: Any) -> Optional[List[float]]:
+    # Points carry the default dense vector alone or among named vectors
+    return point.vector.get("") if isinstance(point.vector, dict) else point.vector
+
+def to_search_result(point: Any, score: float, rank_score: Optional[float] = None) -> SearchResult:
+    return SearchResult(
+        id=point.id,
+        content=point.payload["content"],
+        score=score,
+        rank_score=rank_score,
+        metadata=point.payload["metadata"],
+        document_title=point.payload["metadata"].get("title", "Unknown"),
+        vector=dense_vector(point)
+    )
+
+def fuse_rankings(rankings: List[List[Any]], query_vector: List[float], limit: int,
+                  score_threshold: float) -> List[SearchResult]:
+    """
+    RRF fusion of the dense and sparse rankings. ``score`` stays the dense
+    similarity; sparse-only hits get it from their stored vector and are
+    dropped below ``score_threshold`` like dense hits.
+    """
+    points = {hit.id: hit for ranking in rankings for hit in ranking}
+    dense_scores = {hit.id: hit.score for hit in rankings[0]}
+    query = np.asarray(query_vector, dtype=np.float32)
+    query_norm = float(np.linalg.norm(query)) or 1.0
+    results: List[SearchResult] = []
+    for point_id, rank_score in rrf_fuse([hit.id for hit in ranking] for ranking in rankings):
+        score = dense_scores.get(point_id)
+        if score is None:
+            vector = np.asarray(dense_vector(points[point_id]), dtype=np.float32)
+            score = float(vector @ query) / ((float(np.linalg.norm(vector)) or 1.0) * query_norm)
+            if score < score_threshold:
+                continue
+        results.append(to_search_result(points[point_id], score, rank_score))
+        if len(results) == limit:
+            break
+    return results
+
+async def search_chunks(
+    query: str,
+    query_vector: List[float],
+    search_filter: Optional[models.Filter],
+    limit: int,
+    score_threshold: float,
+    mode: str = SEARCH_MODE,
+    with_vectors: bool = False
+) -> List[SearchResult]:
+    """
+    Dense, sparse (BM25) or hybrid search. Hybrid runs both searches in one
+    request and orders the results by their RRF score (``rank_score``);
+    ``score`` is the dense similarity and ``score_threshold`` applies to it in
+    dense and hybrid mode. Collections without the sparse vector are searched
+    dense-only.
+    """
+    if mode == "dense" or "documents" not in sparse_collections:
+        hits = await qdrant_client.search(
+            collection_name="documents",
+            query_vector=query_vector,
+            query_filter=search_filter,
+            limit=limit,
+            score_threshold=score_threshold,
+            search_params=search_params(),
+            with_vectors=with_vectors
+        )
+        return [to_search_result(hit, hit.score) for hit in hits]
+    
+    candidates = limit if mode == "sparse" else min(limit * HYBRID_CANDIDATE_FACTOR, 200)
+    requests = []
+    if mode == "hybrid":
+        requests.append(models.SearchRequest(
+            vector=query_vector,
+            filter=search_filter,
+            limit=candidates,
+            score_threshold=score_threshold,
+            params=search_params(),
+            with_payload=True,
+            with_vector=with_vectors
+        ))
+    weights = await term_stats.query_weights(query)
+    if weights:
+        requests.append(models.SearchRequest(
+            vector=models.NamedSparseVector(
+                name=SPARSE_VECTOR_NAME,
+                vector=models.SparseVector(indices=list(weights), values=list(weights.values()))
+            ),
+            filter=search_filter,
+            limit=candidates,
+            with_payload=True,
+            # Hybrid: sparse-only hits need their dense vector for the similarity threshold
+            with_vector=with_vectors or mode == "hybrid"
+        ))
+    if not requests:
+        return []  # sparse search for a query without terms
+    
+    rankings = await qdrant_client.search_batch(collection_name="documents", requests=requests)
+    if mode == "sparse":
+        return [to_search_result(hit, hit.score) for hit in rankings[0]]
+    return fuse_rankings(rankings, query_vector, limit, score_threshold)
+
+async def lookup_cached_response(kind: str, request: QueryRequest, response_type: Type[CachedResponse],
+                                 start_time: datetime) -> Tuple[Optional[str], Optional[CachedResponse]]:
+    """Result cache key of a search/RAG request and the cached response, if any"""
+    params = {**request.model_dump(exclude={"query"}), "embedding_model": EMBEDDING_MODEL_KEY}
+    key = await result_cache.key(kind, request.project_id, request.query, params)
+    cached = await result_cache.get(kind, key)
+    if cached is None:
+        return key, None
+    
+    response = response_type.model_validate_json(cached)
+    response.query = request.query
+    response.cached = True
+    response.embedding_cost = 0.0
+    response.processing_time = (datetime.utcnow() - start_time).total_seconds()
+    return key, response
+
+# ===================================================
+# INGESTION JOBS
+# ===================================================
+
+# Chunks flow through bounded queues: chunking -> embedding -> Qdrant upserts
+ingestion_pipeline = IngestionPipeline(
+    embed_fn=generate_embeddings,
+    upsert_fn=upsert_chunks,
+    chunk_tokens_fn=lambda chunk: chunk.metadata["token_counts"][encoding_name(EMBEDDING_MODEL)],
+    max_batch_tokens=EMBEDDING_BATCH_MAX_TOKENS,
+    max_batch_items=EMBEDDING_BATCH_MAX_ITEMS,
+    embed_concurrency=EMBEDDING_BATCH_CONCURRENCY
+)
+
+async def process_ingestion_job(job: IngestionJob, manager: IngestionManager) -> None:
+    """
+    Extract, chunk, embed and store the document of an ingestion job.
+    
+    The stages run concurrently in the ingestion pipeline, so memory stays
+    bounded for any file size. ``chunks_total`` grows as the document is read;
+    ``stage`` is the earliest stage still running. A resumed job skips the
+    chunks before its checkpoint.
+    """
+    chunks = chunk_document(iter_text_segments(job.source_path, job.metadata["mime_type"]), job.metadata)
+    
+    resumed_from = job.checkpoint
+    manager.update(job, stage=JobStage.EXTRACTING, chunks_total=0,
+                   chunks_embedded=resumed_from, chunks_stored=resumed_from)
+    
+    def on_chunks(count: int) -> None:
+        manager.update(job, chunks_total=job.chunks_total + count)
+    
+    def on_embedded(count: int, cost: float) -> None:
+        manager.update(job, chunks_embedded=job.chunks_embedded + count, embedding_cost=job.embedding_cost + cost)
+    
+    def on_stored(count: int, checkpoint: int) -> None:
+        manager.update(job, chunks_stored=job.chunks_stored + count, checkpoint=checkpoint)
+    
+    def on_stage_done(stage: str) -> None:
+        manager.update(job, stage=JobStage.EMBEDDING if stage == STAGE_CHUNK else JobStage.STORING)
+    
+    stats = await ingestion_pipeline.run(
+        chunks,
+        collection_name="documents",
+        start_index=resumed_from,
+        on_chunks=on_chunks,
+        on_embedded=on_embedded,
+        on_stored=on_stored,
+        on_stage_done=on_stage_done
+    )
+    
+    logger.info("Document processed successfully", 
+               document_id=job.document_id,
+               chunks=job.chunks_total,
+               resumed_from=resumed_from,
+               processing_time=stats["seconds"])
+
+ingestion_manager = IngestionManager(process_fn=process_ingestion_job)
+
 # ===================================================
 # AUTHENTICATION
 # ===================================================
@@ -546,14 +829,20 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Check Qdrant connection
-        collections = qdrant_client.get_collections()
+        collections = await qdrant_client.get_collections()
         
         return {
             "status": "healthy",
             "service": "rag-service",
             "timestamp": datetime.utcnow().isoformat(),
             "qdrant_collections": len(collections.collections),
-            "embedding_model": EMBEDDING_MODEL
+            "embedding_model": EMBEDDING_MODEL,
+            "embedding_dimension": EMBEDDING_DIMENSION,
+            "embedding_cache": await embedding_cache.stats(),
+            "embedding_batcher": embedding_batcher.stats(),
+            "bm25": term_stats.stats(),
+            "result_cache": result_cache.stats(),
+            "ingestion": ingestion_manager.stats()
         }
     except Exception as e:
         logger.error("Health check failed", error=str(e))
@@ -564,7 +853,31 @@ async def health_check():
             "error": str(e)
         }
 
-@app.post("/api/v1/documents/upload", response_model=DocumentResponse)
+@app.get("/metrics", response_class=Response)
+async def metrics():
+    """Service metrics in Prometheus text format"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+async def save_upload(file: UploadFile, path: Path) -> Tuple[int, str]:
+    """Stream an upload to disk, returning its size and SHA-256; 413 past MAX_UPLOAD_BYTES"""
+    hasher = hashlib.sha256()
+    file_size = 0
+    with open(path, "wb") as out:
+        while True:
+            block = await file.read(UPLOAD_READ_SIZE)
+            if not block:
+                break
+            file_size += len(block)
+            if file_size > MAX_UPLOAD_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"File exceeds the upload limit of {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+                )
+            hasher.update(block)
+            out.write(block)
+    return file_size, hasher.hexdigest()
+
+@app.post("/api/v1/documents/upload", response_model=DocumentResponse, status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
     file: UploadFile = File(...),
     project_id: int = Form(...),
@@ -573,7 +886,7 @@ async def upload_document(
     tags: str = Form(""),
     current_user: Dict = Depends(get_current_user)
 ):
-    """Upload and process a document"""
+    """Accept a document and queue it for background ingestion"""
     start_time = datetime.utcnow()
     document_id = str(uuid.uuid4())
     
@@ -592,124 +905,108 @@ async def upload_document(
         if not mime_type:
             mime_type = "text/plain"
         
-        # Save file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-        
+        # Stream the upload to the job directory, hashing on the fly
+        job_id, source_path = ingestion_manager.new_job_path(file.filename)
         try:
-            # Extract text
-            text_content = extract_text_from_file(tmp_file_path, mime_type)
-            
-            # Prepare metadata
-            metadata = {
-                "document_id": document_id,
-                "title": title,
-                "description": description,
-                "project_id": project_id,
-                "filename": file.filename,
-                "mime_type": mime_type,
-                "tags": tag_list,
-                "uploaded_by": current_user["user_id"],
-                "uploaded_at": start_time.isoformat(),
-                "file_size": len(content)
-            }
-            
-            # Chunk document
-            chunks = chunk_document(text_content, metadata)
-            
-            # Store in Qdrant
-            embedding_cost = await store_chunks_in_qdrant(chunks)
-            
-            processing_time = (datetime.utcnow() - start_time).total_seconds()
-            
-            logger.info("Document processed successfully", 
-                       document_id=document_id,
-                       chunks=len(chunks),
-                       processing_time=processing_time)
-            
-            return DocumentResponse(
-                id=document_id,
-                title=title,
-                description=description,
-                project_id=project_id,
-                chunk_count=len(chunks),
-                created_at=start_time,
-                tags=tag_list,
-                status="processed",
-                embedding_model=EMBEDDING_MODEL,
-                embedding_cost=embedding_cost
-            )
-            
-        finally:
-            # Clean up temporary file
-            os.unlink(tmp_file_path)
-            
+            file_size, content_sha256 = await save_upload(file, source_path)
+        except Exception:
+            ingestion_manager.discard(job_id)
+            raise
+        
+        # Prepare metadata
+        metadata = {
+            "document_id": document_id,
+            "title": title,
+            "description": description,
+            "project_id": project_id,
+            "filename": file.filename,
+            "mime_type": mime_type,
+            "tags": tag_list,
+            "uploaded_by": current_user["user_id"],
+            "uploaded_at": start_time.isoformat(),
+            "file_size": file_size,
+            "content_sha256": content_sha256
+        }
+        
+        job = ingestion_manager.create_job(job_id, document_id, file.filename, source_path, metadata)
+        
+        return DocumentResponse(
+            id=document_id,
+            title=title,
+            description=description,
+            project_id=project_id,
+            chunk_count=0,
+            created_at=start_time,
+            tags=tag_list,
+            status=job.stage.value,
+            embedding_model=EMBEDDING_MODEL,
+            embedding_cost=0.0,
+            job_id=job.id
+        )
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error("Document processing failed", document_id=document_id, error=str(e))
-        raise HTTPException(status_code=500, detail=f"Document processing failed: {str(e)}")
+        logger.error("Document upload failed", document_id=document_id, error=str(e))
+        raise HTTPException(status_code=500, detail=f"Document upload failed: {str(e)}")
+
+@app.get("/api/v1/jobs/{job_id}", response_model=IngestionJob)
+async def get_ingestion_job(
+    job_id: str,
+    current_user: Dict = Depends(get_current_user)
+):
+    """Status of a document ingestion job"""
+    job = ingestion_manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.post("/api/v1/search", response_model=SearchResponse)
 async def search_documents(
     request: SearchRequest,
     current_user: Dict = Depends(get_current_user)
 ):
-    """Search documents using semantic similarity"""
+    """Search documents by semantic similarity, keywords (BM25) or both"""
     start_time = datetime.utcnow()
     
-    logger.info("Search started", query=request.query, project_id=request.project_id)
+    logger.info("Search started", query=request.query, project_id=request.project_id, mode=request.mode)
     
     try:
-        # Generate query embedding
-        query_embedding = await generate_embedding(request.query)
+        cache_key, cached = await lookup_cached_response("search", request, SearchResponse, start_time)
+        if cached is not None:
+            logger.info("Search served from cache", results_count=cached.total, processing_time=cached.processing_time)
+            return cached
         
-        # Prepare search filter
-        search_filter = None
-        if request.project_id:
-            search_filter = models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="metadata.project_id",
-                        match=models.MatchValue(value=request.project_id)
-                    )
-                ]
-            )
+        # Generate query embedding (keyword-only search doesn't need one)
+        query_embedding = await generate_embedding(request.query) if request.mode != "sparse" else None
+        embedding_cost = query_embedding.cost if query_embedding else 0.0
         
         # Search in Qdrant
-        search_results = qdrant_client.search(
-            collection_name="documents",
-            query_vector=query_embedding.embedding,
-            query_filter=search_filter,
-            limit=request.limit,
-            score_threshold=request.score_threshold
+        results = await search_chunks(
+            request.query,
+            query_embedding.embedding if query_embedding else [],
+            project_filter(request.project_id),
+            request.limit,
+            request.score_threshold,
+            request.mode
         )
         
-        # Format results
-        results = []
-        for result in search_results:
-            results.append(SearchResult(
-                id=result.id,
-                content=result.payload["content"],
-                score=result.score,
-                metadata=result.payload["metadata"],
-                document_title=result.payload["metadata"].get("title", "Unknown")
-            ))
-        
         processing_time = (datetime.utcnow() - start_time).total_seconds()
         
         logger.info("Search completed", 
                    results_count=len(results),
                    processing_time=processing_time,
-                   embedding_cost=query_embedding.cost)
+                   embedding_cost=embedding_cost)
         
-        return SearchResponse(
+        response = SearchResponse(
             results=results,
             total=len(results),
             query=request.query,
             processing_time=processing_time,
-            embedding_cost=query_embedding.cost
+            embedding_cost=embedding_cost
         )
+        await result_cache.put(cache_key, response.model_dump_json())
+        return response
         
     except Exception as e:
         logger.error("Search failed", error=str(e))
@@ -726,53 +1023,83 @@ async def generate_rag_context(
     logger.info("RAG context generation started", query=request.query)
     
     try:
-        # Search for relevant documents
-        search_request = SearchRequest(
-            query=request.query,
-            project_id=request.project_id,
-            limit=20,  # Get more results for context
-            score_threshold=request.similarity_threshold
+        cache_key, cached = await lookup_cached_response("rag", request, RAGResponse, start_time)
+        if cached is not None:
+            logger.info("RAG context served from cache", context_tokens=cached.context_tokens, processing_time=cached.processing_time)
+            return cached
+        
+        query_embedding = await generate_embedding(request.query)
+        
+        # Candidates come with their vectors for MMR
+        candidates = await search_chunks(
+            request.query,
+            query_embedding.embedding,
+            project_filter(request.project_id),
+            RAG_CANDIDATES,
+            request.similarity_threshold,
+            with_vectors=True
         )
         
-        search_response = await search_documents(search_request, current_user)
+        # Diversify (MMR), then merge neighbouring chunks of a document into one passage
+        vectors = [candidate.vector for candidate in candidates]
+        matrix = np.array(vectors, dtype=np.float32) if candidates and all(vectors) else None
+        order, gains = mmr_order([candidate.score for candidate in candidates], matrix, request.mmr_lambda)
+        passages = merge_adjacent([candidates[i] for i in order], gains)
+        
+        # Token counts cached at ingestion; merged passages and older chunks are counted here
+        encoding = encoding_name(request.target_model)
+        stored_counts = {str(candidate.id): candidate.metadata.get("token_counts", {}).get(encoding) for candidate in candidates}
+        for passage in passages:
+            count = stored_counts.get(passage.chunk_ids[0]) if len(passage.chunk_ids) == 1 else None
+            passage.token_count = count if count is not None else count_tokens(passage.content, encoding)
+        
+        # Best total MMR gain within the budget (+1 token per passage for the separator)
+        picked = knapsack(
+            [passage.token_count + 1 for passage in passages],
+            [passage.value for passage in passages],
+            request.max_context_tokens
+        )
         
-        # Build context from search results
         context_parts = []
         context_sources = []
-        current_length = 0
-        
-        for result in search_response.results:
-            # Check if adding this result would exceed max context length
-            if current_length + len(result.content) > request.max_context_length:
-                break
-            
-            context_parts.append(result.content)
+        for passage in (passages[i] for i in picked):
+            context_parts.append(passage.content)
             context_sources.append({
-                "id": result.id,
-                "title": result.document_title,
-                "score": result.score,
-                "chunk_preview": result.content[:100] + "..." if len(result.content) > 100 else result.content
+                "id": passage.chunk_ids[0],
+                "chunk_ids": passage.chunk_ids,
+                "title": passage.title,
+                "score": passage.score,
+                "tokens": passage.token_count,
+                "chunk_preview": passage.content[:100] + "..." if len(passage.content) > 100 else passage.content
             })
-            current_length += len(result.content)
         
         # Combine context
         context = "\n\n".join(context_parts)
+        context_tokens = count_tokens(context, encoding)
         
         processing_time = (datetime.utcnow() - start_time).total_seconds()
         
         logger.info("RAG context generated", 
                    context_length=len(context),
+                   context_tokens=context_tokens,
+                   target_model=request.target_model,
                    sources_count=len(context_sources),
+                   candidates=len(candidates),
+                   passages=len(passages),
                    processing_time=processing_time,
-                   embedding_cost=search_response.embedding_cost)
+                   embedding_cost=query_embedding.cost)
         
-        return RAGResponse(
+        response = RAGResponse(
             query=request.query,
             context=context,
+            context_tokens=context_tokens,
+            target_model=request.target_model,
             context_sources=context_sources,
             processing_time=processing_time,
-            embedding_cost=search_response.embedding_cost
+            embedding_cost=query_embedding.cost
         )
+        await result_cache.put(cache_key, response.model_dump_json())
+        return response
         
     except Exception as e:
         logger.error("RAG context generation failed", error=str(e))
@@ -799,7 +1126,7 @@ async def list_documents(
             )
         
         # Get all points with metadata
-        points = qdrant_client.scroll(
+        points = await qdrant_client.scroll(
             collection_name="documents",
             scroll_filter=search_filter,
             limit=limit,
@@ -840,29 +1167,47 @@ async def delete_document(
 ):
     """Delete a document and all its chunks"""
     try:
-        # Find all chunks for this document
-        points = qdrant_client.scroll(
-            collection_name="documents",
-            scroll_filter=models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="metadata.document_id",
-                        match=models.MatchValue(value=document_id)
-                    )
-                ]
-            ),
-            with_payload=False,
-            with_vectors=False
+        document_filter = models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="metadata.document_id",
+                    match=models.MatchValue(value=document_id)
+                )
+            ]
         )
         
-        # Delete all chunks
-        point_ids = [point.id for point in points[0]]
+        # Find all chunks for this document (paged - documents have any number of chunks)
+        point_ids = []
+        project_ids = set()
+        sparse_indices = []
+        offset = None
+        while True:
+            points, offset = await qdrant_client.scroll(
+                collection_name="documents",
+                scroll_filter=document_filter,
+                limit=1000,
+                offset=offset,
+                with_payload=["metadata"],
+                with_vectors=[SPARSE_VECTOR_NAME] if "documents" in sparse_collections else False
+            )
+            for point in points:
+                point_ids.append(point.id)
+                project_ids.add(point.payload["metadata"].get("project_id"))
+                if point.vector and SPARSE_VECTOR_NAME in point.vector:
+                    sparse_indices.append(point.vector[SPARSE_VECTOR_NAME].indices)
+            if offset is None:
+                break
         
+        # Delete all chunks (one filtered delete, served by the document_id payload index)
         if point_ids:
-            qdrant_client.delete(
+            await qdrant_client.delete(
                 collection_name="documents",
-                points_selector=models.PointIdsList(points=point_ids)
+                points_selector=models.FilterSelector(filter=document_filter)
             )
+            # Cached results of the project are stale now
+            await result_cache.invalidate(project_ids)
+            # Keep BM25 document frequencies in step
+            await term_stats.remove(sparse_indices)
         
         logger.info("Document deleted", document_id=document_id, chunks_deleted=len(point_ids))
         
@@ -880,15 +1225,15 @@ async def delete_document(
 async def list_collections():
     """List all Qdrant collections"""
     try:
-        collections = qdrant_client.get_collections()
+        collections = await qdrant_client.get_collections()
+        counts = await asyncio.gather(*(qdrant_client.count(col.name) for col in collections.collections))
         return {
             "collections": [
                 {
                     "name": col.name,
-                    "status": col.status,
-                    "points_count": qdrant_client.count(col.name).count if col.status == "green" else 0
+                    "points_count": count.count
                 }
-                for col in collections.collections
+                for col, count in zip(collections.collections, counts)
             ]
         }
     except Exception as e:
@@ -910,6 +1255,7 @@ async def root():
         "features": [
             "Document Upload & Processing",
             "Vector Search",
+            "Hybrid Search (BM25 + Vectors, RRF)",
             "RAG Context Generation",
             "Multiple File Types Support",
             "Qdrant Vector Database"
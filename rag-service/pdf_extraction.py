@@ -0,0 +1,74 @@
+"""
+Parallel PDF text extraction in a process pool
+
+PyPDF2 extraction is pure-Python and CPU bound. Large PDFs are split into
+ranges of PDF_PAGES_PER_TASK pages that PDF_WORKERS processes extract in
+parallel; results are yielded in page order with a bounded number of ranges
+in flight, so memory stays bounded for any page count. This module is
+imported by the worker processes and must stay free of service state.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, Optional
+
+import PyPDF2
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))  # 0 = extract in the calling thread
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def count_pages(path: str) -> int:
+    with open(path, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_page_range(path: str, start: int, end: int) -> str:
+    """Text of pages [start, end), one newline after each page"""
+    with open(path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        return "".join([reader.pages[i].extract_text() + "\n" for i in range(start, min(end, len(reader.pages)))])
+
+
+def iter_pdf_text(path: str, workers: int = PDF_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK,
+                  pool: Optional[ProcessPoolExecutor] = None) -> Iterator[str]:
+    """Yield the text of a PDF range by range, in page order (shared pool unless ``pool`` is given)"""
+    page_count = count_pages(path)
+    if workers <= 0 or page_count <= pages_per_task:
+        # Small documents aren't worth the round trip to the pool
+        with open(path, "rb") as file:
+            for page in PyPDF2.PdfReader(file).pages:
+                yield page.extract_text() + "\n"
+        return
+
+    pool = pool or get_pool()
+    pending: Deque[Future] = deque()
+    try:
+        for start in range(0, page_count, pages_per_task):
+            pending.append(pool.submit(extract_page_range, path, start, start + pages_per_task))
+            # Keep every worker busy plus one range queued each
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,195 @@
+"""
+Qdrant collection layout and migrations for rag-service
+
+Collections are created with the configured layout, and existing collections
+are migrated to it on startup:
+
+- payload indexes for the fields every filter uses (project, document, tags),
+  so filtered search and deletes don't degrade with collection size
+- HNSW graph parameters (QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT); Qdrant
+  rebuilds the index in the background after a change
+- on-disk storage of vectors, the HNSW graph and payloads
+- vector quantization (QDRANT_QUANTIZATION): int8 scalar (4x smaller) or
+  binary (32x smaller) copies kept in RAM for the HNSW search, while the
+  original vectors can stay on disk (QDRANT_VECTORS_ON_DISK); searches
+  oversample on the quantized vectors and rescore the candidates with the
+  originals, which preserves recall
+- the sparse (BM25) vector used by hybrid search
+
+The migration only sends what differs from the live collection, so it is a
+no-op on every start after the first. Vector size, storage datatype (float16
+halves the original vectors) and a missing sparse vector can't change in
+place - those need a new collection and re-ingestion. A collection without
+the sparse vector keeps working with dense-only upserts and searches.
+"""
+import os
+from typing import Any, Dict, Optional
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models
+
+from logging_config import get_rag_logger
+from sparse_vectors import SPARSE_VECTOR_NAME
+
+logger = get_rag_logger()
+
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+QDRANT_SEARCH_EF = int(os.getenv("QDRANT_SEARCH_EF", "0"))  # 0 = Qdrant's default
+QDRANT_VECTORS_ON_DISK = os.getenv("QDRANT_VECTORS_ON_DISK", "false").lower() == "true"
+QDRANT_HNSW_ON_DISK = os.getenv("QDRANT_HNSW_ON_DISK", "false").lower() == "true"
+QDRANT_PAYLOAD_ON_DISK = os.getenv("QDRANT_PAYLOAD_ON_DISK", "false").lower() == "true"
+QDRANT_VECTOR_DATATYPE = os.getenv("QDRANT_VECTOR_DATATYPE", "float32").lower()  # float32, float16
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()  # none, scalar, binary
+QDRANT_QUANTIZATION_ALWAYS_RAM = os.getenv("QDRANT_QUANTIZATION_ALWAYS_RAM", "true").lower() == "true"
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))  # candidates per result before rescoring
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "true").lower() == "true"
+
+PAYLOAD_INDEXES: Dict[str, models.PayloadSchemaType] = {
+    "metadata.project_id": models.PayloadSchemaType.INTEGER,
+    "metadata.document_id": models.PayloadSchemaType.KEYWORD,
+    "metadata.tags": models.PayloadSchemaType.KEYWORD,
+}
+
+
+def search_params() -> Optional[models.SearchParams]:
+    """Search-time parameters for dense searches: HNSW ef, oversampling and rescoring"""
+    hnsw_ef = QDRANT_SEARCH_EF if QDRANT_SEARCH_EF > 0 else None
+    quantization = None
+    if QDRANT_QUANTIZATION != "none":
+        quantization = models.QuantizationSearchParams(rescore=QDRANT_RESCORE, oversampling=QDRANT_OVERSAMPLING)
+    if hnsw_ef is None and quantization is None:
+        return None
+    return models.SearchParams(hnsw_ef=hnsw_ef, quantization=quantization)
+
+
+def quantization_config() -> Optional[models.QuantizationConfig]:
+    if QDRANT_QUANTIZATION == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=0.99,
+            always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM
+        ))
+    if QDRANT_QUANTIZATION == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM))
+    if QDRANT_QUANTIZATION != "none":
+        raise ValueError(f"Unsupported QDRANT_QUANTIZATION: {QDRANT_QUANTIZATION}")
+    return None
+
+
+def _quantization_mode(config: Any) -> str:
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    if isinstance(config, models.ProductQuantization):
+        return "product"
+    return "none"
+
+
+def _datatype() -> models.Datatype:
+    return models.Datatype(QDRANT_VECTOR_DATATYPE)
+
+
+def _sparse_config() -> Dict[str, models.SparseVectorParams]:
+    return {SPARSE_VECTOR_NAME: models.SparseVectorParams(index=models.SparseIndexParams(on_disk=QDRANT_VECTORS_ON_DISK))}
+
+
+def _dense_params(params: models.CollectionParams) -> Any:
+    # Collections use the default unnamed dense vector
+    vectors = params.vectors
+    return vectors.get("") if isinstance(vectors, dict) else vectors
+
+
+async def create_collection(client: AsyncQdrantClient, name: str, dimension: int) -> None:
+    await client.create_collection(
+        collection_name=name,
+        vectors_config=models.VectorParams(
+            size=dimension,
+            distance=models.Distance.COSINE,
+            on_disk=QDRANT_VECTORS_ON_DISK,
+            datatype=_datatype()
+        ),
+        sparse_vectors_config=_sparse_config(),
+        hnsw_config=models.HnswConfigDiff(
+            m=QDRANT_HNSW_M,
+            ef_construct=QDRANT_HNSW_EF_CONSTRUCT,
+            on_disk=QDRANT_HNSW_ON_DISK
+        ),
+        on_disk_payload=QDRANT_PAYLOAD_ON_DISK,
+        quantization_config=quantization_config()
+    )
+    await create_payload_indexes(client, name, {})
+
+
+async def create_payload_indexes(client: AsyncQdrantClient, name: str, existing: Dict[str, Any]) -> None:
+    for field, schema in PAYLOAD_INDEXES.items():
+        if field not in existing:
+            await client.create_payload_index(collection_name=name, field_name=field, field_schema=schema)
+            logger.info("Payload index created", collection=name, field=field, schema=schema.value)
+
+
+async def migrate_collection(client: AsyncQdrantClient, name: str, dimension: int) -> bool:
+    """Bring an existing collection to the configured layout; True if it has the sparse vector"""
+    info = await client.get_collection(name)
+    params = info.config.params
+    hnsw = info.config.hnsw_config
+    dense = _dense_params(params)
+    changes: Dict[str, Any] = {}
+
+    if dense is not None and dense.size != dimension:
+        raise ValueError(
+            f"Collection {name} stores {dense.size}-dimensional vectors but embeddings have {dimension} "
+            f"dimensions - use a new collection and re-ingest"
+        )
+    if dense is not None and (dense.datatype or models.Datatype.FLOAT32) != _datatype():
+        logger.warning("Collection datatype differs from QDRANT_VECTOR_DATATYPE - takes a new collection",
+                       collection=name, datatype=str(dense.datatype or models.Datatype.FLOAT32),
+                       configured=QDRANT_VECTOR_DATATYPE)
+
+    # Qdrant can't add a sparse vector to an existing collection
+    has_sparse = SPARSE_VECTOR_NAME in (params.sparse_vectors or {})
+    if not has_sparse:
+        logger.warning("Collection has no BM25 sparse vector - upserts and searches are dense-only; "
+                       "re-create the collection and re-ingest to enable hybrid search",
+                       collection=name, sparse_vector=SPARSE_VECTOR_NAME)
+
+    if (hnsw.m, hnsw.ef_construct, bool(hnsw.on_disk)) != (QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT, QDRANT_HNSW_ON_DISK):
+        changes["hnsw_config"] = models.HnswConfigDiff(
+            m=QDRANT_HNSW_M,
+            ef_construct=QDRANT_HNSW_EF_CONSTRUCT,
+            on_disk=QDRANT_HNSW_ON_DISK
+        )
+
+    if dense is not None and bool(dense.on_disk) != QDRANT_VECTORS_ON_DISK:
+        changes["vectors_config"] = {"": models.VectorParamsDiff(on_disk=QDRANT_VECTORS_ON_DISK)}
+
+    if bool(params.on_disk_payload) != QDRANT_PAYLOAD_ON_DISK:
+        changes["collection_params"] = models.CollectionParamsDiff(on_disk_payload=QDRANT_PAYLOAD_ON_DISK)
+
+    if _quantization_mode(info.config.quantization_config) != QDRANT_QUANTIZATION:
+        changes["quantization_config"] = quantization_config() or models.Disabled.DISABLED
+
+    if changes:
+        await client.update_collection(collection_name=name, **changes)
+        logger.info("Collection migrated", collection=name, changed=sorted(changes))
+
+    await create_payload_indexes(client, name, info.payload_schema or {})
+    return has_sparse
+
+
+async def ensure_collection(client: AsyncQdrantClient, name: str, dimension: int) -> bool:
+    """
+    Create a collection, or migrate an existing one, to the configured layout.
+    True if the collection has the BM25 sparse vector.
+    """
+    collections = await client.get_collections()
+    if name not in [collection.name for collection in collections.collections]:
+        logger.info("Creating new collection", collection=name)
+        await create_collection(client, name, dimension)
+        logger.info("Collection created successfully", collection=name, dimension=dimension,
+                    hnsw_m=QDRANT_HNSW_M, ef_construct=QDRANT_HNSW_EF_CONSTRUCT, vectors_on_disk=QDRANT_VECTORS_ON_DISK,
+                    datatype=QDRANT_VECTOR_DATATYPE, quantization=QDRANT_QUANTIZATION)
+        return True
+    logger.info("Collection already exists", collection=name)
+    return await migrate_collection(client, name, dimension)
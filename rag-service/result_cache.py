@@ -0,0 +1,192 @@
+"""
+Search and RAG result cache for rag-service
+
+Identical search and RAG requests (FAQ-style questions, dashboards, retries)
+are answered from a cache instead of embedding the query and querying Qdrant
+again. Entries are keyed by endpoint, normalized query, every request
+parameter, the embedding model and the generation of the project searched.
+
+Invalidation is precise rather than time based: every change to a project's
+chunks (stored by an ingestion job, deleted) bumps the project's generation
+counter, and with it the global generation used by searches across all
+projects, so older entries are never looked up again and age out.
+RESULT_CACHE_TTL bounds staleness from changes made outside this service.
+
+Entries and generations live in memory; with RESULT_CACHE_REDIS_URL they live
+in Redis as well, so several instances share results and invalidations.
+"""
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Tuple
+
+from prometheus_client import Counter
+
+from embedding_cache import normalize_text
+from logging_config import get_rag_logger
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+aioredis: Optional[ModuleType]
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional dependency
+    aioredis = None
+
+logger = get_rag_logger()
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2000"))
+RESULT_CACHE_REDIS_URL = os.getenv("RESULT_CACHE_REDIS_URL", "")
+
+_REDIS_PREFIX = "rag-service:results:"
+_GENERATION_PREFIX = "rag-service:generation:"
+_ALL_PROJECTS = "*"
+
+result_cache_lookups = Counter(
+    "rag_result_cache_lookups_total",
+    "Search/RAG result cache lookups by endpoint and result (hit, miss)",
+    ["kind", "result"],
+)
+
+
+class ResultCache:
+    def __init__(self, ttl: int = RESULT_CACHE_TTL, max_entries: int = RESULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._redis: Optional["Redis"] = None
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self) -> None:
+        if not RESULT_CACHE_ENABLED or not RESULT_CACHE_REDIS_URL:
+            return
+        if aioredis is None:
+            logger.warning("RESULT_CACHE_REDIS_URL set but redis package missing - using memory only")
+            return
+        self._redis = aioredis.from_url(RESULT_CACHE_REDIS_URL)
+        logger.info("Result cache using Redis", url=RESULT_CACHE_REDIS_URL)
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.close()
+
+    # ---------------------------------------------------
+    # Generations
+    # ---------------------------------------------------
+
+    @staticmethod
+    def _scope(project_id: Optional[int]) -> str:
+        return str(project_id) if project_id else _ALL_PROJECTS
+
+    async def _generation(self, scope: str) -> int:
+        if self._redis is not None:
+            value = await self._redis.get(_GENERATION_PREFIX + scope)
+            return int(value) if value is not None else 0
+        return self._generations.get(scope, 0)
+
+    async def invalidate(self, project_ids: Iterable[Optional[int]]) -> None:
+        """Bump the generation of projects whose chunks changed (and of all-project searches)"""
+        if not RESULT_CACHE_ENABLED:
+            return
+        scopes = {self._scope(project_id) for project_id in project_ids} | {_ALL_PROJECTS}
+        for scope in scopes:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+        if self._redis is not None:
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    for scope in scopes:
+                        pipe.incr(_GENERATION_PREFIX + scope)
+                    await pipe.execute()
+            except Exception as e:
+                # Local entries may now be keyed by a stale generation - drop them all
+                logger.warning("Result cache invalidation failed", error=str(e))
+                self._entries.clear()
+
+    # ---------------------------------------------------
+    # Entries
+    # ---------------------------------------------------
+
+    async def key(self, kind: str, project_id: Optional[int], query: str, params: Dict[str, Any]) -> Optional[str]:
+        """Cache key of a request, None if the cache can't be used"""
+        if not RESULT_CACHE_ENABLED:
+            return None
+        scope = self._scope(project_id)
+        try:
+            generation = await self._generation(scope)
+        except Exception as e:
+            logger.warning("Result cache generation unavailable", error=str(e))
+            return None
+        material = json.dumps([kind, scope, generation, normalize_text(query), params], sort_keys=True, default=str)
+        return hashlib.blake2b(material.encode("utf-8"), digest_size=20).hexdigest()
+
+    async def get(self, kind: str, key: Optional[str]) -> Optional[str]:
+        """Cached response JSON"""
+        if key is None:
+            return None
+        value = self._get_memory(key)
+        if value is None and self._redis is not None:
+            try:
+                stored = await self._redis.get(_REDIS_PREFIX + key)
+            except Exception as e:
+                logger.warning("Result cache read failed", error=str(e))
+                stored = None
+            if stored is not None:
+                value = stored.decode("utf-8") if isinstance(stored, bytes) else stored
+                self._put_memory(key, value)
+        if value is None:
+            self.misses += 1
+            result_cache_lookups.labels(kind=kind, result="miss").inc()
+        else:
+            self.hits += 1
+            result_cache_lookups.labels(kind=kind, result="hit").inc()
+        return value
+
+    async def put(self, key: Optional[str], value: str) -> None:
+        if key is None:
+            return
+        self._put_memory(key, value)
+        if self._redis is not None:
+            try:
+                await self._redis.set(_REDIS_PREFIX + key, value, ex=self.ttl)
+            except Exception as e:
+                logger.warning("Result cache write failed", error=str(e))
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put_memory(self, key: str, value: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": RESULT_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "ttl": self.ttl,
+            "redis": self._redis is not None,
+        }
+
+
+result_cache = ResultCache()
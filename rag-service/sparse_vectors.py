@@ -0,0 +1,172 @@
+"""
+Sparse lexical (BM25) vectors for hybrid retrieval
+
+Dense embeddings miss exact identifiers and rare terms, so every chunk also
+gets a sparse vector stored next to its dense vector in Qdrant:
+
+- document side: BM25 term frequency weight per term,
+                 tf * (k1 + 1) / (tf + k1 * (1 - b + b * terms / BM25_AVG_TERMS))
+- query side:    IDF per query term, from document frequencies counted as
+                 chunks are stored and deleted (SQLite file BM25_STATS_PATH)
+
+The dot product Qdrant computes between the two is the BM25 score. Terms are
+hashed to 31-bit indices, so there is no vocabulary to maintain. Dense and
+sparse rankings are combined with reciprocal rank fusion (``rrf_fuse``).
+Document frequencies are approximate: chunks re-stored by a resumed job are
+counted again, which barely moves a logarithmic IDF.
+"""
+import asyncio
+import math
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from logging_config import get_rag_logger
+
+logger = get_rag_logger()
+
+SPARSE_VECTOR_NAME = "bm25"
+BM25_STATS_PATH = os.getenv("BM25_STATS_PATH", "/app/data/bm25_stats.sqlite3")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+BM25_AVG_TERMS = float(os.getenv("BM25_AVG_TERMS", "150"))  # terms in a full chunk, stopwords removed
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Words joined by . - _ / stay one term, so identifiers like "ERR_4711" or "v2.1.0" match exactly
+_TERM = re.compile(r"\w+(?:[./_-]\w+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i if in into is it its of on or that the their then there these
+they this to was we were what when where which who why will with you your
+aber als am an auch auf aus bei bin bis das dass dem den der des die ein eine einem einen einer eines er es
+für hat ich ihr im in ist ja kann mit nach nicht noch nur oder sich sie sind so um und uns von vor war was wie
+wir wird zu zum zur
+""".split())
+
+TermWeights = Dict[int, float]
+
+
+def term_index(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+def term_counts(text: str) -> Counter:
+    """Counts of the hashed terms of a text, stopwords removed"""
+    return Counter(term_index(term) for term in _TERM.findall(text.lower()) if term not in STOPWORDS)
+
+
+def document_weights(text: str) -> TermWeights:
+    """BM25 term frequency weights of a chunk"""
+    counts = term_counts(text)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(counts.values()) / BM25_AVG_TERMS)
+    return {index: tf * (BM25_K1 + 1) / (tf + norm) for index, tf in counts.items()}
+
+
+def rrf_fuse(rankings: Iterable[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Reciprocal rank fusion: ids by descending sum of 1 / (k + rank) over all rankings"""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class TermStats:
+    """Document frequencies of hashed terms for query-side IDF"""
+
+    def __init__(self, path: str = BM25_STATS_PATH):
+        self.path = path
+        self.documents = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------
+    # Blocking SQLite access (worker threads)
+    # ---------------------------------------------------
+
+    def _open(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS terms (idx INTEGER PRIMARY KEY, df INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.commit()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'documents'").fetchone()
+        self.documents = row[0] if row else 0
+        self._conn = conn
+
+    def _update(self, documents: List[Iterable[int]], sign: int) -> None:
+        frequencies = Counter(index for indices in documents for index in set(indices))
+        with self._lock:
+            conn = self._conn
+            if conn is None:
+                return  # statistics unavailable
+            if sign > 0:
+                conn.executemany(
+                    "INSERT INTO terms (idx, df) VALUES (?, ?) ON CONFLICT(idx) DO UPDATE SET df = df + excluded.df",
+                    list(frequencies.items()),
+                )
+            else:
+                conn.executemany(
+                    "UPDATE terms SET df = MAX(df - ?, 0) WHERE idx = ?",
+                    [(count, index) for index, count in frequencies.items()],
+                )
+            self.documents = max(self.documents + sign * len(documents), 0)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('documents', ?)", (self.documents,))
+            conn.commit()
+
+    def _frequencies(self, indices: List[int]) -> Dict[int, int]:
+        with self._lock:
+            if self._conn is None:
+                return {}
+            placeholders = ",".join("?" * len(indices))
+            return dict(self._conn.execute(f"SELECT idx, df FROM terms WHERE idx IN ({placeholders})", indices).fetchall())
+
+    # ---------------------------------------------------
+    # Public API
+    # ---------------------------------------------------
+
+    async def start(self) -> None:
+        try:
+            await asyncio.to_thread(self._open)
+            logger.info("BM25 term statistics loaded", path=self.path, documents=self.documents)
+        except (OSError, sqlite3.Error) as e:
+            # Queries still work, with every term weighted equally
+            logger.warning("BM25 term statistics unavailable", path=self.path, error=str(e))
+            self._conn = None
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await asyncio.to_thread(self._conn.close)
+
+    async def add(self, documents: List[TermWeights]) -> None:
+        if self._conn is not None and documents:
+            await asyncio.to_thread(self._update, [list(weights) for weights in documents], 1)
+
+    async def remove(self, documents: List[Iterable[int]]) -> None:
+        if self._conn is not None and documents:
+            await asyncio.to_thread(self._update, [list(indices) for indices in documents], -1)
+
+    async def query_weights(self, text: str) -> TermWeights:
+        """IDF weight of every query term (empty if the query has no terms)"""
+        indices = list(term_counts(text))
+        if not indices or self._conn is None or not self.documents:
+            return {index: 1.0 for index in indices}
+        frequencies = await asyncio.to_thread(self._frequencies, indices)
+        n = self.documents
+        return {
+            index: math.log(1 + (n - frequencies.get(index, 0) + 0.5) / (frequencies.get(index, 0) + 0.5))
+            for index in indices
+        }
+
+    def stats(self) -> dict:
+        return {"documents": self.documents, "path": self.path if self._conn is not None else None}
+
+
+term_stats = TermStats()
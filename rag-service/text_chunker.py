@@ -0,0 +1,162 @@
+"""
+Token-aware streaming chunker for rag-service
+
+Chunks are measured in tokens of the embedding model's tokenizer (cached
+tiktoken encoder) instead of characters, so every chunk uses close to
+CHUNK_TOKENS tokens and never exceeds it. The text is consumed as a stream
+of segments; each block of text is encoded once and chunk boundaries are
+taken from token byte offsets, so the document is neither re-encoded nor
+copied per chunk.
+"""
+import os
+from functools import lru_cache
+from typing import Iterable, Iterator, List
+
+import numpy as np
+import tiktoken
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))
+
+# Characters encoded at once; chunks closer than STABLE_MARGIN_TOKENS to the end
+# of a block wait for more text, since the last tokens may change with it
+ENCODE_BLOCK_CHARS = 64 * 1024
+STABLE_MARGIN_TOKENS = 32
+
+# Split points in order of preference, looked for within the last 20% of a chunk
+SEPARATORS = (b"\n\n", b"\n", b". ", b" ")
+
+
+@lru_cache(maxsize=16)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Tokenizer of a model or encoding name; cl100k_base for names tiktoken doesn't know"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    try:
+        return tiktoken.get_encoding(model)
+    except ValueError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def encoding_name(model: str) -> str:
+    return get_encoding(model).name
+
+
+@lru_cache(maxsize=16)
+def _token_byte_lengths(encoding: tiktoken.Encoding) -> np.ndarray:
+    """Byte length of every token id of an encoding"""
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass  # unused ids in the vocabulary range
+    return lengths
+
+
+def count_tokens(text: str, model: str) -> int:
+    return len(get_encoding(model).encode_ordinary(text))
+
+
+def _is_continuation(data: bytes, offset: int) -> bool:
+    """True if ``offset`` points into the middle of a UTF-8 character"""
+    return offset < len(data) and 0x80 <= data[offset] < 0xC0
+
+
+def _split_point(data: bytes, start: int, hard_end: int) -> int:
+    """Best separator position in the last 20% of data[start:hard_end], else hard_end"""
+    search_start = hard_end - int((hard_end - start) * 0.2)
+    for separator in SEPARATORS:
+        position = data.rfind(separator, search_start, hard_end)
+        if position != -1:
+            return position + len(separator)
+    return hard_end
+
+
+def _chunk_end(data: bytes, starts: np.ndarray, position: int, chunk_tokens: int) -> int:
+    """Byte offset where the chunk starting at token ``position`` ends"""
+    # Byte-level tokens can split a multi-byte character - end before it
+    end_token = position + chunk_tokens
+    while end_token > position + 1 and _is_continuation(data, starts[end_token]):
+        end_token -= 1
+    return _split_point(data, int(starts[position]), int(starts[end_token]))
+
+
+def _next_position(data: bytes, starts: np.ndarray, position: int, chunk_end: int, overlap_tokens: int) -> int:
+    """
+    Token index of the next chunk: ``overlap_tokens`` before the token
+    containing ``chunk_end`` (separator splits can fall inside a token,
+    e.g. " word"), moved to a character start
+    """
+    end_index = int(np.searchsorted(starts, chunk_end, side="right")) - 1
+    next_position = max(position + 1, end_index - overlap_tokens)
+    candidate = next_position
+    while candidate > position and _is_continuation(data, starts[candidate]):
+        candidate -= 1
+    if candidate == position:
+        candidate = next_position
+        while candidate < len(starts) and _is_continuation(data, starts[candidate]):
+            candidate += 1
+    return candidate
+
+
+def iter_token_chunks(
+    segments: Iterable[str],
+    model: str,
+    chunk_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[str]:
+    """
+    Split streamed text into chunks of at most ``chunk_tokens`` tokens,
+    consecutive chunks overlapping by about ``overlap_tokens`` tokens.
+    """
+    encoding = get_encoding(model)
+    byte_lengths = _token_byte_lengths(encoding)
+    segments = iter(segments)
+    buffer = ""
+    exhausted = False
+    grow = False  # the last block ended without a complete chunk - read at least one more segment
+
+    while True:
+        while not exhausted and (grow or len(buffer) < ENCODE_BLOCK_CHARS):
+            segment = next(segments, None)
+            if segment is None:
+                exhausted = True
+            else:
+                buffer += segment
+                grow = False
+
+        data = buffer.encode("utf-8")
+        tokens = np.asarray(encoding.encode_ordinary(buffer), dtype=np.int64)
+        lengths = byte_lengths[tokens]
+        starts = np.cumsum(lengths) - lengths  # byte offset of every token
+        position = 0  # token index where the next chunk starts
+        grow = True
+        while True:
+            remaining = len(tokens) - position
+            if remaining <= chunk_tokens:
+                if exhausted:
+                    chunk = data[starts[position]:].decode("utf-8").strip() if remaining else ""
+                    if chunk:
+                        yield chunk
+                    return
+                break
+            if not exhausted and remaining < chunk_tokens + STABLE_MARGIN_TOKENS:
+                break
+
+            chunk_end = _chunk_end(data, starts, position, chunk_tokens)
+            chunk = data[int(starts[position]):chunk_end].decode("utf-8").strip()
+            if chunk:
+                yield chunk
+            position = _next_position(data, starts, position, chunk_end, overlap_tokens)
+
+        # Keep the unfinished tail - one copy per block, not per chunk
+        buffer = data[starts[position]:].decode("utf-8") if position < len(tokens) else ""
+
+
+def split_text(text: str, model: str, chunk_tokens: int = CHUNK_TOKENS,
+               overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Split text into token-bounded chunks with overlap"""
+    return list(iter_token_chunks([text], model, chunk_tokens, overlap_tokens))
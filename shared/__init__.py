@@ -0,0 +1,7 @@
+"""
+Code shared by the Python services (llm-proxy, rag-service)
+
+Images get it as the ``shared`` build context, copied to /app/shared next to
+the service code, so it is imported as ``shared.<module>``. For local runs
+outside Docker put the repository root on PYTHONPATH.
+"""
@@ -0,0 +1,162 @@
+"""
+Phase timing for outgoing HTTP calls (httpx event hooks + httpcore trace)
+
+Every call made through an instrumented client is split into phases:
+
+- queue:    waiting for a pooled connection
+- connect:  DNS resolution and TCP connect (httpcore reports them together)
+- tls:      TLS handshake
+- send:     writing request headers and body
+- ttfb:     waiting for the response headers (upstream processing)
+- body:     receiving the response body (generation time for streams)
+
+Shared by llm-proxy and rag-service (see shared/__init__.py). Timings go to a
+structlog line per call and to the upstream phase histogram.
+ServerTimingMiddleware collects the calls of an inbound request and, when
+SERVER_TIMING_ENABLED is set, returns them as a ``Server-Timing`` header next
+to an ``app`` entry for the time spent in the service itself.
+"""
+import contextvars
+import os
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import structlog
+from prometheus_client import Histogram
+
+logger = structlog.get_logger("http_timing")
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+PHASES = ("queue", "connect", "tls", "send", "ttfb", "body")
+
+upstream_phase_seconds = Histogram(
+    "upstream_http_phase_seconds",
+    "Duration of outgoing HTTP call phases",
+    ["host", "phase"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+# Timings of all upstream calls made while serving the current inbound request
+_request_timings: contextvars.ContextVar[Optional[List[Dict[str, float]]]] = contextvars.ContextVar(
+    "upstream_timings", default=None
+)
+
+
+class _CallTimer:
+    def __init__(self, request: httpx.Request):
+        self.method = request.method
+        self.host = request.url.host
+        self.path = request.url.path
+        self.started = time.perf_counter()
+        self.events: Dict[str, float] = {}
+        self.status_code: Optional[int] = None
+        self.collector = _request_timings.get()
+
+    async def trace(self, event_name: str, info: dict) -> None:
+        # "http11.send_request_headers.started" -> "send_request_headers.started"
+        _, _, name = event_name.partition(".")
+        self.events.setdefault(name, time.perf_counter())
+        if name in ("response_closed.complete", "response_closed.failed"):
+            self.finish()
+
+    def _span(self, start: str, end: str) -> Optional[float]:
+        if start in self.events and end in self.events:
+            return max(0.0, self.events[end] - self.events[start])
+        return None
+
+    def phases(self) -> Dict[str, float]:
+        first_activity = self.events.get("connect_tcp.started", self.events.get("send_request_headers.started"))
+        phases = {
+            "queue": first_activity - self.started if first_activity else None,
+            "connect": self._span("connect_tcp.started", "connect_tcp.complete"),
+            "tls": self._span("start_tls.started", "start_tls.complete"),
+            "send": self._span("send_request_headers.started", "send_request_body.complete"),
+            "ttfb": self._span("send_request_body.complete", "receive_response_headers.complete"),
+            "body": self._span("receive_response_headers.complete", "response_closed.started"),
+        }
+        return {phase: value for phase, value in phases.items() if value is not None}
+
+    def finish(self) -> None:
+        phases = self.phases()
+        total = time.perf_counter() - self.started
+        for phase, value in phases.items():
+            upstream_phase_seconds.labels(host=self.host, phase=phase).observe(value)
+        if self.collector is not None:
+            self.collector.append({**phases, "total": total})
+        logger.info("Upstream call timing",
+                    method=self.method,
+                    host=self.host,
+                    path=self.path,
+                    status_code=self.status_code,
+                    total_ms=round(total * 1000, 2),
+                    **{f"{phase}_ms": round(value * 1000, 2) for phase, value in phases.items()})
+
+
+async def _on_request(request: httpx.Request) -> None:
+    timer = _CallTimer(request)
+    request.extensions["trace"] = timer.trace
+    request.extensions["phase_timer"] = timer
+
+
+async def _on_response(response: httpx.Response) -> None:
+    timer = response.request.extensions.get("phase_timer")
+    if timer is not None:
+        timer.status_code = response.status_code
+
+
+def timing_event_hooks(**extra: list) -> Dict[str, list]:
+    """Event hooks for httpx.AsyncClient, merged with additional hooks"""
+    return {
+        "request": [_on_request, *extra.get("request", [])],
+        "response": [_on_response, *extra.get("response", [])],
+    }
+
+
+def server_timing_header(timings: List[Dict[str, float]], elapsed: float) -> str:
+    totals = {phase: 0.0 for phase in PHASES}
+    upstream_total = 0.0
+    for timing in timings:
+        for phase in PHASES:
+            totals[phase] += timing.get(phase, 0.0)
+        upstream_total += timing.get("total", 0.0)
+
+    entries = [
+        f'upstream-{phase};dur={value * 1000:.1f}'
+        for phase, value in totals.items()
+        if value > 0
+    ]
+    entries.append(f'upstream;dur={upstream_total * 1000:.1f};desc="{len(timings)} calls"')
+    entries.append(f"app;dur={max(0.0, elapsed - upstream_total) * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """Pure ASGI middleware collecting upstream timings per inbound request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Dict[str, float]] = []
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING_ENABLED:
+                header = server_timing_header(timings, time.perf_counter() - started)
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"server-timing", header.encode("latin-1"))],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)